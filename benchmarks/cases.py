@@ -0,0 +1,134 @@
+"""The benchmarked operations
+
+Every case is a function taking the fixtures and returning the callable that is timed, so setup work
+is excluded from the measurement.
+"""
+
+import os
+from collections import OrderedDict
+
+from cert_chain_resolver.cache import MemoryCache
+from cert_chain_resolver.castore.file_system import FileSystemStore
+from cert_chain_resolver.castore.shared import SharedBundleStore
+from cert_chain_resolver.models import Cert, CertificateChain, verification_cache
+from cert_chain_resolver.pool import ConnectionPool
+from cert_chain_resolver.resolver import resolve
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def cert_load_pem(fixtures):
+    data = _read(fixtures["leaf_pem"])
+    return lambda: Cert.load(data)
+
+
+def cert_load_der(fixtures):
+    data = _read(fixtures["leaf_der"])
+    return lambda: Cert.load(data)
+
+
+def chain_load_from_pem(fixtures):
+    data = _read(fixtures["chain"])
+    return lambda: CertificateChain.load_from_pem(data)
+
+
+def chain_export(fixtures):
+    chain = CertificateChain.load_from_pem(_read(fixtures["chain"]))
+    return lambda: "".join(c.export() for c in chain)
+
+
+def store_cold(size, lazy=False):
+    def case(fixtures):
+        path = fixtures["bundles"][size]
+        intermediate = Cert.load(_read(fixtures["intermediate"]))
+
+        def run():
+            verification_cache.clear()
+            FileSystemStore(path, lazy=lazy).find_issuer(intermediate)
+
+        return run
+
+    return case
+
+
+def store_index_load(size):
+    def case(fixtures):
+        path = fixtures["bundles"][size]
+        index_dir = os.path.join(os.path.dirname(path), "index")
+        intermediate = Cert.load(_read(fixtures["intermediate"]))
+        # Write the index once, every run loads it
+        FileSystemStore(path, index_dir=index_dir).find_issuer(intermediate)
+
+        def run():
+            verification_cache.clear()
+            FileSystemStore(path, index_dir=index_dir).find_issuer(intermediate)
+
+        return run
+
+    return case
+
+
+def store_shared_attach(size):
+    def case(fixtures):
+        path = fixtures["bundles"][size]
+        blob_path = os.path.join(os.path.dirname(path), "blob-{0}".format(size))
+        intermediate = Cert.load(_read(fixtures["intermediate"]))
+        # Build the blob once, every run attaches to it like a new worker process
+        SharedBundleStore(blob_path, path).find_issuer(intermediate)
+
+        def run():
+            verification_cache.clear()
+            store = SharedBundleStore(blob_path)
+            store.find_issuer(intermediate)
+            store.close()
+
+        return run
+
+    return case
+
+
+def store_lookup(size):
+    def case(fixtures):
+        store = FileSystemStore(fixtures["bundles"][size])
+        intermediate = Cert.load(_read(fixtures["intermediate"]))
+        store.find_issuer(intermediate)
+        return lambda: store.find_issuer(intermediate)
+
+    return case
+
+
+def resolve_cold(fixtures):
+    data = _read(fixtures["leaf_pem"])
+    return lambda: resolve(data, cache=MemoryCache(), pool=ConnectionPool())
+
+
+def resolve_cached(fixtures):
+    data = _read(fixtures["leaf_pem"])
+    cache = MemoryCache()
+    pool = ConnectionPool()
+    resolve(data, cache=cache, pool=pool)
+    return lambda: resolve(data, cache=cache, pool=pool)
+
+
+def build_cases(sizes):
+    """Ordered mapping of case name to case, the store cases are repeated for every bundle size"""
+    cases = OrderedDict(
+        [
+            ("cert_load_pem", cert_load_pem),
+            ("cert_load_der", cert_load_der),
+            ("chain_load_from_pem", chain_load_from_pem),
+            ("chain_export", chain_export),
+        ]
+    )
+    for size in sorted(sizes):
+        cases["store_cold[{0}]".format(size)] = store_cold(str(size))
+        cases["store_cold_lazy[{0}]".format(size)] = store_cold(str(size), lazy=True)
+        cases["store_index_load[{0}]".format(size)] = store_index_load(str(size))
+        cases["store_shared_attach[{0}]".format(size)] = store_shared_attach(str(size))
+        cases["store_lookup[{0}]".format(size)] = store_lookup(str(size))
+    cases["resolve_cold"] = resolve_cold
+    cases["resolve_cached"] = resolve_cached
+    return cases
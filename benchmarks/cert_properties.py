@@ -0,0 +1,85 @@
+"""Per-certificate cost of the derived Cert properties
+
+Usage:
+
+    $ python benchmarks/cert_properties.py [--iterations 2000]
+
+Wraps the fixture certificates in new Cert objects and reads the properties used while building and
+inspecting chains a few times each, the way CertificateChain and the CA stores do. Also reports the
+memory held per Cert object once its properties have been read.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cert_chain_resolver.models import Cert  # noqa: E402
+from cert_chain_resolver.utils import load_bytes_to_x509  # noqa: E402
+
+PROPERTIES = ("subject", "issuer", "fingerprint", "is_ca", "ca_issuer_access_location")
+READS_PER_PROPERTY = 3
+
+
+def load_fixtures():
+    root = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "tests", "certs"
+    )
+    paths = sorted(
+        glob.glob(os.path.join(root, "*.pem"))
+        + glob.glob(os.path.join(root, "ca", "*.pem"))
+    )
+    x509s = []
+    for path in paths:
+        with open(path, "rb") as f:
+            x509s.append(load_bytes_to_x509(f.read()))
+    return x509s
+
+
+def read_properties(x509s):
+    for x509 in x509s:
+        cert = Cert(x509)
+        for _ in range(READS_PER_PROPERTY):
+            for prop in PROPERTIES:
+                getattr(cert, prop)
+
+
+def bytes_per_cert(x509s, count=10000):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    certs = []
+    for i in range(count):
+        cert = Cert(x509s[i % len(x509s)])
+        for prop in PROPERTIES:
+            getattr(cert, prop)
+        certs.append(cert)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    # Exclude the list holding the objects
+    return (allocated - sys.getsizeof(certs)) / float(count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    x509s = load_fixtures()
+    seconds = min(
+        timeit.repeat(lambda: read_properties(x509s), number=args.iterations, repeat=3)
+    )
+    per_cert = seconds / (args.iterations * len(x509s))
+
+    print("certificates:      {0}".format(len(x509s)))
+    print("properties read:   {0} x {1}".format(len(PROPERTIES), READS_PER_PROPERTY))
+    print("time per cert:     {0:.2f} us".format(per_cert * 1e6))
+    print("memory per cert:   {0:.0f} bytes".format(bytes_per_cert(x509s)))
+
+
+if __name__ == "__main__":
+    main()
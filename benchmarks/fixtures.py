@@ -0,0 +1,154 @@
+"""Synthetic CA hierarchies and a local CA issuer (AIA) server for the benchmarks"""
+
+import datetime
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509.oid import AuthorityInformationAccessOID, NameOID
+
+NOW = datetime.datetime(2024, 1, 1)
+
+
+def make_cert(common_name, issuer=None, is_ca=True, aia=None):
+    """A certificate signed by issuer (a ``(cert, key)`` tuple), self-signed when issuer is None"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    issuer_cert, issuer_key = issuer if issuer else (None, key)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(issuer_cert.subject if issuer_cert is not None else name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(NOW)
+        .not_valid_after(NOW + datetime.timedelta(days=3650))
+        .add_extension(x509.BasicConstraints(ca=is_ca, path_length=None), True)
+        .add_extension(
+            x509.SubjectKeyIdentifier.from_public_key(key.public_key()), False
+        )
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(issuer_key.public_key()),
+            False,
+        )
+    )
+    if aia:
+        builder = builder.add_extension(
+            x509.AuthorityInformationAccess(
+                [
+                    x509.AccessDescription(
+                        AuthorityInformationAccessOID.CA_ISSUERS,
+                        x509.UniformResourceIdentifier(aia),
+                    )
+                ]
+            ),
+            False,
+        )
+    return builder.sign(issuer_key, hashes.SHA256()), key
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive like a real CA, and send the body right after the headers instead of waiting for the
+    # delayed ACK of the client, which would otherwise dominate every download
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = self.server.files.get(self.path)
+        self.send_response(200 if body is not None else 404)
+        self.send_header("Content-Type", "application/pkix-cert")
+        self.send_header("Content-Length", str(len(body or b"")))
+        self.end_headers()
+        self.wfile.write(body or b"")
+
+    def log_message(self, *args):
+        pass
+
+
+class AIAServer(ThreadingMixIn, HTTPServer):
+    """Serves DER certificates from memory, stands in for the CA issuer locations of real CAs"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), _Handler)
+        self.files = {}
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self._thread.daemon = True
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{0}".format(self.server_port)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def generate(directory, sizes, server):
+    """Write the fixtures to directory and publish the CA issuers on server
+
+    * ``chain.pem``: leaf, two intermediates and the root, the leaf and intermediates point to server
+    * ``leaf.pem`` / ``leaf.der``: the leaf of that chain
+    * ``bundle-<size>.pem``: root bundles with size roots, the root of the chain is the last one
+
+    Returns:
+        dict describing the fixtures, also written to ``fixtures.json``
+    """
+    root = make_cert("Benchmark Root")
+    intermediate2 = make_cert("Benchmark Intermediate 2", issuer=root)
+    intermediate1 = make_cert(
+        "Benchmark Intermediate 1",
+        issuer=intermediate2,
+        aia=server.base_url + "/intermediate2.der",
+    )
+    leaf = make_cert(
+        "benchmark.example",
+        issuer=intermediate1,
+        is_ca=False,
+        aia=server.base_url + "/intermediate1.der",
+    )
+    server.files["/intermediate1.der"] = intermediate1[0].public_bytes(Encoding.DER)
+    server.files["/intermediate2.der"] = intermediate2[0].public_bytes(Encoding.DER)
+
+    def write(name, content):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    chain = [leaf, intermediate1, intermediate2, root]
+    fixtures = {
+        "chain": write(
+            "chain.pem", b"".join(c.public_bytes(Encoding.PEM) for c, _ in chain)
+        ),
+        "leaf_pem": write("leaf.pem", leaf[0].public_bytes(Encoding.PEM)),
+        "leaf_der": write("leaf.der", leaf[0].public_bytes(Encoding.DER)),
+        "intermediate": write(
+            "intermediate.pem", intermediate2[0].public_bytes(Encoding.PEM)
+        ),
+        "bundles": {},
+    }
+
+    roots = [root[0].public_bytes(Encoding.PEM)]
+    for size in sorted(sizes):
+        while len(roots) < size:
+            cert, _ = make_cert("Benchmark Other Root {0}".format(len(roots)))
+            roots.insert(0, cert.public_bytes(Encoding.PEM))
+        fixtures["bundles"][str(size)] = write(
+            "bundle-{0}.pem".format(size), b"".join(roots[-size:])
+        )
+
+    with open(os.path.join(directory, "fixtures.json"), "w") as f:
+        json.dump(fixtures, f, indent=2)
+    return fixtures
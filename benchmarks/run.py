@@ -0,0 +1,231 @@
+"""Benchmark suite for parsing, resolving, CA store lookups and exporting
+
+Usage:
+
+    $ python -m benchmarks [--sizes 150,1000,3000] [--filter store] [--json results.json]
+    $ python -m benchmarks --compare baseline.json --max-regression 0.1
+
+Fixtures are generated locally: a leaf with two intermediates served by a local CA issuer server, and
+root bundles of every size in --sizes. Every case runs in a fresh interpreter, so the peak RSS belongs
+to that case alone and caches of earlier cases do not leak into it. Results are written as JSON with
+--json and can be compared against an earlier run with --compare, which exits with 1 when a case lost
+more than --max-regression of its throughput.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cryptography  # noqa: E402
+
+from benchmarks.cases import build_cases  # noqa: E402
+from benchmarks.fixtures import AIAServer, generate  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(fn, min_time, min_runs=5):
+    """Call fn until min_time seconds and min_runs calls have passed, timing every call"""
+    fn()  # warm up
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_runs or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    timings.sort()
+    return {
+        "runs": len(timings),
+        "ops_per_sec": len(timings) / sum(timings),
+        "p50": percentile(timings, 0.50),
+        "p90": percentile(timings, 0.90),
+        "p99": percentile(timings, 0.99),
+    }
+
+
+def run_child(name, fixtures, min_time):
+    """Run a single case in this process, called in the child interpreter"""
+    with open(os.path.join(fixtures, "fixtures.json")) as f:
+        data = json.load(f)
+    sizes = [int(size) for size in data["bundles"]]
+    fn = build_cases(sizes)[name](data)
+    result = measure(fn, min_time)
+    result["peak_rss"] = peak_rss_bytes()
+    json.dump(result, sys.stdout)
+
+
+def run_case(name, fixtures, min_time):
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks",
+            "--child",
+            name,
+            "--fixtures",
+            fixtures,
+            "--min-time",
+            str(min_time),
+        ],
+        cwd=ROOT,
+    )
+    return json.loads(output.decode("utf-8"))
+
+
+def git_revision():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=ROOT,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode("ascii")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return "{0:.1f} us".format(seconds * 1e6)
+    return "{0:.2f} ms".format(seconds * 1e3)
+
+
+def print_results(results, baseline=None):
+    header = "{0:<26} {1:>12} {2:>10} {3:>10} {4:>10} {5:>9}".format(
+        "case", "ops/sec", "p50", "p90", "p99", "peak RSS"
+    )
+    if baseline:
+        header += " {0:>8}".format("change")
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        line = "{0:<26} {1:>12.1f} {2:>10} {3:>10} {4:>10} {5:>6.1f} MB".format(
+            name,
+            result["ops_per_sec"],
+            format_seconds(result["p50"]),
+            format_seconds(result["p90"]),
+            format_seconds(result["p99"]),
+            result["peak_rss"] / 1024.0 / 1024.0,
+        )
+        if baseline and name in baseline:
+            line += " {0:>+7.1f}%".format(change(baseline[name], result) * 100)
+        print(line)
+
+
+def change(before, after):
+    """Relative change in throughput, negative is slower"""
+    return after["ops_per_sec"] / before["ops_per_sec"] - 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        epilog="\n".join(__doc__.splitlines()[1:]),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--sizes",
+        default="150,1000",
+        help="Comma separated root bundle sizes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--filter", default=None, help="Only run cases containing this string"
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=1.0,
+        help="Seconds every case runs at least (default: %(default)s)",
+    )
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    parser.add_argument(
+        "--compare", default=None, help="Compare against the results in this file"
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.1,
+        help="Allowed loss of throughput per case with --compare (default: %(default)s)",
+    )
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--fixtures", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child, args.fixtures, args.min_time)
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    directory = tempfile.mkdtemp(prefix="ccr-bench-")
+    results = {}
+    try:
+        with AIAServer() as server:
+            sys.stderr.write("Generating fixtures in {0}\n".format(directory))
+            generate(directory, sizes, server)
+            for name in build_cases(sizes):
+                if args.filter and args.filter not in name:
+                    continue
+                sys.stderr.write("Running {0}\n".format(name))
+                results[name] = run_case(name, directory, args.min_time)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "revision": git_revision(),
+                    "python": platform.python_version(),
+                    "cryptography": cryptography.__version__,
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+    if baseline:
+        regressions = [
+            name
+            for name, result in results.items()
+            if name in baseline
+            and change(baseline[name], result) < -args.max_regression
+        ]
+        if regressions:
+            sys.stderr.write(
+                "Throughput regressed more than {0:.0%}: {1}\n".format(
+                    args.max_regression, ", ".join(regressions)
+                )
+            )
+            return 1
+    return 0
@@ -0,0 +1,315 @@
+"""asyncio support, only importable on Python 3"""
+
+import asyncio
+import ssl
+import weakref
+from email.message import Message
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+from cert_chain_resolver import metrics
+from cert_chain_resolver.cache import CacheEntry
+from cert_chain_resolver.exceptions import ResolveLimitExceeded
+from cert_chain_resolver.models import CertificateChain, Cert
+from cert_chain_resolver.pool import Response, _REDIRECT_CODES
+from cert_chain_resolver.resolver import (
+    DEFAULT_MAX_DEPTH,
+    _find_local_issuer,
+    _issuer_path,
+)
+
+try:
+    from typing import Any, Callable, Dict, List, Optional
+    from cert_chain_resolver.castore.base_store import CAStore
+    from cert_chain_resolver.cache import DownloadCache
+except ImportError:  # pragma: no cover
+    pass
+
+
+class AsyncTransport:
+    """The :class:`AsyncTransport <AsyncTransport>` base class for fetching CA issuer certificates from an event loop"""
+
+    async def get(self, url, headers=None):
+        # type: (str, Optional[Dict[str, str]]) -> Response
+        """Perform a GET request, redirects are followed and any final status is returned"""
+        raise NotImplementedError
+
+
+class AsyncioTransport(AsyncTransport):
+    """Minimal HTTP/1.1 client built on :py:func:`asyncio.open_connection`, supports http and https
+
+    Args:
+        max_concurrency: Maximum number of requests in flight at the same time. Defaults to 100.
+        timeout: Seconds a single request (including redirects) may take. Defaults to 30.
+        max_redirects: Maximum number of redirects to follow. Defaults to 5.
+        ssl_context: Context used for https locations. Defaults to :py:func:`ssl.create_default_context`.
+    """
+
+    def __init__(
+        self, max_concurrency=100, timeout=30, max_redirects=5, ssl_context=None
+    ):
+        # type: (int, float, int, Optional[ssl.SSLContext]) -> None
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.ssl_context = ssl_context
+        self._semaphores = (
+            weakref.WeakKeyDictionary()
+        )  # type: weakref.WeakKeyDictionary[Any, asyncio.Semaphore]
+
+    @property
+    def semaphore(self):
+        # type: () -> asyncio.Semaphore
+        # One per event loop, asyncio primitives can't be shared between loops
+        loop = _running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def get(self, url, headers=None):
+        # type: (str, Optional[Dict[str, str]]) -> Response
+        async with self.semaphore:
+            return await asyncio.wait_for(
+                self._follow(url, headers or {}), self.timeout
+            )
+
+    async def _follow(self, url, headers):
+        # type: (str, Dict[str, str]) -> Response
+        for _ in range(self.max_redirects + 1):
+            response = await self._request(url, headers)
+            location = response.headers.get("location")
+            if response.status not in _REDIRECT_CODES or not location:
+                return response
+            url = urljoin(url, location)
+        raise HTTPError(url, response.status, "Too many redirects", Message(), None)
+
+    async def _request(self, url, headers):
+        # type: (str, Dict[str, str]) -> Response
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError("Unsupported URL: {0}".format(url))
+
+        https = parts.scheme == "https"
+        port = parts.port or (443 if https else 80)
+        ssl_context = None  # type: Optional[ssl.SSLContext]
+        if https:
+            ssl_context = self.ssl_context or ssl.create_default_context()
+
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, port, ssl=ssl_context
+        )
+        try:
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            request_headers = {
+                "Host": parts.netloc,
+                "User-Agent": "Cert/fixer",
+                "Accept": "*/*",
+                "Connection": "close",
+            }
+            request_headers.update(headers)
+            head = "GET {0} HTTP/1.1\r\n".format(path) + "".join(
+                "{0}: {1}\r\n".format(k, v) for k, v in request_headers.items()
+            )
+            writer.write(head.encode("latin-1") + b"\r\n")
+            await writer.drain()
+            return await self._read_response(reader)
+        finally:
+            writer.close()
+
+    async def _read_response(self, reader):
+        # type: (asyncio.StreamReader) -> Response
+        status_line = await reader.readline()
+        try:
+            status = int(status_line.split(None, 2)[1])
+        except (IndexError, ValueError):
+            raise ValueError("Invalid HTTP status line: {0!r}".format(status_line))
+
+        response_headers = {}  # type: Dict[str, str]
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked(reader)
+        elif "content-length" in response_headers:
+            body = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            body = await reader.read()
+        return Response(status, response_headers, body)
+
+    async def _read_chunked(self, reader):
+        # type: (asyncio.StreamReader) -> bytes
+        chunks = []  # type: List[bytes]
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Skip optional trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+
+#: Transport shared by the :py:func:`aresolve` calls that don't pass one, bounding their concurrent requests
+default_transport = AsyncioTransport()
+
+
+# Python 3.5 and 3.6 only have get_event_loop, which returns the running loop inside a coroutine
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+async def _in_executor(fn, *args):
+    # type: (Callable[..., Any], Any) -> Any
+    """Run fn on the default executor of the loop, for calls that read files or verify signatures"""
+    return await _running_loop().run_in_executor(None, fn, *args)
+
+
+def _load_issuers(cert, content):
+    # type: (Cert, bytes) -> List[Cert]
+    return _issuer_path(cert, Cert.load_all(content))
+
+
+async def _adownload(url, transport, cache=None):
+    # type: (str, AsyncTransport, Optional[DownloadCache]) -> Any
+    with metrics.span("download"):
+        # Caches can be backed by the file system
+        entry = await _in_executor(cache.get, url) if cache is not None else None
+        if entry is not None and cache is not None and cache.is_fresh(entry):
+            metrics.count("download.cache_hits")
+            return entry.content
+
+        if cache is not None:
+            metrics.count("download.cache_misses")
+        headers = entry.validators if entry is not None else {}
+        with metrics.span("fetch"):
+            response = await transport.get(url, headers=headers)
+        if response.status == 304 and entry is not None:
+            metrics.count("download.not_modified")
+            content = entry.content
+        elif 200 <= response.status < 300:
+            metrics.count("download.bytes", len(response.body))
+            content = response.body
+        else:
+            raise HTTPError(url, response.status, "Download failed", Message(), None)
+
+        if cache is not None:
+            await _in_executor(
+                cache.set,
+                url,
+                CacheEntry(
+                    content,
+                    etag=response.headers.get("etag")
+                    or (entry.etag if entry else None),
+                    last_modified=response.headers.get("last-modified")
+                    or (entry.last_modified if entry else None),
+                ),
+            )
+        return content
+
+
+async def aresolve(
+    bytes_cert,
+    root_ca_store=None,
+    cache=None,
+    transport=None,
+    max_depth=DEFAULT_MAX_DEPTH,
+    timeout=None,
+    deadline=None,
+    intermediate_store=None,
+):
+    # type: (bytes, Optional[CAStore], Optional[DownloadCache], Optional[AsyncTransport], Optional[int], Optional[float], Optional[float], Optional[CAStore]) -> CertificateChain
+    """Coroutine version of :py:func:`cert_chain_resolver.resolver.resolve`
+
+    Args:
+        bytes_cert: A DER/PKCS7/PEM certificate
+        root_ca_store: See :py:func:`cert_chain_resolver.resolver.resolve`
+        cache: See :py:func:`cert_chain_resolver.resolver.resolve`
+        transport: :class:`AsyncTransport <AsyncTransport>` used for downloading the CA issuers, the number of
+            concurrent requests is bounded per transport. Defaults to :py:data:`default_transport`.
+        max_depth: See :py:func:`cert_chain_resolver.resolver.resolve`
+        timeout: Seconds a single CA issuer download may take. Defaults to the timeout of the transport.
+        deadline: See :py:func:`cert_chain_resolver.resolver.resolve`
+        intermediate_store: See :py:func:`cert_chain_resolver.resolver.resolve`
+
+    Parsing certificates, the cache, intermediate_store and root_ca_store can read files and verify signatures,
+    they are called on the default executor of the loop so they never block it.
+
+    Raises:
+        :class:`ResolveLimitExceeded <cert_chain_resolver.exceptions.ResolveLimitExceeded>`: when max_depth,
+            timeout or deadline is exceeded, its ``chain`` holds the certificates resolved so far
+
+    Returns:
+        All resolved certificates in chain
+    """
+    if transport is None:
+        transport = default_transport
+
+    with metrics.span("resolve"):
+        loop = _running_loop()
+        expires = loop.time() + deadline if deadline is not None else None
+
+        chain = CertificateChain()
+        cert = await _in_executor(Cert.load, bytes_cert)
+        pending = []  # type: List[Cert]
+        while True:
+            if cert in chain:
+                # Prevent looping in case the cert is self-referential
+                return chain
+            chain += cert
+
+            parent = None  # type: Optional[Cert]
+            if pending:
+                parent = pending.pop(0)
+                metrics.count("download.bundled_hops")
+            elif intermediate_store is not None and not cert.is_root:
+                parent = await _in_executor(
+                    _find_local_issuer, intermediate_store, cert
+                )
+            location = cert.ca_issuer_access_location or ""
+            if parent is None and not location:
+                break
+            if max_depth is not None and len(chain) >= max_depth:
+                raise ResolveLimitExceeded(
+                    "Chain is longer than {0} certificates".format(max_depth), chain
+                )
+            if parent is not None:
+                cert = parent
+                continue
+
+            hop_timeout = timeout
+            if expires is not None:
+                remaining = expires - loop.time()
+                if remaining <= 0:
+                    raise ResolveLimitExceeded(
+                        "Deadline of {0}s exceeded".format(deadline), chain
+                    )
+                if hop_timeout is None or remaining < hop_timeout:
+                    hop_timeout = remaining
+
+            try:
+                parent_cert = await asyncio.wait_for(
+                    _adownload(location, transport, cache=cache), hop_timeout
+                )
+            except asyncio.TimeoutError:
+                raise ResolveLimitExceeded(
+                    "Downloading {0} timed out".format(location), chain
+                )
+            if not parent_cert:
+                break
+            path = await _in_executor(_load_issuers, cert, parent_cert)
+            cert, pending = path[0], path[1:]
+
+        if not chain.root and root_ca_store:
+            chain += await _in_executor(root_ca_store.find_issuer, cert)
+
+        return chain
@@ -1,3 +1,15 @@
-from cert_chain_resolver.resolver import resolve
+from cert_chain_resolver import __is_py3__
+from cert_chain_resolver.resolver import resolve, resolve_many
 from cert_chain_resolver.models import CertificateChain, Cert
+from cert_chain_resolver.castore.certifi_store import CertifiStore
+from cert_chain_resolver.castore.composite import CompositeStore
+from cert_chain_resolver.castore.directory import DirectoryStore
 from cert_chain_resolver.castore.file_system import FileSystemStore
+from cert_chain_resolver.castore.intermediates import IntermediateStore
+from cert_chain_resolver.castore.shared import SharedBundleStore
+from cert_chain_resolver.cache import MemoryCache, FileSystemCache
+from cert_chain_resolver.pool import ConnectionPool
+from cert_chain_resolver.retry import RetryPolicy
+
+if __is_py3__:
+    from cert_chain_resolver.aio import aresolve, AsyncTransport, AsyncioTransport
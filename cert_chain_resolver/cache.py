@@ -0,0 +1,282 @@
+from collections import OrderedDict
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    from typing import Any, Dict, Optional, Tuple
+except ImportError:  # pragma: no cover
+    pass
+
+
+class _LRU:
+    """Minimal thread-safe least-recently-used mapping with a fixed capacity"""
+
+    def __init__(self, maxsize):
+        # type: (int) -> None
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # type: OrderedDict[Any, Any]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._data)
+
+    def get(self, key, default=None):
+        # type: (Any, Any) -> Any
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            # Re-insert to mark it as most recently used
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        # type: (Any, Any) -> None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        # type: (Any, Any) -> Any
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            self._data.clear()
+
+
+class CacheEntry:
+    """A downloaded CA issuer certificate together with its HTTP validators
+
+    Args:
+        content: The raw response body (DER, PEM or PKCS7)
+        etag: Value of the ``ETag`` response header, if any
+        last_modified: Value of the ``Last-Modified`` response header, if any
+        fetched_at: Unix timestamp of when the content was (re)validated. Defaults to now.
+    """
+
+    def __init__(self, content, etag=None, last_modified=None, fetched_at=None):
+        # type: (bytes, Optional[str], Optional[str], Optional[float]) -> None
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def __repr__(self):
+        # type: () -> str
+        return '<CacheEntry etag="{0}" last_modified="{1}" size={2}>'.format(
+            self.etag, self.last_modified, len(self.content)
+        )
+
+    @property
+    def validators(self):
+        # type: () -> Dict[str, str]
+        """Conditional request headers that revalidate this entry"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_dict(self):
+        # type: () -> Dict[str, Any]
+        return {
+            "content": base64.b64encode(self.content).decode("ascii"),
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # type: (Dict[str, Any]) -> CacheEntry
+        return cls(
+            base64.b64decode(data["content"]),
+            etag=data.get("etag"),
+            last_modified=data.get("last_modified"),
+            fetched_at=data.get("fetched_at"),
+        )
+
+
+class DownloadCache(object):
+    """The :class:`DownloadCache <DownloadCache>` base class for caching CA issuer downloads by URL.
+
+    Entries older than ``ttl`` seconds are still returned by :py:meth:`get`, but are considered stale
+    and will be revalidated using their ETag / Last-Modified validators before being used again.
+
+    Args:
+        ttl: Number of seconds an entry is used without revalidation. Defaults to 1 day.
+    """
+
+    def __init__(self, ttl=86400):
+        # type: (float) -> None
+        self.ttl = ttl
+
+    def is_fresh(self, entry):
+        # type: (CacheEntry) -> bool
+        """Checks whether the entry can be used without contacting the server"""
+        return time.time() - entry.fetched_at < self.ttl
+
+    def get(self, url):
+        # type: (str) -> Optional[CacheEntry]
+        raise NotImplementedError
+
+    def set(self, url, entry):
+        # type: (str, CacheEntry) -> None
+        raise NotImplementedError
+
+
+class FileSystemCache(DownloadCache):
+    """Persists downloads in a directory, one JSON file per URL
+
+    Args:
+        path: Directory to store the entries in, created if it does not exist
+        ttl: See :class:`DownloadCache <DownloadCache>`
+    """
+
+    def __init__(self, path, ttl=86400):
+        # type: (str, float) -> None
+        super(FileSystemCache, self).__init__(ttl=ttl)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+
+    def _entry_path(self, url):
+        # type: (str) -> str
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, name + ".json")
+
+    def get(self, url):
+        # type: (str) -> Optional[CacheEntry]
+        try:
+            with open(self._entry_path(url), "r") as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            # Missing, unreadable or corrupt entries are treated as a miss
+            return None
+        if data.get("url") != url:
+            return None
+        return CacheEntry.from_dict(data)
+
+    def set(self, url, entry):
+        # type: (str, CacheEntry) -> None
+        data = entry.to_dict()
+        data["url"] = url
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            # Atomic on POSIX, readers never observe a partially written entry
+            os.rename(tmp_path, self._entry_path(url))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class MemoryCache(DownloadCache):
+    """In-memory LRU cache, optionally backed by a second (persistent) cache
+
+    Args:
+        maxsize: Maximum number of URLs kept in memory. Defaults to 1024.
+        ttl: See :class:`DownloadCache <DownloadCache>`
+        backend: A :class:`DownloadCache <DownloadCache>` consulted on a miss and written through on updates,
+            e.g. a :class:`FileSystemCache <FileSystemCache>`. Defaults to None.
+    """
+
+    def __init__(self, maxsize=1024, ttl=86400, backend=None):
+        # type: (int, float, Optional[DownloadCache]) -> None
+        super(MemoryCache, self).__init__(ttl=ttl)
+        self.backend = backend
+        self._lru = _LRU(maxsize)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._lru)
+
+    def get(self, url):
+        # type: (str) -> Optional[CacheEntry]
+        entry = self._lru.get(url)  # type: Optional[CacheEntry]
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(url)
+            if entry is not None:
+                self._lru.set(url, entry)
+        return entry
+
+    def set(self, url, entry):
+        # type: (str, CacheEntry) -> None
+        self._lru.set(url, entry)
+        if self.backend is not None:
+            self.backend.set(url, entry)
+
+    def clear(self):
+        # type: () -> None
+        """Drop all in-memory entries, the backend is left untouched"""
+        self._lru.clear()
+
+
+class VerificationCache(object):
+    """Bounded LRU cache of signature verification outcomes, keyed by
+    ``(raw sha256 fingerprint of the child, issuer public key hash)``
+
+    Args:
+        maxsize: Maximum number of outcomes kept. Defaults to 4096.
+        enabled: When False every lookup misses and nothing is stored. Defaults to True.
+    """
+
+    def __init__(self, maxsize=4096, enabled=True):
+        # type: (int, bool) -> None
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lru = _LRU(maxsize)
+        self._counters_lock = threading.Lock()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._lru)
+
+    def get(self, key):
+        # type: (Tuple[bytes, str]) -> Optional[bool]
+        """Outcome of an earlier verification or None when unknown"""
+        if not self.enabled:
+            return None
+        result = self._lru.get(key)  # type: Optional[bool]
+        with self._counters_lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def set(self, key, result):
+        # type: (Tuple[bytes, str], bool) -> None
+        if self.enabled:
+            self._lru.set(key, result)
+
+    def clear(self):
+        # type: () -> None
+        """Drop all outcomes and reset the counters"""
+        self._lru.clear()
+        with self._counters_lock:
+            self.hits = 0
+            self.misses = 0
+
+
+def create_cache(path=None, maxsize=1024, ttl=86400):
+    # type: (Optional[str], int, float) -> MemoryCache
+    """Create the default download cache: an in-memory LRU, persisted to ``path`` when given"""
+    backend = FileSystemCache(path, ttl=ttl) if path else None
+    return MemoryCache(maxsize=maxsize, ttl=ttl, backend=backend)
@@ -1,9 +1,10 @@
+from cert_chain_resolver import metrics
 from cert_chain_resolver.exceptions import RootCertificateNotFound
 from cert_chain_resolver.models import Cert
 
 
 try:
-    from typing import TYPE_CHECKING
+    from typing import Iterable, List, TYPE_CHECKING
 
     if TYPE_CHECKING:  # pragma: no cover
         from cert_chain_resolver.models import Cert
@@ -12,6 +13,35 @@ except ImportError:  # pragma: no cover
     pass
 
 
+def sort_candidates(cert, candidates):
+    # type: (Cert, Iterable[Cert]) -> List[Cert]
+    """Order issuer candidates of cert so the most likely issuer comes first, duplicates are removed.
+
+    Only candidates whose subject is the issuer of cert are kept, a matching key alone breaks name chaining.
+    Those whose Subject Key Identifier equals the Authority Key Identifier of cert come first, then the ones
+    without a Subject Key Identifier and finally the ones with a different key.
+    """
+
+    aki = cert.authority_key_identifier
+    issuer = cert.issuer_der
+
+    def rank(candidate):
+        # type: (Cert) -> int
+        ski = candidate.subject_key_identifier
+        if aki and ski == aki:
+            return 0
+        return 1 if not (aki and ski) else 2
+
+    unique = []  # type: List[Cert]
+    seen = set()
+    for candidate in candidates:
+        if candidate.subject_der == issuer and candidate.fingerprint not in seen:
+            seen.add(candidate.fingerprint)
+            unique.append(candidate)
+    # sorted() is stable, so the original order is kept within a rank
+    return sorted(unique, key=rank)
+
+
 class CAStore:
     """The :class:`CAStore <CAStore>` base class for CA Bundle Providers"""
 
@@ -20,15 +50,17 @@ class CAStore:
         """
         Find root cert by signed cert.
 
-        This function searches for certificates in the bundle that match.
+        This function searches for certificates in the bundle that match. A candidate is only accepted when its
+        subject is the issuer of cert and it signed cert.
         """
-        certs = self.find_issuer_candidates(cert)
-        try:
-            return next(ca for ca in certs if cert.is_issued_by(ca))
-        except StopIteration:
-            raise RootCertificateNotFound(
-                "Cant find root cert in {}".format(self.__class__.__name__)
-            )
+        with metrics.span("store.find_issuer"):
+            for ca in self.find_issuer_candidates(cert):
+                metrics.count("store.candidates")
+                if ca.subject_der == cert.issuer_der and cert.is_issued_by(ca):
+                    return ca
+        raise RootCertificateNotFound(
+            "Cant find root cert in {}".format(self.__class__.__name__)
+        )
 
     def find_issuer_candidates(self, cert):
         # type: (Cert) -> list[Cert]
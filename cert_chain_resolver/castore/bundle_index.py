@@ -0,0 +1,271 @@
+from collections import defaultdict
+import binascii
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from cert_chain_resolver.exceptions import CertificateChainResolverError
+from cert_chain_resolver.models import Cert
+from cert_chain_resolver.utils import (
+    PEM_BEGIN_CERTIFICATE,
+    PEM_END_CERTIFICATE,
+    iter_certificate_blocks,
+    scan_certificate_der,
+)
+
+try:
+    from typing import Any, Dict, Iterable, List, Optional, Tuple
+except ImportError:  # pragma: no cover
+    pass
+
+
+INDEX_VERSION = 3
+
+
+def bundle_key(path, data=None):
+    # type: (str, Optional[bytes]) -> Dict[str, Any]
+    """Identifies the exact contents of a bundle: its path, size, modification time and sha256
+
+    Args:
+        path: Path of the PEM bundle
+        data: Contents of the bundle as read by :py:func:`read_bundle`. Defaults to None, the bundle is read.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    if data is None:
+        size = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+                size += len(chunk)
+    else:
+        digest.update(data)
+        size = len(data)
+    return {
+        "path": os.path.abspath(path),
+        "size": size,
+        "mtime": stat.st_mtime,
+        "sha256": digest.hexdigest(),
+    }
+
+
+def read_bundle(path):
+    # type: (str) -> bytes
+    """Snapshot of the bundle at path, an index reads its certificates from the snapshot it was built for"""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _hex(value):
+    # type: (bytes) -> str
+    return binascii.hexlify(value).decode("ascii")
+
+
+def _scan_block(block):
+    # type: (memoryview) -> Tuple[str, Optional[str]]
+    """Hex encoded raw subject and Subject Key Identifier of a PEM or DER certificate, without fully parsing it"""
+    if block[:1].tobytes() == b"-":
+        block = memoryview(
+            binascii.a2b_base64(
+                block[len(PEM_BEGIN_CERTIFICATE) : -len(PEM_END_CERTIFICATE)]
+            )
+        )
+    _, subject, ski = scan_certificate_der(block)
+    return _hex(subject), _hex(ski) if ski else None
+
+
+class BundleIndex:
+    """Maps subjects and Subject Key Identifiers to the location of the certificates in a PEM (or DER) bundle.
+
+    Certificates are parsed the first time they are requested, from the snapshot of the bundle the index was built
+    for, so rewriting the bundle never affects an index in use. The index can be saved and loaded again, as long as
+    the bundle did not change.
+
+    Args:
+        path: Path of the PEM bundle
+        key: See :py:func:`bundle_key`
+        subjects: Mapping of hex encoded DER subject to a list of ``(offset, length)``
+        skis: Mapping of hex encoded Subject Key Identifier to a list of ``(offset, length)``
+        data: Snapshot of the bundle, see :py:func:`read_bundle`
+    """
+
+    def __init__(self, path, key, subjects, skis, data):
+        # type: (str, Dict[str, Any], Dict[str, List[Tuple[int, int]]], Dict[str, List[Tuple[int, int]]], bytes) -> None
+        self.path = path
+        self.key = key
+        self.subjects = subjects
+        self.skis = skis
+        self._data = data
+        self._certs = {}  # type: Dict[int, Cert]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        # type: () -> int
+        return sum(len(locations) for locations in self.subjects.values())
+
+    @classmethod
+    def build(cls, path, key=None, lazy=False, data=None):
+        # type: (str, Optional[Dict[str, Any]], bool, Optional[bytes]) -> BundleIndex
+        """Index every certificate in the bundle
+
+        Args:
+            path: Path of the PEM bundle
+            key: See :py:func:`bundle_key`. Defaults to the key of data.
+            lazy: Only scan the subject and Subject Key Identifier of every certificate, certificates are
+                parsed when they are found. Defaults to False.
+            data: Snapshot of the bundle the key was made for, see :py:func:`read_bundle`. Defaults to None, the
+                bundle is read.
+        """
+        if data is None:
+            data = read_bundle(path)
+        subjects = defaultdict(list)  # type: Dict[str, List[Tuple[int, int]]]
+        skis = defaultdict(list)  # type: Dict[str, List[Tuple[int, int]]]
+        certs = {}  # type: Dict[int, Cert]
+        cls._index_bundle(data, 0, subjects, skis, certs, lazy)
+
+        index = cls(
+            path, key or bundle_key(path, data), dict(subjects), dict(skis), data
+        )
+        # Keep the certificates that are parsed already
+        index._certs = certs
+        return index
+
+    @classmethod
+    def merge(cls, path, bundles, lazy=False):
+        # type: (str, Iterable[bytes], bool) -> BundleIndex
+        """Index the certificates of several bundles as if they were one, e.g. the files of a directory. Bundles
+        that can't be indexed are skipped. A merged index can't be saved.
+
+        Args:
+            path: Path of the directory holding the bundles
+            bundles: Snapshots of the bundles, see :py:func:`read_bundle`
+            lazy: See :py:meth:`build`
+        """
+        subjects = defaultdict(list)  # type: Dict[str, List[Tuple[int, int]]]
+        skis = defaultdict(list)  # type: Dict[str, List[Tuple[int, int]]]
+        certs = {}  # type: Dict[int, Cert]
+        snapshots = []  # type: List[bytes]
+        offset = 0
+        for data in bundles:
+            bundle_subjects = defaultdict(
+                list
+            )  # type: Dict[str, List[Tuple[int, int]]]
+            bundle_skis = defaultdict(list)  # type: Dict[str, List[Tuple[int, int]]]
+            bundle_certs = {}  # type: Dict[int, Cert]
+            try:
+                cls._index_bundle(
+                    data, offset, bundle_subjects, bundle_skis, bundle_certs, lazy
+                )
+            except (CertificateChainResolverError, ValueError):
+                # Not a certificate, a directory can hold other files as well
+                continue
+            for subject, locations in bundle_subjects.items():
+                subjects[subject].extend(locations)
+            for ski, locations in bundle_skis.items():
+                skis[ski].extend(locations)
+            certs.update(bundle_certs)
+            snapshots.append(data)
+            offset += len(data)
+
+        index = cls(path, {}, dict(subjects), dict(skis), b"".join(snapshots))
+        index._certs = certs
+        return index
+
+    @classmethod
+    def _index_bundle(cls, data, base, subjects, skis, certs, lazy):
+        # type: (bytes, int, Dict[str, List[Tuple[int, int]]], Dict[str, List[Tuple[int, int]]], Dict[int, Cert], bool) -> None
+        """Add the certificates of the bundle data, which starts at offset base of the snapshot, to the mappings"""
+        for offset, block in iter_certificate_blocks(data):
+            location = (base + offset, len(block))
+            subject, ski = cls._index_block(block, base + offset, certs, lazy)
+            subjects[subject].append(location)
+            if ski:
+                skis[ski].append(location)
+
+    @staticmethod
+    def _index_block(block, offset, certs, lazy):
+        # type: (memoryview, int, Dict[int, Cert], bool) -> Tuple[str, Optional[str]]
+        if lazy:
+            try:
+                return _scan_block(block)
+            except (ValueError, binascii.Error):
+                # Fall back to parsing the certificates the scanner does not understand
+                pass
+        cert = certs[offset] = Cert.load(block.tobytes())
+        return _hex(cert.subject_der), cert.subject_key_identifier
+
+    @classmethod
+    def load(cls, index_path, key, data):
+        # type: (str, Dict[str, Any], bytes) -> Optional[BundleIndex]
+        """Load a saved index, returns None when it is missing, corrupt or for a different bundle
+
+        Args:
+            index_path: Path of the saved index
+            key: See :py:func:`bundle_key`, it must be the key of data
+            data: Snapshot of the bundle, see :py:func:`read_bundle`
+        """
+        try:
+            with open(index_path, "r") as f:
+                saved = json.load(f)
+            if saved["version"] != INDEX_VERSION or saved["key"] != key:
+                return None
+            return cls(
+                key["path"],
+                key,
+                dict((k, [tuple(x) for x in v]) for k, v in saved["subjects"].items()),
+                dict((k, [tuple(x) for x in v]) for k, v in saved["skis"].items()),
+                data,
+            )
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, index_path):
+        # type: (str) -> None
+        """Atomically write the index to index_path"""
+        directory = os.path.dirname(index_path) or "."
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        data = {
+            "version": INDEX_VERSION,
+            "key": self.key,
+            "subjects": self.subjects,
+            "skis": self.skis,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.rename(tmp_path, index_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def find(self, subject, ski=None):
+        # type: (str, Optional[str]) -> List[Cert]
+        """Certificates matching the subject, the ones that also match the Subject Key Identifier come first
+
+        Args:
+            subject: Hex encoded DER subject, see :py:attr:`Cert.subject_der <cert_chain_resolver.models.Cert.subject_der>`
+            ski: Hex encoded Subject Key Identifier
+        """
+        locations = self.subjects.get(subject, [])
+        if ski:
+            keyed = set(self.skis.get(ski, []))
+            # sorted() is stable, so the bundle order is kept otherwise
+            locations = sorted(locations, key=lambda x: x not in keyed)
+        return [self._get(offset, length) for offset, length in locations]
+
+    def _get(self, offset, length):
+        # type: (int, int) -> Cert
+        cert = self._certs.get(offset)
+        if cert is None:
+            with self._lock:
+                cert = self._certs.get(offset)
+                if cert is None:
+                    cert = self._certs[offset] = Cert.load(
+                        self._data[offset : offset + length]
+                    )
+        return cert
@@ -0,0 +1,40 @@
+from cert_chain_resolver.castore.file_system import FileSystemStore
+from cert_chain_resolver.exceptions import CertificateChainResolverError
+
+try:
+    from typing import Optional
+except ImportError:  # pragma: no cover
+    pass
+
+
+class CertifiStore(FileSystemStore):
+    """The :class:`CertifiStore <CertifiStore>` finds the CA in the Mozilla bundle shipped by ``certifi``, a trust
+    set that is the same on every host. Install it with ``pip install cert-chain-resolver[certifi]``.
+
+    The bundle is indexed like any :class:`FileSystemStore <cert_chain_resolver.castore.file_system.FileSystemStore>`,
+    on the first lookup.
+
+    Args:
+        index_dir: See :class:`FileSystemStore <cert_chain_resolver.castore.file_system.FileSystemStore>`.
+            Defaults to None.
+        lazy: See :class:`FileSystemStore <cert_chain_resolver.castore.file_system.FileSystemStore>`.
+            Defaults to False.
+        reload_interval: See :class:`FileSystemStore <cert_chain_resolver.castore.file_system.FileSystemStore>`.
+            Defaults to None.
+    """
+
+    def __init__(self, index_dir=None, lazy=False, reload_interval=None):
+        # type: (Optional[str], bool, Optional[float]) -> None
+        try:
+            import certifi
+        except ImportError:
+            raise CertificateChainResolverError(
+                "CertifiStore requires certifi, install cert-chain-resolver[certifi]"
+            )
+        FileSystemStore.__init__(
+            self,
+            certifi.where(),
+            index_dir=index_dir,
+            lazy=lazy,
+            reload_interval=reload_interval,
+        )
@@ -0,0 +1,51 @@
+from cert_chain_resolver.castore.base_store import CAStore
+from cert_chain_resolver.exceptions import RootCertificateNotFound
+
+try:
+    from typing import List, Sequence, TYPE_CHECKING
+
+    if TYPE_CHECKING:  # pragma: no cover
+        from cert_chain_resolver.models import Cert
+except ImportError:  # pragma: no cover
+    pass
+
+
+class CompositeStore(CAStore):
+    """The :class:`CompositeStore <CompositeStore>` queries several CA stores in priority order, for example a custom
+    bundle, :class:`CertifiStore <cert_chain_resolver.castore.certifi_store.CertifiStore>` and the system bundle.
+
+    :py:meth:`find_issuer` stops at the first store holding the issuer. Stores load lazily, so a store is only
+    indexed once all stores before it missed.
+
+    Args:
+        stores: The CA stores, the first one is queried first
+    """
+
+    def __init__(self, stores):
+        # type: (Sequence[CAStore]) -> None
+        self.stores = list(stores)
+
+    def find_issuer(self, cert):
+        # type: (Cert) -> Cert
+        for store in self.stores:
+            try:
+                return store.find_issuer(cert)
+            except RootCertificateNotFound:
+                continue
+        raise RootCertificateNotFound(
+            "Cant find root cert in {}".format(
+                ", ".join(store.__class__.__name__ for store in self.stores)
+            )
+        )
+
+    def find_issuer_candidates(self, cert):
+        # type: (Cert) -> list[Cert]
+        """The candidates of every store in priority order, this loads every store"""
+        candidates = []  # type: List[Cert]
+        seen = set()
+        for store in self.stores:
+            for candidate in store.find_issuer_candidates(cert):
+                if candidate.fingerprint not in seen:
+                    seen.add(candidate.fingerprint)
+                    candidates.append(candidate)
+        return candidates
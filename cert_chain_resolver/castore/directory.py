@@ -0,0 +1,84 @@
+import os
+
+from cert_chain_resolver import metrics
+from cert_chain_resolver.castore.base_store import CAStore, sort_candidates
+from cert_chain_resolver.castore.file_system import ssl_paths
+from cert_chain_resolver.exceptions import CertificateChainResolverError
+from cert_chain_resolver.models import Cert
+from cert_chain_resolver.utils import iter_certificate_blocks, x509_name_hash
+
+try:
+    from typing import List, Optional, TYPE_CHECKING
+
+    if TYPE_CHECKING:  # pragma: no cover
+        from cert_chain_resolver.models import Cert
+except ImportError:  # pragma: no cover
+    pass
+
+
+eligible_dirs = [
+    ssl_paths.capath,
+    ssl_paths.openssl_capath,
+    "/etc/ssl/certs",
+]
+
+
+class DirectoryStore(CAStore):
+    """The :class:`DirectoryStore <DirectoryStore>` finds the CA in a hashed directory as created by
+    ``c_rehash`` / ``openssl rehash``, where every certificate is stored (or linked) as ``<subject hash>.N``.
+
+    Only the files named after the OpenSSL hash of the issuer name are read per lookup, nothing is kept in memory
+    between lookups, so certificates added to the directory are found at once.
+
+    Args:
+        path: Path of the hashed directory. Defaults to the first one found on the system.
+    """
+
+    def __init__(self, path=None):
+        # type: (Optional[str]) -> None
+        if not path:
+            try:
+                path = next(p for p in eligible_dirs if p and os.path.isdir(p))
+            except StopIteration:
+                raise CertificateChainResolverError(
+                    "Can't detect CA directory, we searched: {}".format(eligible_dirs)
+                )
+
+        if not os.path.isdir(path):
+            raise CertificateChainResolverError(
+                "Can't find CA directory, or it is not a directory: {}".format(path)
+            )
+
+        self.path = path
+
+    def find_issuer_candidates(self, cert):
+        # type: (Cert) -> list[Cert]
+        name_hash = x509_name_hash(cert.issuer_der)
+        candidates = []  # type: List[Cert]
+        # Like OpenSSL, stop at the first missing sequence number
+        sequence = 0
+        while True:
+            path = os.path.join(self.path, "{0}.{1}".format(name_hash, sequence))
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except (IOError, OSError):
+                break
+            metrics.count("store.files_read")
+            candidates.extend(self._load(data))
+            sequence += 1
+
+        # Names that only differ in case or whitespace share a hash, like in OpenSSL the signature decides
+        return sort_candidates(cert, candidates)
+
+    @staticmethod
+    def _load(data):
+        # type: (bytes) -> List[Cert]
+        certs = []
+        for _, block in iter_certificate_blocks(data):
+            try:
+                certs.append(Cert.load(bytes(block)))
+            except (CertificateChainResolverError, ValueError):
+                # A broken file must not hide the other files with the same hash
+                continue
+        return certs
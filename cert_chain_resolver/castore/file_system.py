@@ -1,17 +1,25 @@
-from collections import defaultdict
+import binascii
+import hashlib
 import os
 import ssl
+import threading
+import time
 
 from cert_chain_resolver.exceptions import (
     CertificateChainResolverError,
     RootCertificateNotFound,
 )
 from cert_chain_resolver.models import Cert
-from cert_chain_resolver.castore.base_store import CAStore
-from cert_chain_resolver import __is_py3__
+from cert_chain_resolver.castore.base_store import CAStore, sort_candidates
+from cert_chain_resolver.castore.bundle_index import (
+    BundleIndex,
+    bundle_key,
+    read_bundle,
+)
+from cert_chain_resolver import __is_py3__, metrics
 
 try:
-    from typing import TYPE_CHECKING
+    from typing import Optional, Tuple, TYPE_CHECKING
 
     if TYPE_CHECKING:  # pragma: no cover
         from cert_chain_resolver.models import Cert
@@ -28,15 +36,40 @@ eligible_paths = [
 ]
 
 
+def _bundle_stat(path):
+    # type: (str) -> Tuple[float, int, int]
+    """Modification time, inode and size of path, any change means the bundle was rewritten or replaced"""
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_ino, stat.st_size
+
+
 class FileSystemStore(CAStore):
-    """The :class:`SystemStore <SystemStore>` for finding the CA from file system bundle (PEM ONLY)."""
+    """The :class:`SystemStore <SystemStore>` for finding the CA from file system bundle (PEM ONLY).
 
-    _cache = None  # type: dict[str, list[Cert]]
+    Args:
+        path: Path of the PEM bundle. Defaults to the first bundle found on the system.
+        index_dir: Directory for persisting the index of the bundle. Later instances (and processes) load the
+            index instead of parsing the bundle, and only parse the roots they need. Defaults to None.
+        lazy: Only scan the subject and Subject Key Identifier of every root while indexing, roots are parsed
+            when they are a candidate issuer. Defaults to False.
+        reload_interval: Check the modification time, inode and size of the bundle at most every this many
+            seconds. When the bundle changed it is indexed again on a background thread, lookups keep using the
+            previous index until the new one is swapped in. Defaults to None, the bundle is never checked.
+    """
+
+    _index = None  # type: Optional[BundleIndex]
     path = None  # type: str
 
-    def __init__(self, path=None):
-        # (None | str) -> None
-        self._cache = defaultdict(list)
+    def __init__(self, path=None, index_dir=None, lazy=False, reload_interval=None):
+        # type: (Optional[str], Optional[str], bool, Optional[float]) -> None
+        self.index_dir = index_dir
+        self.lazy = lazy
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._stat = None  # type: Optional[Tuple[float, int, int]]
+        self._next_check = 0.0
         if not path:
             try:
                 path = next(p for p in eligible_paths if p and os.path.exists(p))
@@ -52,24 +85,89 @@ class FileSystemStore(CAStore):
 
         self.path = path
 
+    @property
+    def index_path(self):
+        # type: () -> Optional[str]
+        """Location of the persisted index, None when no index_dir is configured"""
+        if not self.index_dir:
+            return None
+        name = hashlib.sha256(os.path.abspath(self.path).encode("utf-8")).hexdigest()
+        return os.path.join(self.index_dir, name + ".json")
+
     def find_issuer_candidates(self, cert):
         # type: (Cert) -> list[Cert]
-        if not self._cache:
-            self._populate_cache()
+        index = self._index
+        if index is None:
+            with self._lock:
+                # Another thread might have loaded the index while we were waiting
+                if self._index is None:
+                    with metrics.span("store.load_index"):
+                        self._stat = _bundle_stat(self.path)
+                        self._index = self._load_index()
+                    self._next_check = time.time() + (self.reload_interval or 0)
+                index = self._index
+        elif self.reload_interval is not None and time.time() >= self._next_check:
+            self._check_bundle()
 
-        return self._cache.get(cert.issuer, [])
+        issuer = binascii.hexlify(cert.issuer_der).decode("ascii")
+        # Cross-signed and re-keyed CAs share a subject, the key identifier orders them
+        aki = cert.authority_key_identifier
+        if not aki:
+            return index.find(subject=issuer)
+        return sort_candidates(cert, index.find(subject=issuer, ski=aki))
 
-    def _populate_cache(self):
+    def _check_bundle(self):
         # type: () -> None
-        with open(self.path, "rb") as f:
-            cert_buffer = bytearray()
-            for line in f:
-                if line == b"-----BEGIN CERTIFICATE-----\n":
-                    cert_buffer = bytearray(line)
-                elif line == b"-----END CERTIFICATE-----\n":
-                    cert_buffer.extend(line)
-                    root = Cert.load(bytes(cert_buffer))
-                    self._cache[root.subject].append(root)
-                    cert_buffer = bytearray()
-                else:
-                    cert_buffer.extend(line)
+        # Only one lookup checks the bundle, the others don't wait for it
+        if not self._reload_lock.acquire(False):
+            return
+        try:
+            if self._reloading or time.time() < self._next_check:
+                return
+            self._next_check = time.time() + (self.reload_interval or 0)
+            try:
+                changed = _bundle_stat(self.path) != self._stat
+            except OSError:
+                # The bundle is being replaced, check again later
+                return
+            if changed:
+                self._reloading = True
+                thread = threading.Thread(target=self._reload)
+                thread.daemon = True
+                thread.start()
+        finally:
+            self._reload_lock.release()
+
+    def _reload(self):
+        # type: () -> None
+        try:
+            with metrics.span("store.load_index"):
+                stat = _bundle_stat(self.path)
+                index = self._load_index()
+            # Assigning the attribute is atomic, a lookup sees either the old or the new index
+            self._index, self._stat = index, stat
+            metrics.count("store.reloads")
+        except (CertificateChainResolverError, ValueError, IOError, OSError):
+            # A half written bundle fails to parse, the old index stays and the next check retries
+            pass
+        finally:
+            self._reloading = False
+
+    def _load_index(self):
+        # type: () -> BundleIndex
+        # Offsets are only valid for the bytes they were taken from, the index keeps reading from this snapshot
+        data = read_bundle(self.path)
+        index_path = self.index_path
+        if not index_path:
+            return BundleIndex.build(self.path, lazy=self.lazy, data=data)
+
+        key = bundle_key(self.path, data)
+        index = BundleIndex.load(index_path, key, data)
+        if index is None:
+            index = BundleIndex.build(self.path, key, lazy=self.lazy, data=data)
+            try:
+                index.save(index_path)
+            except (IOError, OSError):
+                # A read-only cache dir only costs the speed up, not the lookup
+                pass
+        return index
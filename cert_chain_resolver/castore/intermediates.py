@@ -0,0 +1,82 @@
+import binascii
+import os
+import threading
+
+from cert_chain_resolver import metrics
+from cert_chain_resolver.exceptions import CertificateChainResolverError
+from cert_chain_resolver.castore.base_store import CAStore, sort_candidates
+from cert_chain_resolver.castore.bundle_index import BundleIndex, read_bundle
+
+try:
+    from typing import Iterator, List, Optional, TYPE_CHECKING
+
+    if TYPE_CHECKING:  # pragma: no cover
+        from cert_chain_resolver.models import Cert
+except ImportError:  # pragma: no cover
+    pass
+
+
+class IntermediateStore(CAStore):
+    """The :class:`IntermediateStore <IntermediateStore>` holds known intermediate certificates, for example a CCADB
+    export. :py:func:`resolve <cert_chain_resolver.resolver.resolve>` looks up the issuer of every certificate in it
+    before downloading, so chains covered by the store are resolved without network access.
+
+    The certificates of all files are indexed by subject and Subject Key Identifier in a single index, built on the
+    first lookup.
+
+    Args:
+        path: A PEM bundle, or a directory of PEM or DER files. Files without certificates are ignored.
+        lazy: Only parse the certificates that are a candidate issuer, see
+            :class:`FileSystemStore <cert_chain_resolver.castore.file_system.FileSystemStore>`. Defaults to True.
+    """
+
+    def __init__(self, path, lazy=True):
+        # type: (str, bool) -> None
+        if not os.path.exists(path):
+            raise CertificateChainResolverError(
+                "Can't find intermediates: {}".format(path)
+            )
+        self.path = path
+        self.lazy = lazy
+        self._lock = threading.Lock()
+        self._index = None  # type: Optional[BundleIndex]
+
+    @property
+    def paths(self):
+        # type: () -> List[str]
+        """Files holding the certificates"""
+        if not os.path.isdir(self.path):
+            return [self.path]
+        paths = []
+        for name in sorted(os.listdir(self.path)):
+            path = os.path.join(self.path, name)
+            if not name.startswith(".") and os.path.isfile(path):
+                paths.append(path)
+        return paths
+
+    def find_issuer_candidates(self, cert):
+        # type: (Cert) -> list[Cert]
+        index = self._index
+        if index is None:
+            with self._lock:
+                # Another thread might have loaded the index while we were waiting
+                if self._index is None:
+                    with metrics.span("store.load_index"):
+                        self._index = BundleIndex.merge(
+                            self.path, self._read_files(), lazy=self.lazy
+                        )
+                index = self._index
+
+        issuer = binascii.hexlify(cert.issuer_der).decode("ascii")
+        # The same intermediate can be in more than one file
+        return sort_candidates(
+            cert, index.find(issuer, ski=cert.authority_key_identifier)
+        )
+
+    def _read_files(self):
+        # type: () -> Iterator[bytes]
+        for path in self.paths:
+            try:
+                yield read_bundle(path)
+            except (IOError, OSError):
+                continue
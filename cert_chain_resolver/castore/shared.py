@@ -0,0 +1,278 @@
+import binascii
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from cert_chain_resolver import __is_py3__, metrics
+from cert_chain_resolver.castore.base_store import CAStore, sort_candidates
+from cert_chain_resolver.castore.bundle_index import bundle_key
+from cert_chain_resolver.exceptions import CertificateChainResolverError
+from cert_chain_resolver.models import Cert
+from cert_chain_resolver.utils import (
+    PEM_BEGIN_CERTIFICATE,
+    PEM_END_CERTIFICATE,
+    iter_certificate_blocks,
+    map_file,
+    scan_certificate_der,
+)
+
+try:
+    from typing import Any, Dict, List, Optional, Tuple
+except ImportError:  # pragma: no cover
+    pass
+
+
+BLOB_MAGIC = b"CCRBLOB1"
+
+# Magic, number of certificates, number of Subject Key Identifiers and the length of the bundle key
+_HEADER = struct.Struct("<8sIII")
+# Offset and length of a DER certificate
+_ENTRY = struct.Struct("<II")
+# Lookup key and certificate number, the tables are sorted by lookup key
+_RECORD = struct.Struct("<QI")
+
+
+def _lookup_key(value):
+    # type: (bytes) -> int
+    return int(struct.unpack("<Q", hashlib.sha1(value).digest()[:8])[0])
+
+
+def _to_der(block):
+    # type: (memoryview) -> bytes
+    if block[:1].tobytes() == b"-":
+        return binascii.a2b_base64(
+            block[len(PEM_BEGIN_CERTIFICATE) : -len(PEM_END_CERTIFICATE)].tobytes()
+        )
+    return block.tobytes()
+
+
+def _scan(der):
+    # type: (bytes) -> Tuple[bytes, Optional[bytes]]
+    try:
+        _, subject, ski = scan_certificate_der(der)
+        return subject, ski
+    except ValueError:
+        # Fall back to parsing the certificates the scanner does not understand
+        cert = Cert.load(der)
+        ski_hex = cert.subject_key_identifier
+        return cert.subject_der, binascii.unhexlify(ski_hex) if ski_hex else None
+
+
+def build_blob(bundle_path, blob_path, key=None):
+    # type: (str, str, Optional[Dict[str, Any]]) -> None
+    """Atomically write the certificates of a PEM (or DER) bundle to blob_path as one compact DER blob with sorted
+    subject and Subject Key Identifier tables, see :class:`SharedBundleStore`
+
+    Args:
+        bundle_path: Path of the PEM bundle
+        blob_path: Path of the blob
+        key: See :py:func:`bundle_key <cert_chain_resolver.castore.bundle_index.bundle_key>`. Defaults to the key
+            of bundle_path.
+    """
+    ders = []  # type: List[bytes]
+    subjects = []  # type: List[Tuple[int, int]]
+    skis = []  # type: List[Tuple[int, int]]
+    with map_file(bundle_path) as data:
+        for _, block in iter_certificate_blocks(data):
+            try:
+                der = _to_der(block)
+            finally:
+                # The map can only be closed when no view on it is left
+                if __is_py3__:
+                    block.release()
+            subject, ski = _scan(der)
+            subjects.append((_lookup_key(subject), len(ders)))
+            if ski:
+                skis.append((_lookup_key(ski), len(ders)))
+            ders.append(der)
+
+    key_json = json.dumps(key or bundle_key(bundle_path), sort_keys=True)
+    encoded_key = key_json.encode("utf-8")
+    offset = (
+        _HEADER.size
+        + len(encoded_key)
+        + _ENTRY.size * len(ders)
+        + _RECORD.size * (len(subjects) + len(skis))
+    )
+    entries = []
+    for der in ders:
+        entries.append(_ENTRY.pack(offset, len(der)))
+        offset += len(der)
+
+    directory = os.path.dirname(blob_path) or "."
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(BLOB_MAGIC, len(ders), len(skis), len(encoded_key)))
+            f.write(encoded_key)
+            f.write(b"".join(entries))
+            for table in (subjects, skis):
+                f.write(b"".join(_RECORD.pack(*record) for record in sorted(table)))
+            for der in ders:
+                f.write(der)
+        os.rename(tmp_path, blob_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _Blob(object):
+    """A read-only map of a blob written by :py:func:`build_blob`"""
+
+    def __init__(self, path):
+        # type: (str) -> None
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.count, ski_count, key_length = _HEADER.unpack_from(self._map, 0)
+            if magic != BLOB_MAGIC:
+                raise ValueError("Not a certificate blob: {}".format(path))
+            offset = _HEADER.size
+            self.key = json.loads(
+                self._map[offset : offset + key_length].decode("utf-8")
+            )  # type: Dict[str, Any]
+            self._entries = offset + key_length
+            self._subjects = self._entries + _ENTRY.size * self.count
+            self._skis = self._subjects + _RECORD.size * self.count
+            self._ski_count = ski_count
+        except (struct.error, ValueError):
+            self.close()
+            raise ValueError("Not a certificate blob: {}".format(path))
+
+    def close(self):
+        # type: () -> None
+        self._map.close()
+
+    def der(self, number):
+        # type: (int) -> bytes
+        offset, length = _ENTRY.unpack_from(
+            self._map, self._entries + number * _ENTRY.size
+        )
+        return self._map[offset : offset + length]
+
+    def find_subject(self, subject):
+        # type: (bytes) -> List[int]
+        return self._search(self._subjects, self.count, _lookup_key(subject))
+
+    def find_ski(self, ski):
+        # type: (bytes) -> List[int]
+        return self._search(self._skis, self._ski_count, _lookup_key(ski))
+
+    def _search(self, table, size, key):
+        # type: (int, int, int) -> List[int]
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            if _RECORD.unpack_from(self._map, table + middle * _RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        numbers = []
+        for position in range(low, size):
+            found, number = _RECORD.unpack_from(
+                self._map, table + position * _RECORD.size
+            )
+            if found != key:
+                break
+            numbers.append(number)
+        return numbers
+
+
+class SharedBundleStore(CAStore):
+    """The :class:`SharedBundleStore <SharedBundleStore>` finds the CA in a blob of DER certificates that is shared
+    by every process using it, for multi-process servers such as gunicorn or a multiprocessing pool.
+
+    The blob holds the DER certificates of the bundle with sorted subject and Subject Key Identifier tables. It is
+    memory mapped read-only, so the operating system keeps a single copy in memory for all processes. Only the
+    candidates of a lookup are parsed, and only once per process. Put the blob on a tmpfs such as ``/dev/shm`` to
+    keep it off the disk.
+
+    Args:
+        path: Path of the blob
+        bundle_path: PEM bundle the blob is built from when it is missing or the bundle changed. Defaults to None,
+            the blob must exist then.
+    """
+
+    def __init__(self, path, bundle_path=None):
+        # type: (str, Optional[str]) -> None
+        if bundle_path and not os.path.isfile(bundle_path):
+            raise CertificateChainResolverError(
+                "Can't find bundle, or bundle is not a file: {}".format(bundle_path)
+            )
+        if not bundle_path and not os.path.isfile(path):
+            raise CertificateChainResolverError(
+                "Can't find certificate blob: {}".format(path)
+            )
+        self.path = path
+        self.bundle_path = bundle_path
+        self._lock = threading.Lock()
+        self._blob = None  # type: Optional[_Blob]
+        self._certs = {}  # type: Dict[int, Cert]
+
+    def find_issuer_candidates(self, cert):
+        # type: (Cert) -> list[Cert]
+        blob = self._blob
+        if blob is None:
+            with self._lock:
+                # Another thread might have attached while we were waiting
+                if self._blob is None:
+                    with metrics.span("store.load_index"):
+                        self._blob = self._attach()
+                blob = self._blob
+
+        numbers = blob.find_subject(cert.issuer_der)
+        aki = cert.authority_key_identifier
+        if aki:
+            keyed = set(blob.find_ski(binascii.unhexlify(aki)))
+            numbers.sort(key=lambda n: n not in keyed)
+
+        # The tables are keyed by a hash, sort_candidates drops the certificates that only share the hash
+        return sort_candidates(cert, [self._get(blob, number) for number in numbers])
+
+    def close(self):
+        # type: () -> None
+        """Unmap the blob, it is mapped again on the next lookup. Lookups must not run concurrently."""
+        with self._lock:
+            if self._blob is not None:
+                self._blob.close()
+                self._blob = None
+                self._certs = {}
+
+    def _get(self, blob, number):
+        # type: (_Blob, int) -> Cert
+        cert = self._certs.get(number)
+        if cert is None:
+            with self._lock:
+                cert = self._certs.get(number)
+                if cert is None:
+                    cert = self._certs[number] = Cert.load(blob.der(number))
+        return cert
+
+    def _attach(self):
+        # type: () -> _Blob
+        if not self.bundle_path:
+            try:
+                return _Blob(self.path)
+            except (IOError, OSError, ValueError):
+                raise CertificateChainResolverError(
+                    "Can't read certificate blob: {}".format(self.path)
+                )
+
+        key = bundle_key(self.bundle_path)
+        try:
+            blob = _Blob(self.path)
+            if blob.key == key:
+                return blob
+            blob.close()
+        except (IOError, OSError, ValueError):
+            pass
+        # Processes racing to build the blob each rename a complete blob into place
+        build_blob(self.bundle_path, self.path, key)
+        return _Blob(self.path)
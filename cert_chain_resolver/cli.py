@@ -1,14 +1,37 @@
 import argparse
+from collections import deque
+import glob
+import json
+import os
 import ssl
 import sys
+import time
 from typing import Optional
-from cert_chain_resolver.resolver import resolve
-from cert_chain_resolver import __is_py3__
+from cert_chain_resolver.resolver import DEFAULT_MAX_DEPTH, resolve, resolve_many
+from cert_chain_resolver import __is_py3__, metrics
+from cert_chain_resolver.cache import MemoryCache, create_cache
+from cert_chain_resolver.exceptions import (
+    CertificateChainResolverError,
+    Python2IncompatibleFeature,
+)
+from cert_chain_resolver.castore.certifi_store import CertifiStore
+from cert_chain_resolver.castore.composite import CompositeStore
+from cert_chain_resolver.castore.directory import DirectoryStore
 from cert_chain_resolver.castore.file_system import FileSystemStore
+from cert_chain_resolver.castore.intermediates import IntermediateStore
+from cert_chain_resolver.pool import ConnectionPool
+from cert_chain_resolver.retry import RetryPolicy
 
 try:
-    from typing import Optional
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma: no cover
+    ThreadPoolExecutor = None  # type: ignore
+
+try:
+    from typing import Any, Dict, Iterator, List, Optional, Tuple
+    from cert_chain_resolver.models import Cert, CertificateChain
     from cert_chain_resolver.castore.base_store import CAStore
+    from cert_chain_resolver.cache import DownloadCache
 except ImportError:  # pragma: no cover
     pass
 
@@ -41,20 +64,50 @@ def _print_chain_details(chain, include_root):
         sys.stderr.write("WARNING: Root certificate was requested, but not found!\n")
 
 
-def cli(file_bytes, show_details=False, include_root=False, root_ca_store=None):
-    # type: (bytes, bool, bool, Optional[CAStore]) -> None
-    chain = resolve(file_bytes, root_ca_store=root_ca_store)
-    if show_details:
+def _write_record(record, output_format):
+    # type: (Dict[str, Any], str) -> None
+    # A single write per record, so consumers never see a partial line
+    if output_format == "json":
+        sys.stdout.write(json.dumps(record, indent=2) + "\n")
+    else:
+        sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+def cli(
+    file_bytes,
+    show_details=False,
+    include_root=False,
+    root_ca_store=None,
+    cache=None,
+    pool=None,
+    output_format="text",
+    include_pem=False,
+    retry=None,
+    intermediate_store=None,
+):
+    # type: (bytes, bool, bool, Optional[CAStore], Optional[DownloadCache], Optional[ConnectionPool], str, bool, Optional[RetryPolicy], Optional[CAStore]) -> None
+    chain = resolve(
+        file_bytes,
+        root_ca_store=root_ca_store,
+        cache=cache,
+        pool=pool,
+        retry=retry,
+        intermediate_store=intermediate_store,
+    )
+    if output_format != "text":
+        _write_record(chain.to_dict(include_root, include_pem), output_format)
+    elif show_details:
         _print_chain_details(chain, include_root=include_root)
     else:
-        root = [chain.root] if chain.root and include_root else []
-        for c in [chain.leaf] + list(chain.intermediates) + root:
+        certs = chain.certificates(include_root)
+        for c in certs:
             sys.stdout.write(c.export())
 
-        for i, c in enumerate([chain.leaf] + list(chain.intermediates) + root, 1):
+        for i, c in enumerate(certs, 1):
             sys.stderr.write(str(i) + ". " + repr(c) + "\n")
 
-        if not root and include_root:
+        if not chain.root and include_root:
             sys.stderr.write(
                 str(i + 1) + ". Root certificate was requested, but not found!\n"
             )
@@ -64,6 +117,151 @@ def cli(file_bytes, show_details=False, include_root=False, root_ca_store=None):
                 )
 
 
+def _iter_batch_paths(source):
+    # type: (str) -> Iterator[str]
+    """Paths of a directory, a glob pattern or a manifest file with one path per line ("-" for stdin)"""
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path):
+                yield path
+    elif glob.has_magic(source):
+        for path in sorted(glob.glob(source)):
+            if os.path.isfile(path):
+                yield path
+    else:
+        manifest = sys.stdin if source == "-" else open(source, "r")
+        try:
+            for line in manifest:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+        finally:
+            if manifest is not sys.stdin:
+                manifest.close()
+
+
+def cli_batch(
+    paths,
+    output_dir,
+    workers=8,
+    include_root=False,
+    root_ca_store=None,
+    cache=None,
+    pool=None,
+    output_format="text",
+    include_pem=False,
+    retry=None,
+    intermediate_store=None,
+):
+    # type: (Iterator[str], str, int, bool, Optional[CAStore], Optional[DownloadCache], Optional[ConnectionPool], str, bool, Optional[RetryPolicy], Optional[CAStore]) -> int
+    """Resolve every certificate in paths with :py:func:`resolve_many <cert_chain_resolver.resolver.resolve_many>`
+    and write each bundle to output_dir as ``<file name>.bundle.pem``. A failing certificate is reported and does
+    not stop the batch.
+
+    With the json and ndjson output_format a record per certificate is streamed to stdout as soon as it is
+    resolved, in input order. Failing certificates get a record with an ``error``.
+
+    Pass a :class:`RetryPolicy <cert_chain_resolver.retry.RetryPolicy>` as retry, so a CA issuer that keeps failing
+    fails fast for the rest of the batch.
+
+    Returns:
+        The number of failed certificates
+    """
+    if ThreadPoolExecutor is None:  # pragma: no cover
+        raise Python2IncompatibleFeature("Batch mode requires concurrent.futures")
+
+    if cache is None:
+        # Shared by all workers, so every CA issuer is only downloaded once
+        cache = MemoryCache()
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    used_names = {}  # type: dict[str, int]
+    counts = {"resolved": 0, "failed": 0}
+    started = time.time()
+    # Source and output path of the certificates handed to resolve_many, its results come in the same order
+    sources = deque()  # type: deque[Tuple[str, str, Optional[Exception]]]
+
+    def _inputs():
+        # type: () -> Iterator[bytes]
+        for path in paths:
+            name = os.path.basename(path)
+            used_names[name] = used_names.get(name, 0) + 1
+            if used_names[name] > 1:
+                # Inputs from different directories can share a file name
+                name = "{0}-{1}".format(name, used_names[name])
+            output_path = os.path.join(output_dir, name + ".bundle.pem")
+            try:
+                with open(path, "rb") as f:
+                    file_bytes = f.read()
+            except (IOError, OSError) as e:
+                # Still handed over to keep the order, the read error is reported instead of its result
+                sources.append((path, output_path, e))
+                yield b""
+            else:
+                sources.append((path, output_path, None))
+                yield file_bytes
+
+    def _emit(record):
+        # type: (Dict[str, Any]) -> None
+        if output_format == "json":
+            # Stream the elements of a single JSON array
+            first = counts["resolved"] + counts["failed"] == 1
+            sys.stdout.write(("[\n" if first else ",\n") + json.dumps(record))
+            sys.stdout.flush()
+        elif output_format == "ndjson":
+            _write_record(record, output_format)
+
+    def _finish(path, output_path, result):
+        # type: (str, str, Any) -> None
+        if not isinstance(result, Exception):
+            try:
+                with open(output_path, "w") as f:
+                    for c in result.certificates(include_root):
+                        f.write(c.export())
+            except (IOError, OSError) as e:
+                result = e
+        if isinstance(result, Exception):
+            sys.stderr.write("FAILED {0}: {1}\n".format(path, result))
+            counts["failed"] += 1
+            _emit({"source": path, "error": str(result)})
+        else:
+            counts["resolved"] += 1
+            record = result.to_dict(include_root, include_pem)
+            record.update(source=path, output=output_path)
+            _emit(record)
+
+    results = resolve_many(
+        _inputs(),
+        max_workers=workers,
+        root_ca_store=root_ca_store,
+        cache=cache,
+        pool=pool,
+        retry=retry,
+        intermediate_store=intermediate_store,
+        return_exceptions=True,
+    )
+    for result in results:
+        path, output_path, error = sources.popleft()
+        _finish(path, output_path, error or result)
+
+    resolved, failed = counts["resolved"], counts["failed"]
+    if output_format == "json":
+        sys.stdout.write("\n]\n" if resolved + failed else "[]\n")
+    elapsed = time.time() - started
+    sys.stderr.write(
+        "Resolved {0} of {1} certificates in {2:.2f}s ({3:.1f}/s), {4} failed\n".format(
+            resolved,
+            resolved + failed,
+            elapsed,
+            (resolved + failed) / elapsed if elapsed else 0.0,
+            failed,
+        )
+    )
+    return failed
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -79,6 +277,14 @@ Examples:
     Using stdin:
 
     $ cat certificate.crt | cert_chain_resolver > bundle.crt
+
+    Resolving all certificates in a directory, a glob or a manifest with one path per line:
+
+    $ cert_chain_resolver --batch 'certs/*.crt' --output-dir bundles/
+
+    Serving the resolver over HTTP, see cert_chain_resolver serve -h:
+
+    $ cert_chain_resolver serve --port 8080
     """,
     )
     parser.add_argument(
@@ -100,24 +306,254 @@ Examples:
         "--ca-bundle-path",
         type=str,
         default=None,
-        help="Use a custom CA bundle for completing the chain",
+        help="Use a custom CA bundle, or a c_rehash directory, for completing the chain",
+    )
+    parser.add_argument(
+        "--use-certifi-store",
+        action="store_true",
+        help="Also look up roots in the certifi bundle, after --ca-bundle-path and before the system bundle",
+    )
+    parser.add_argument(
+        "--intermediates",
+        type=str,
+        default=None,
+        help="Directory or PEM bundle of known intermediates, the issuer is looked up there before downloading it",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for caching downloaded CA issuer certificates and the CA bundle index between runs",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="Timeout in seconds for downloading a CA issuer certificate (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        default=None,
+        help="Resolve every certificate in a directory, a glob or a manifest file with one path per line ('-' for stdin)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Directory the bundles of --batch are written to, one <file name>.bundle.pem per input",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of certificates resolved concurrently in --batch mode (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=["text", "json", "ndjson"],
+        default="text",
+        help="Output format, json and ndjson write a record per chain to stdout (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--include-pem",
+        action="store_true",
+        help="Add the PEM of every certificate to the json and ndjson records",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="Retries of a failing CA issuer download, a location that keeps failing is skipped for a minute "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print where the time went (downloads, parsing, CA bundle, verification) to stderr",
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.batch and not args.output_dir:
+        parser.error("--batch requires --output-dir")
+    return args
 
 
-def main():
-    if sys.stdin.isatty() and len(sys.argv) == 1:
-        sys.argv += ["-h"]
+def parse_serve_args(argv):
+    # type: (List[str]) -> argparse.Namespace
+    parser = argparse.ArgumentParser(
+        prog="cert_chain_resolver serve",
+        description="Serve the resolver over localhost HTTP or a Unix socket. The CA bundle, the download cache "
+        "and the connection pool stay warm between requests.",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="Port to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--unix-socket",
+        type=str,
+        default=None,
+        help="Listen on this Unix socket instead of TCP",
+    )
+    parser.add_argument(
+        "--ca-bundle-path",
+        type=str,
+        default=None,
+        help="Use a custom CA bundle, or a c_rehash directory, for completing the chain",
+    )
+    parser.add_argument(
+        "--use-certifi-store",
+        action="store_true",
+        help="Also look up roots in the certifi bundle, after --ca-bundle-path and before the system bundle",
+    )
+    parser.add_argument(
+        "--intermediates",
+        type=str,
+        default=None,
+        help="Directory or PEM bundle of known intermediates, the issuer is looked up there before downloading it",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for caching downloaded CA issuer certificates and the CA bundle index between runs",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="Timeout in seconds for downloading a CA issuer certificate (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="Retries of a failing CA issuer download, a location that keeps failing is skipped for a minute "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--reload-interval",
+        type=float,
+        default=None,
+        help="Check the CA bundle for changes every this many seconds and reload it in the background",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=DEFAULT_MAX_DEPTH,
+        help="Maximum number of CA issuers followed per resolve, requests can only lower it (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        help="Seconds a single resolve may take, requests can only lower it",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Do not log every request"
+    )
+    return parser.parse_args(argv)
 
-    args = parse_args()
 
-    cli_args = {
-        "file_bytes": None,
-        "show_details": args.info,
-        "include_root": args.include_root,
-    }
+def _create_root_ca_store(path, index_dir, reload_interval=None, use_certifi=False):
+    # type: (Optional[str], Optional[str], Optional[float], bool) -> CAStore
+    """A :class:`DirectoryStore <cert_chain_resolver.castore.directory.DirectoryStore>` for hashed directories, a
+    :class:`FileSystemStore <cert_chain_resolver.castore.file_system.FileSystemStore>` for bundles. With use_certifi a
+    :class:`CompositeStore <cert_chain_resolver.castore.composite.CompositeStore>` of path, certifi and the system
+    bundle when it is found.
+    """
+    stores = []  # type: List[CAStore]
+    if path and os.path.isdir(path):
+        stores.append(DirectoryStore(path))
+    elif path or not use_certifi:
+        stores.append(
+            FileSystemStore(path, index_dir=index_dir, reload_interval=reload_interval)
+        )
+    if not use_certifi:
+        return stores[0]
+
+    stores.append(CertifiStore(index_dir=index_dir, reload_interval=reload_interval))
+    try:
+        stores.append(
+            FileSystemStore(index_dir=index_dir, reload_interval=reload_interval)
+        )
+    except CertificateChainResolverError:
+        # certifi is enough when the system has no bundle
+        pass
+    return CompositeStore(stores)
+
 
-    cli_args["root_ca_store"] = FileSystemStore(args.ca_bundle_path)
+def serve(argv):
+    # type: (List[str]) -> None
+    # Only imported when serving, the http.server machinery is not needed for a single resolve
+    from cert_chain_resolver.server import create_server
+
+    args = parse_serve_args(argv)
+    index_dir = os.path.join(args.cache_dir, "index") if args.cache_dir else None
+    root_ca_store = _create_root_ca_store(
+        args.ca_bundle_path,
+        index_dir,
+        args.reload_interval,
+        use_certifi=args.use_certifi_store,
+    )
+    server = create_server(
+        host=args.host,
+        port=args.port,
+        unix_socket=args.unix_socket,
+        root_ca_store=root_ca_store,
+        cache=(
+            create_cache(os.path.join(args.cache_dir, "downloads"))
+            if args.cache_dir
+            else None
+        ),
+        pool=ConnectionPool(timeout=args.timeout),
+        retry=RetryPolicy(attempts=args.retries + 1),
+        intermediate_store=(
+            IntermediateStore(args.intermediates) if args.intermediates else None
+        ),
+        max_depth=args.max_depth,
+        deadline=args.deadline,
+        quiet=args.quiet,
+    )
+    address = args.unix_socket or "http://{0}:{1}".format(
+        args.host, getattr(server, "server_port", args.port)
+    )
+    sys.stderr.write("Serving on {0}\n".format(address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _run(args, cli_args):
+    # type: (argparse.Namespace, Dict[str, Any]) -> None
+    if args.batch:
+        failed = cli_batch(
+            _iter_batch_paths(args.batch),
+            args.output_dir,
+            workers=args.workers,
+            include_root=args.include_root,
+            root_ca_store=cli_args["root_ca_store"],
+            cache=cli_args["cache"],
+            pool=cli_args["pool"],
+            output_format=args.output_format,
+            include_pem=args.include_pem,
+            retry=cli_args["retry"],
+            intermediate_store=cli_args["intermediate_store"],
+        )
+        sys.exit(1 if failed else 0)
 
     if args.file_name == "-":
         source = None
@@ -133,5 +569,49 @@ def main():
     cli(**cli_args)
 
 
+def main():
+    if sys.argv[1:2] == ["serve"]:
+        serve(sys.argv[2:])
+        return
+
+    if sys.stdin.isatty() and len(sys.argv) == 1:
+        sys.argv += ["-h"]
+
+    args = parse_args()
+
+    cli_args = {
+        "file_bytes": None,
+        "show_details": args.info,
+        "include_root": args.include_root,
+        "output_format": args.output_format,
+        "include_pem": args.include_pem,
+    }
+
+    index_dir = os.path.join(args.cache_dir, "index") if args.cache_dir else None
+    cli_args["root_ca_store"] = _create_root_ca_store(
+        args.ca_bundle_path, index_dir, use_certifi=args.use_certifi_store
+    )
+    cli_args["cache"] = (
+        create_cache(os.path.join(args.cache_dir, "downloads"))
+        if args.cache_dir
+        else None
+    )
+    cli_args["pool"] = ConnectionPool(timeout=args.timeout)
+    cli_args["retry"] = RetryPolicy(attempts=args.retries + 1)
+    cli_args["intermediate_store"] = (
+        IntermediateStore(args.intermediates) if args.intermediates else None
+    )
+
+    stats = metrics.StatsCollector() if args.stats else None
+    if stats is not None:
+        metrics.set_observer(stats)
+    try:
+        _run(args, cli_args)
+    finally:
+        if stats is not None:
+            metrics.set_observer(None)
+            sys.stderr.write(stats.report())
+
+
 if __name__ == "__main__":  # pragma: no cover
     main()
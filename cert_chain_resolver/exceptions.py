@@ -16,3 +16,24 @@ class RootCertificateNotFound(CertificateChainResolverError):
 
 class Python2IncompatibleFeature(CertificateChainResolverError):
     pass
+
+
+class DownloadUnavailable(CertificateChainResolverError):
+    """A CA issuer location failed recently or the circuit of its host is open, it is not downloaded"""
+
+    def __init__(self, url, reason):
+        super(DownloadUnavailable, self).__init__(
+            "{0} is unavailable: {1}".format(url, reason)
+        )
+        self.url = url
+        self.reason = reason
+
+
+class ResolveLimitExceeded(CertificateChainResolverError):
+    """Resolving stopped at the maximum chain length, a download timeout or the deadline.
+    ``chain`` holds the certificates resolved until then.
+    """
+
+    def __init__(self, message, chain):
+        super(ResolveLimitExceeded, self).__init__(message)
+        self.chain = chain
@@ -0,0 +1,185 @@
+"""Optional instrumentation of the resolve pipeline
+
+Nothing is measured until an observer is installed with :py:func:`set_observer`, the default observer
+ignores everything so the hooks cost a function call each.
+
+Spans measure the wall-clock time of their block and keep no other state, there is no stack of open spans. Spans of
+coroutines interleaving on one thread are therefore measured independently, a span around an ``await`` includes the
+time the loop spent on other tasks.
+
+Spans (seconds, see :py:meth:`Observer.record`):
+
+* ``resolve``: a complete :py:func:`resolve <cert_chain_resolver.resolver.resolve>` call
+* ``download``: getting a CA issuer, including the download cache
+* ``fetch``: the HTTP request of a download that missed the cache
+* ``cert.load``: parsing a DER/PKCS7/PEM certificate with :py:meth:`Cert.load <cert_chain_resolver.models.Cert.load>`
+* ``verify``: verifying a signature, outcomes served from the verification cache are not included
+* ``store.load_index``: loading or building the index of a :class:`FileSystemStore
+  <cert_chain_resolver.castore.file_system.FileSystemStore>`
+* ``store.find_issuer``: finding the root in a CA store, including verifying the candidates
+
+Counters (see :py:meth:`Observer.count`):
+
+* ``download.cache_hits``, ``download.cache_misses``, ``download.not_modified`` and ``download.bytes``
+* ``download.retries``: failed downloads attempted again by a :class:`RetryPolicy
+  <cert_chain_resolver.retry.RetryPolicy>`
+* ``download.negative_hits``: downloads refused because the URL failed recently
+* ``download.circuit_open``: downloads refused because the circuit breaker of the host is open
+* ``download.bundled_hops``: CA issuers taken from a PKCS7 downloaded for an earlier hop instead of downloading them
+* ``verify.cache_hits``
+* ``intermediates.hits`` and ``intermediates.misses``: issuers found in the intermediate store of a resolve
+* ``store.candidates``: issuer candidates a CA store verified
+* ``store.reloads``: bundles a :class:`FileSystemStore <cert_chain_resolver.castore.file_system.FileSystemStore>`
+  indexed again after they changed
+* ``store.files_read``: files a :class:`DirectoryStore <cert_chain_resolver.castore.directory.DirectoryStore>` read
+"""
+
+import threading
+import time
+
+try:
+    from typing import Any, Dict, List, Optional
+except ImportError:  # pragma: no cover
+    pass
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+class Observer(object):
+    """Receives the spans and counters of the resolve pipeline.
+
+    Subclass it and install it with :py:func:`set_observer`. Methods are called from every thread that resolves,
+    so implementations must be thread-safe.
+    """
+
+    enabled = True
+
+    def record(self, name, seconds):
+        # type: (str, float) -> None
+        """Called when the span name finished after seconds"""
+
+    def count(self, name, value=1):
+        # type: (str, int) -> None
+        """Called when the counter name is incremented by value"""
+
+
+class StatsCollector(Observer):
+    """Observer aggregating the number of calls, the total and the maximum duration per span and the
+    sum per counter
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._lock = threading.Lock()
+        self.spans = {}  # type: Dict[str, List[Any]]
+        self.counters = {}  # type: Dict[str, int]
+
+    def record(self, name, seconds):
+        # type: (str, float) -> None
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+
+    def count(self, name, value=1):
+        # type: (str, int) -> None
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        # type: () -> str
+        """Human readable table of the spans and counters"""
+        lines = [
+            "{0:<20}{1:>8}{2:>12}{3:>12}{4:>12}".format(
+                "span", "calls", "total ms", "mean ms", "max ms"
+            )
+        ]
+        with self._lock:
+            for name, (calls, total, longest) in sorted(self.spans.items()):
+                lines.append(
+                    "{0:<20}{1:>8}{2:>12.2f}{3:>12.2f}{4:>12.2f}".format(
+                        name, calls, total * 1e3, total / calls * 1e3, longest * 1e3
+                    )
+                )
+            if self.counters:
+                lines.append("")
+                lines.append("{0:<20}{1:>8}".format("counter", "value"))
+                for name, value in sorted(self.counters.items()):
+                    lines.append("{0:<20}{1:>8}".format(name, value))
+        return "\n".join(lines) + "\n"
+
+
+class _NoopObserver(Observer):
+    enabled = False
+
+
+class _Span(object):
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        # type: (str) -> None
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        # type: () -> _Span
+        self.started = _clock()
+        return self
+
+    def __exit__(self, *exc):
+        # type: (Any) -> None
+        _observer.record(self.name, _clock() - self.started)
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        # type: () -> _NoopSpan
+        return self
+
+    def __exit__(self, *exc):
+        # type: (Any) -> None
+        pass
+
+
+_noop_span = _NoopSpan()
+_observer = _NoopObserver()  # type: Observer
+
+
+def set_observer(observer):
+    # type: (Optional[Observer]) -> Observer
+    """Install observer for the whole process, None restores the default that ignores everything.
+
+    Returns:
+        The previously installed observer
+    """
+    global _observer
+    previous = _observer
+    _observer = observer if observer is not None else _NoopObserver()
+    return previous
+
+
+def get_observer():
+    # type: () -> Observer
+    """The installed observer"""
+    return _observer
+
+
+def span(name):
+    # type: (str) -> Any
+    """Context manager timing its block as the span name"""
+    if not _observer.enabled:
+        return _noop_span
+    return _Span(name)
+
+
+def count(name, value=1):
+    # type: (str, int) -> None
+    """Increment the counter name by value"""
+    if _observer.enabled:
+        _observer.count(name, value)
@@ -1,9 +1,20 @@
+from cert_chain_resolver import metrics
+from cert_chain_resolver.cache import VerificationCache
 from cert_chain_resolver.exceptions import MissingCertProperty
-from cert_chain_resolver.utils import load_ascii_to_x509, load_bytes_to_x509
+from cert_chain_resolver.utils import (
+    FORMAT_PKCS7_DER,
+    FORMAT_PKCS7_PEM,
+    iter_certificate_blocks,
+    iter_pem_x509,
+    load_ascii_to_x509,
+    load_bytes_to_x509,
+    load_bytes_to_x509_list,
+    sniff_format,
+)
 from cryptography import x509
 from cryptography.x509.oid import ExtensionOID, AuthorityInformationAccessOID, NameOID
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
 from cryptography.hazmat.primitives.asymmetric.ec import ECDSA, EllipticCurvePublicKey
 from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
@@ -11,10 +22,21 @@ from cryptography.exceptions import InvalidSignature
 
 
 import binascii
-
+import hashlib
 
 try:
-    from typing import List, Union, Optional, Type, Iterator, TYPE_CHECKING
+    from typing import (
+        Any,
+        Dict,
+        IO,
+        Iterable,
+        List,
+        Union,
+        Optional,
+        Type,
+        Iterator,
+        TYPE_CHECKING,
+    )
 
     if TYPE_CHECKING:  # pragma: no cover
         import datetime
@@ -26,22 +48,63 @@ try:
 except NameError:
     unicode = str
 
+try:
+    from sys import intern
+except ImportError:  # pragma: no cover
+
+    def intern(string):  # type: ignore
+        # Python 2 only interns byte strings, the names are unicode
+        return string
+
 
-class Cert:
+verification_cache = VerificationCache()
+"""Outcomes of :py:meth:`Cert.is_issued_by`, shared by all certificates. Set ``verification_cache.enabled = False``
+to always verify the signature."""
+
+
+class Cert(object):
     """The :class:`Cert <Cert>` object, which is a convenience
     wrapper for interacting with the underlying :py:class:`cryptography.x509.Certificate` object
 
+    Derived properties that are used while building chains are computed once and kept on the object.
+
     Args:
         x509_obj: An instance of :py:class:`cryptography.x509.Certificate`
     Raises:
         TypeError: given type is not an instance of :py:class:`cryptography.x509.Certificate`
     """
 
+    __slots__ = (
+        "_x509",
+        "_subject",
+        "_issuer",
+        "_subject_der",
+        "_issuer_der",
+        "_fingerprint",
+        "_is_ca",
+        "_ca_issuer_access_location",
+        "_subject_key_identifier",
+        "_authority_key_identifier",
+        "_public_key_hash",
+    )
+
     def __init__(self, x509_obj):
         # type: (x509.Certificate) -> None
         if not isinstance(x509_obj, x509.Certificate):
             raise TypeError("Argument must be a x509 Certificate object")
         self._x509 = x509_obj
+        self._subject = None  # type: Optional[str]
+        self._issuer = None  # type: Optional[str]
+        self._subject_der = None  # type: Optional[bytes]
+        self._issuer_der = None  # type: Optional[bytes]
+        # The raw sha256 digest, half the size of its hex string
+        self._fingerprint = None  # type: Optional[bytes]
+        self._is_ca = None  # type: Optional[bool]
+        # An empty string marks a missing value, None that it has not been computed yet
+        self._ca_issuer_access_location = None  # type: Optional[str]
+        self._subject_key_identifier = None  # type: Optional[str]
+        self._authority_key_identifier = None  # type: Optional[str]
+        self._public_key_hash = None  # type: Optional[str]
 
     def __repr__(self):
         # type: () -> str
@@ -53,19 +116,40 @@ class Cert:
         # type: (object) -> bool
         if not isinstance(other, Cert):
             return NotImplemented
-        return self.fingerprint == other.fingerprint
+        return self._fingerprint_digest() == other._fingerprint_digest()
 
     @property
     def issuer(self):
         # type: () -> str
         """RFC4515 formatted string of the issuer field from the underlying :py:class:`cryptography.x509.Certificate` object"""
-        return self._x509.issuer.rfc4514_string()
+        if self._issuer is None:
+            # Interned, as many certificates share the same issuer
+            self._issuer = intern(self._x509.issuer.rfc4514_string())
+        return self._issuer
 
     @property
     def subject(self):
         # type: () -> str
         """RFC4515 formatted string of the subject field from the underlying :py:class:`cryptography.x509.Certificate` object"""
-        return self._x509.subject.rfc4514_string()
+        if self._subject is None:
+            self._subject = intern(self._x509.subject.rfc4514_string())
+        return self._subject
+
+    @property
+    def issuer_der(self):
+        # type: () -> bytes
+        """DER encoded issuer field, equals the :py:attr:`subject_der` of the issuing certificate"""
+        if self._issuer_der is None:
+            self._issuer_der = self._x509.issuer.public_bytes()
+        return self._issuer_der
+
+    @property
+    def subject_der(self):
+        # type: () -> bytes
+        """DER encoded subject field"""
+        if self._subject_der is None:
+            self._subject_der = self._x509.subject.public_bytes()
+        return self._subject_der
 
     @property
     def common_name(self):
@@ -99,16 +183,18 @@ class Cert:
     def is_ca(self):
         # type: () -> bool
         """Checks whether the Certificate Authority bit has been set"""
-        try:
-            ext = self._x509.extensions.get_extension_for_oid(
-                ExtensionOID.BASIC_CONSTRAINTS
-            )
-            if isinstance(ext.value, x509.BasicConstraints):
-                # Runtime check needed to ensure proper type hinting
-                return ext.value.ca
-        except x509.extensions.ExtensionNotFound:
-            pass
-        return False
+        if self._is_ca is None:
+            self._is_ca = False
+            try:
+                ext = self._x509.extensions.get_extension_for_oid(
+                    ExtensionOID.BASIC_CONSTRAINTS
+                )
+                if isinstance(ext.value, x509.BasicConstraints):
+                    # Runtime check needed to ensure proper type hinting
+                    self._is_ca = ext.value.ca
+            except x509.extensions.ExtensionNotFound:
+                pass
+        return self._is_ca
 
     @property
     def is_root(self):
@@ -136,7 +222,7 @@ class Cert:
     def not_valid_before(self):
         # type: () -> datetime.datetime
         """Date from the underlying :py:class:`cryptography.x509.Certificate` object. returns the UTC version if cryptography version is 42.0 or higher"""
-        if hasattr(self._x509, 'not_valid_before_utc'):
+        if hasattr(self._x509, "not_valid_before_utc"):
             return self._x509.not_valid_before_utc
         else:
             return self._x509.not_valid_before
@@ -145,7 +231,7 @@ class Cert:
     def not_valid_after(self):
         # type: () -> datetime.datetime
         """Date from the underlying :py:class:`cryptography.x509.Certificate` object. returns the UTC version if cryptography version is 42.0 or higher"""
-        if hasattr(self._x509, 'not_valid_after_utc'):
+        if hasattr(self._x509, "not_valid_after_utc"):
             return self._x509.not_valid_after_utc
         else:
             return self._x509.not_valid_after
@@ -153,26 +239,77 @@ class Cert:
     @property
     def fingerprint(self):
         # type: () -> str
-        """ascii encoded sha256 fingerprint by calling :py:func:`get_fingerprint`"""
-        return self.get_fingerprint(hashes.SHA256)
+        """ascii encoded sha256 fingerprint, see :py:func:`get_fingerprint`"""
+        return binascii.hexlify(self._fingerprint_digest()).decode("ascii")
+
+    def _fingerprint_digest(self):
+        # type: () -> bytes
+        if self._fingerprint is None:
+            self._fingerprint = self._x509.fingerprint(hashes.SHA256())
+        return self._fingerprint
 
     @property
     def ca_issuer_access_location(self):
         # type: () -> Union[str, None]
         """URL that contains the CA issuer certificate"""
-        try:
-            aias = self._x509.extensions.get_extension_for_oid(
-                ExtensionOID.AUTHORITY_INFORMATION_ACCESS
-            )
-            if isinstance(aias.value, x509.AuthorityInformationAccess):
-                # Runtime check needed to ensure proper type hinting
-                for aia in aias.value:
-                    if AuthorityInformationAccessOID.CA_ISSUERS == aia.access_method:
-                        access_location = aia.access_location.value  # type: str
-                        return access_location
-        except x509.extensions.ExtensionNotFound:
-            pass
-        return None
+        if self._ca_issuer_access_location is None:
+            self._ca_issuer_access_location = ""
+            try:
+                aias = self._x509.extensions.get_extension_for_oid(
+                    ExtensionOID.AUTHORITY_INFORMATION_ACCESS
+                )
+                if isinstance(aias.value, x509.AuthorityInformationAccess):
+                    # Runtime check needed to ensure proper type hinting
+                    for aia in aias.value:
+                        if (
+                            AuthorityInformationAccessOID.CA_ISSUERS
+                            == aia.access_method
+                        ):
+                            access_location = aia.access_location.value  # type: str
+                            self._ca_issuer_access_location = access_location
+                            break
+            except x509.extensions.ExtensionNotFound:
+                pass
+        return self._ca_issuer_access_location or None
+
+    @property
+    def subject_key_identifier(self):
+        # type: () -> Optional[str]
+        """Hex encoded Subject Key Identifier extension or None when absent"""
+        if self._subject_key_identifier is None:
+            self._subject_key_identifier = ""
+            try:
+                ext = self._x509.extensions.get_extension_for_oid(
+                    ExtensionOID.SUBJECT_KEY_IDENTIFIER
+                )
+                if isinstance(ext.value, x509.SubjectKeyIdentifier):
+                    # Runtime check needed to ensure proper type hinting
+                    self._subject_key_identifier = binascii.hexlify(
+                        ext.value.digest
+                    ).decode("ascii")
+            except x509.extensions.ExtensionNotFound:
+                pass
+        return self._subject_key_identifier or None
+
+    @property
+    def authority_key_identifier(self):
+        # type: () -> Optional[str]
+        """Hex encoded key identifier of the Authority Key Identifier extension or None when absent"""
+        if self._authority_key_identifier is None:
+            self._authority_key_identifier = ""
+            try:
+                ext = self._x509.extensions.get_extension_for_oid(
+                    ExtensionOID.AUTHORITY_KEY_IDENTIFIER
+                )
+                if isinstance(ext.value, x509.AuthorityKeyIdentifier):
+                    # Runtime check needed to ensure proper type hinting
+                    if ext.value.key_identifier:
+                        self._authority_key_identifier = binascii.hexlify(
+                            ext.value.key_identifier
+                        ).decode("ascii")
+            except x509.extensions.ExtensionNotFound:
+                pass
+        return self._authority_key_identifier or None
 
     def get_fingerprint(self, _hash=hashes.SHA256):
         # type: (Type[hashes.HashAlgorithm]) -> str
@@ -188,9 +325,39 @@ class Cert:
         txt = binascii.hexlify(binary).decode("ascii")
         return txt
 
+    @property
+    def public_key_hash(self):
+        # type: () -> str
+        """Hex encoded sha256 of the DER encoded SubjectPublicKeyInfo"""
+        if self._public_key_hash is None:
+            spki = self._x509.public_key().public_bytes(
+                Encoding.DER, PublicFormat.SubjectPublicKeyInfo
+            )
+            self._public_key_hash = hashlib.sha256(spki).hexdigest()
+        return self._public_key_hash
+
     def is_issued_by(self, other):
         # type: (Cert) -> bool
-        """Verify if certificate is issued by the passed CA cert"""
+        """Verify if certificate is issued by the passed CA cert
+
+        Outcomes are kept in :py:data:`verification_cache`, so verifying the same pair again is free.
+        """
+        if not verification_cache.enabled:
+            with metrics.span("verify"):
+                return self._verify_signature(other)
+
+        key = (self._fingerprint_digest(), other.public_key_hash)
+        result = verification_cache.get(key)
+        if result is None:
+            with metrics.span("verify"):
+                result = self._verify_signature(other)
+            verification_cache.set(key, result)
+        else:
+            metrics.count("verify.cache_hits")
+        return result
+
+    def _verify_signature(self, other):
+        # type: (Cert) -> bool
         try:
             public_key = other._x509.public_key()
             hash_algorithm = self._x509.signature_hash_algorithm
@@ -229,6 +396,30 @@ class Cert:
         encoded = unicode(self._x509.public_bytes(encoding), "ascii")
         return encoded
 
+    def to_dict(self, include_pem=False):
+        # type: (bool) -> Dict[str, Any]
+        """JSON serializable representation of the certificate. The serial is a string, as it does
+        not fit the integers of most JSON parsers
+
+        Args:
+            include_pem: Add the PEM encoded certificate. Defaults to False.
+        """
+        data = {
+            "subject": self.subject,
+            "issuer": self.issuer,
+            "serial": str(self.serial),
+            "fingerprint": self.fingerprint,
+            "not_valid_before": self.not_valid_before.isoformat(),
+            "not_valid_after": self.not_valid_after.isoformat(),
+            "subject_alternative_names": self.subject_alternative_names,
+            "ca_issuer_access_location": self.ca_issuer_access_location,
+            "is_ca": self.is_ca,
+            "is_root": self.is_root,
+        }  # type: Dict[str, Any]
+        if include_pem:
+            data["pem"] = self.export()
+        return data
+
     @classmethod
     def load(cls, bytes_input):
         # type: (bytes) -> Cert
@@ -241,9 +432,45 @@ class Cert:
         Raises:
             :class:`ImproperlyFormattedCert <ImproperlyFormattedCert>`
         """
-        x509 = load_bytes_to_x509(bytes_input)
+        with metrics.span("cert.load"):
+            x509 = load_bytes_to_x509(bytes_input)
         return cls(x509)
 
+    @classmethod
+    def load_all(cls, bytes_input):
+        # type: (bytes) -> List[Cert]
+        """
+        Create a :class:`Cert <Cert>` object for every certificate in a PKCS7, in the order of the PKCS7.
+        Other formats hold a single certificate.
+
+        Args:
+            bytes_input :py:class:`bytes` PEM or DER
+
+        Raises:
+            :class:`ImproperlyFormattedCert <ImproperlyFormattedCert>`
+        """
+        if sniff_format(bytes_input) not in (FORMAT_PKCS7_DER, FORMAT_PKCS7_PEM):
+            return [cls.load(bytes_input)]
+        with metrics.span("cert.load"):
+            x509s = load_bytes_to_x509_list(bytes_input)
+        return [cls(x509) for x509 in x509s]
+
+    @classmethod
+    def load_stream(cls, source):
+        # type: (Union[IO[bytes], Iterable[bytes]]) -> Iterator[Cert]
+        """
+        Lazily create a :class:`Cert <Cert>` object for every PEM certificate (or certificate in a PEM PKCS7)
+        in source, memory use is bounded by the size of a single PEM block
+
+        Args:
+            source: Binary file object or an iterable of byte chunks
+
+        Raises:
+            :class:`ImproperlyFormattedCert <ImproperlyFormattedCert>`
+        """
+        for x509 in iter_pem_x509(source):
+            yield cls(x509)
+
 
 class CertificateChain:
     """Creates an iterable that contains a list of :class:`Cert <Cert>` objects.
@@ -256,7 +483,9 @@ class CertificateChain:
         # type: (Union[Optional[CertificateChain], List[Cert]]) -> None
         self._chain = [] if not chain else list(chain)  # type: List[Cert]
         self._fingerprints = (
-            set() if not chain else {x509_obj.fingerprint for x509_obj in chain}
+            set()
+            if not chain
+            else {x509_obj._fingerprint_digest() for x509_obj in chain}
         )
 
     def __iter__(self):
@@ -267,7 +496,7 @@ class CertificateChain:
     def __iadd__(self, x509_obj):
         # type: (Cert) -> CertificateChain
         self._chain.append(x509_obj)
-        self._fingerprints.add(x509_obj.fingerprint)
+        self._fingerprints.add(x509_obj._fingerprint_digest())
         return self
 
     def __len__(self):
@@ -276,7 +505,7 @@ class CertificateChain:
 
     def __contains__(self, x509_obj):
         # type: (Cert) -> bool
-        return self._fingerprints.__contains__(x509_obj.fingerprint)
+        return self._fingerprints.__contains__(x509_obj._fingerprint_digest())
 
     @property
     def leaf(self):
@@ -299,15 +528,35 @@ class CertificateChain:
             return self._chain[-1]
         return None
 
+    def certificates(self, include_root=False):
+        # type: (bool) -> List[Cert]
+        """The leaf followed by the intermediates and, when include_root is set, the root if it is present"""
+        root = [self.root] if include_root and self.root else []  # type: List[Cert]
+        return [self.leaf] + list(self.intermediates) + root
+
+    def to_dict(self, include_root=False, include_pem=False):
+        # type: (bool, bool) -> Dict[str, Any]
+        """JSON serializable representation of the chain
+
+        Args:
+            include_root: Add the root when it is present. Defaults to False.
+            include_pem: See :py:meth:`Cert.to_dict <Cert.to_dict>`
+        """
+        return {
+            "chain": [
+                c.to_dict(include_pem=include_pem)
+                for c in self.certificates(include_root)
+            ],
+            "root_found": self.root is not None,
+        }
+
     @classmethod
     def load_from_pem(cls, input_bytes):
         # type: (bytes) -> CertificateChain
         """Create a :py:class:`CertificateChain <CertificateChain>` object from a PEM formatted file"""
-        begin = b"-----BEGIN CERTIFICATE-----\n"
         chain = cls()
-        for strip_pem in filter(len, input_bytes.split(begin)):
-            pem = begin + strip_pem
-            chain += Cert(load_ascii_to_x509(pem))
+        for _, block in iter_certificate_blocks(input_bytes):
+            chain += Cert(load_ascii_to_x509(block.tobytes()))
         if chain.leaf.is_ca and not chain._chain[-1].is_ca:
             # if CA bit is not set on the last certificate, reverse the chain
             chain._chain.reverse()
@@ -1,11 +1,28 @@
-from contextlib import closing
+from collections import deque
+from email.message import Message
+import socket
+import threading
+import time
 
+from cert_chain_resolver import metrics
+from cert_chain_resolver.cache import CacheEntry, MemoryCache
+from cert_chain_resolver.exceptions import (
+    Python2IncompatibleFeature,
+    ResolveLimitExceeded,
+    RootCertificateNotFound,
+)
 from cert_chain_resolver.models import CertificateChain, Cert
+from cert_chain_resolver.pool import default_pool
 
 try:
-    from urllib.request import urlopen, Request
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+except ImportError:  # pragma: no cover
+    ThreadPoolExecutor = None  # type: ignore
+
+try:
+    from urllib.error import HTTPError
 except ImportError:
-    from urllib2 import urlopen, Request  # type: ignore
+    from urllib2 import HTTPError  # type: ignore
 
 try:
     unicode  # type: ignore
@@ -13,51 +30,380 @@ except NameError:
     unicode = str
 
 try:
-    from typing import Any, Optional
+    from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+    from concurrent.futures import Future
     from cert_chain_resolver.castore.base_store import CAStore
+    from cert_chain_resolver.cache import DownloadCache
+    from cert_chain_resolver.pool import ConnectionPool
+    from cert_chain_resolver.retry import RetryPolicy
 except ImportError:  # pragma: no cover
     pass
 
 
-def _download(url):
-    # type: (str) -> Any
-    req = Request(url, headers={"User-Agent": "Cert/fixer"})
+class _Call:
+    def __init__(self):
+        # type: () -> None
+        self.done = threading.Event()
+        self.result = None  # type: Any
+        self.error = None  # type: Optional[BaseException]
+
+
+class _InflightRequests:
+    """Coalesces concurrent calls for the same key, the first caller does the work and
+    every caller that arrives while it is running receives the same result (or exception)
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._lock = threading.Lock()
+        self._calls = {}  # type: Dict[str, _Call]
+
+    def do(self, key, fn, timeout=None):
+        # type: (str, Callable[[], Any], Optional[float]) -> Any
+        """Run fn, or wait for the caller already running it. Waiting longer than timeout
+        raises :py:class:`socket.timeout`
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            if not call.done.wait(timeout):
+                raise socket.timeout("Timed out waiting for {0}".format(key))
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+_inflight = _InflightRequests()
+
+DEFAULT_MAX_DEPTH = 10
+
+
+def _download(url, cache=None, pool=None, timeout=None, retry=None, deadline=None):
+    # type: (str, Optional[DownloadCache], Optional[ConnectionPool], Optional[float], Optional[RetryPolicy], Optional[float]) -> Any
+    with metrics.span("download"):
+        entry = cache.get(url) if cache is not None else None
+        if entry is not None and cache is not None and cache.is_fresh(entry):
+            metrics.count("download.cache_hits")
+            return entry.content
+
+        if cache is not None:
+            metrics.count("download.cache_misses")
+
+        def attempt(timeout):
+            # type: (Optional[float]) -> Any
+            return _fetch(url, cache, entry, pool or default_pool, timeout)
+
+        def fetch():
+            # type: () -> Any
+            if retry is None:
+                return attempt(timeout)
+            # Only the leader retries and records the outcome, the callers it coalesces share that single outcome
+            return retry.call(url, attempt, timeout=timeout, deadline=deadline)
+
+        wait = timeout
+        if retry is not None and timeout is not None:
+            # The leader might use up every attempt
+            wait = retry.attempts * (timeout + retry.max_backoff)
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.time())
+            wait = remaining if wait is None else min(wait, remaining)
+        return _inflight.do(url, fetch, timeout=wait)
+
+
+def _fetch(url, cache, entry, pool, timeout=None):
+    # type: (str, Optional[DownloadCache], Optional[CacheEntry], ConnectionPool, Optional[float]) -> Any
+    with metrics.span("fetch"):
+        response = pool.request(
+            url, headers=entry.validators if entry else None, timeout=timeout
+        )
+    if response.status == 304 and entry is not None:
+        # Not modified, the cached copy is still valid
+        metrics.count("download.not_modified")
+        content = entry.content
+    elif 200 <= response.status < 300:
+        metrics.count("download.bytes", len(response.body))
+        content = response.body
+    else:
+        raise HTTPError(url, response.status, "Download failed", Message(), None)
+
+    if cache is not None:
+        cache.set(
+            url,
+            CacheEntry(
+                content,
+                etag=response.headers.get("etag") or (entry.etag if entry else None),
+                last_modified=response.headers.get("last-modified")
+                or (entry.last_modified if entry else None),
+            ),
+        )
+    return content
 
-    with closing(urlopen(req)) as resp:
-        return resp.read()
 
+def _find_local_issuer(intermediate_store, cert):
+    # type: (CAStore, Cert) -> Optional[Cert]
+    try:
+        issuer = intermediate_store.find_issuer(cert)
+    except RootCertificateNotFound:
+        metrics.count("intermediates.misses")
+        return None
+    metrics.count("intermediates.hits")
+    return issuer
 
-def resolve(bytes_cert, _chain=None, root_ca_store=None):
-    # type: (bytes, Optional[CertificateChain], Optional[CAStore]) -> CertificateChain
-    """A recursive function that follows the CA issuer chain
+
+def _issuer_path(cert, certs):
+    # type: (Cert, List[Cert]) -> List[Cert]
+    """Orders the certificates of a CA issuer response by issuer linkage, starting at the issuer of cert
+
+    Some CAs serve a PKCS7 holding the whole upward path, the certificates after the issuer are used for
+    the next hops instead of downloading them. When no certificate verifiably issued cert the first one
+    is returned, like for a single certificate.
+    """
+    if len(certs) == 1:
+        return certs
+    path = []  # type: List[Cert]
+    remaining = list(certs)
+    current = cert
+    while remaining:
+        issuer = next(
+            (
+                c
+                for c in remaining
+                if c.subject_der == current.issuer_der and current.is_issued_by(c)
+            ),
+            None,
+        )
+        if issuer is None:
+            break
+        path.append(issuer)
+        remaining.remove(issuer)
+        if issuer.is_root:
+            break
+        current = issuer
+    return path or certs[:1]
+
+
+def resolve(
+    bytes_cert,
+    _chain=None,
+    root_ca_store=None,
+    cache=None,
+    pool=None,
+    max_depth=DEFAULT_MAX_DEPTH,
+    timeout=None,
+    deadline=None,
+    retry=None,
+    intermediate_store=None,
+):
+    # type: (bytes, Optional[CertificateChain], Optional[CAStore], Optional[DownloadCache], Optional[ConnectionPool], Optional[int], Optional[float], Optional[float], Optional[RetryPolicy], Optional[CAStore]) -> CertificateChain
+    """Follow the CA issuer chain of a certificate
 
     Args:
         bytes_cert: A DER/PKCS7/PEM certificate
         _chain: Chain to complete. Defaults to None.
         root_ca_store: A CAStore to use for completing the chain with a root certificate in case
             the intermediates do not provide a location
+        cache: A :class:`DownloadCache <cert_chain_resolver.cache.DownloadCache>` used to avoid
+            downloading the same CA issuer certificate twice. Defaults to None.
+        pool: A :class:`ConnectionPool <cert_chain_resolver.pool.ConnectionPool>` for downloading the CA issuers.
+            Defaults to a pool shared by all calls.
+        max_depth: Maximum number of certificates followed through their CA issuer location, None for no limit.
+            The root found in root_ca_store is not counted. Defaults to 10.
+        timeout: Seconds a single CA issuer download may take. Defaults to the timeout of the pool.
+        deadline: Seconds the whole resolve may take, downloads are cut short when it is reached. Defaults to None.
+        retry: A :class:`RetryPolicy <cert_chain_resolver.retry.RetryPolicy>` for failing downloads, share it
+            between resolves so URLs and hosts that keep failing fail fast. Defaults to None, no retries.
+        intermediate_store: A CAStore, typically an :class:`IntermediateStore
+            <cert_chain_resolver.castore.intermediates.IntermediateStore>`, consulted for the issuer of every
+            certificate before downloading it. Only misses go to the network. Defaults to None.
+
+    Raises:
+        :class:`ResolveLimitExceeded <cert_chain_resolver.exceptions.ResolveLimitExceeded>`: when max_depth,
+            timeout or deadline is exceeded, its ``chain`` holds the certificates resolved so far
 
     Returns:
         All resolved certificates in chain
     """
-    cert = Cert.load(bytes_cert)
+    with metrics.span("resolve"):
+        chain = _chain if _chain is not None else CertificateChain()
+        expires = time.time() + deadline if deadline is not None else None
+
+        cert = Cert.load(bytes_cert)
+        # Issuers of the next hops, from a PKCS7 holding more than the issuer
+        pending = []  # type: List[Cert]
+        while True:
+            if cert in chain:
+                # Prevent looping in case the cert is self-referential
+                return chain
+            chain += cert
+
+            parent = None  # type: Optional[Cert]
+            if pending:
+                parent = pending.pop(0)
+                metrics.count("download.bundled_hops")
+            elif intermediate_store is not None and not cert.is_root:
+                parent = _find_local_issuer(intermediate_store, cert)
+            location = cert.ca_issuer_access_location or ""
+            if parent is None and not location:
+                break
+            if max_depth is not None and len(chain) >= max_depth:
+                raise ResolveLimitExceeded(
+                    "Chain is longer than {0} certificates".format(max_depth), chain
+                )
+            if parent is not None:
+                cert = parent
+                continue
+
+            hop_timeout = timeout
+            if expires is not None:
+                remaining = expires - time.time()
+                if remaining <= 0:
+                    raise ResolveLimitExceeded(
+                        "Deadline of {0}s exceeded".format(deadline), chain
+                    )
+                if hop_timeout is None or remaining < hop_timeout:
+                    hop_timeout = remaining
+
+            try:
+                parent_cert = _download(
+                    location,
+                    cache=cache,
+                    pool=pool,
+                    timeout=hop_timeout,
+                    retry=retry,
+                    deadline=expires,
+                )
+            except socket.timeout:
+                raise ResolveLimitExceeded(
+                    "Downloading {0} timed out".format(location), chain
+                )
+            if not parent_cert:
+                break
+            path = _issuer_path(cert, Cert.load_all(parent_cert))
+            cert, pending = path[0], path[1:]
+
+        if not chain.root and root_ca_store:
+            chain += root_ca_store.find_issuer(cert)
+
+        return chain
+
+
+def resolve_many(
+    certs,
+    max_workers=8,
+    root_ca_store=None,
+    cache=None,
+    ordered=True,
+    pool=None,
+    max_depth=DEFAULT_MAX_DEPTH,
+    timeout=None,
+    deadline=None,
+    retry=None,
+    intermediate_store=None,
+    return_exceptions=False,
+):
+    # type: (Iterable[bytes], int, Optional[CAStore], Optional[DownloadCache], bool, Optional[ConnectionPool], Optional[int], Optional[float], Optional[float], Optional[RetryPolicy], Optional[CAStore], bool) -> Iterator[Any]
+    """Resolve many certificates concurrently using a thread pool
+
+    Downloads of the same CA issuer location are shared between all workers: a location is fetched
+    once and every worker waiting for it receives the same response.
+
+    Args:
+        certs: Iterable of DER/PKCS7/PEM certificates, consumed lazily
+        max_workers: Number of threads resolving chains. Defaults to 8.
+        root_ca_store: See :py:func:`resolve`
+        cache: See :py:func:`resolve`. Defaults to a new :class:`MemoryCache <cert_chain_resolver.cache.MemoryCache>`
+            shared by all workers.
+        ordered: Yield the chains in input order, when False they are yielded as soon as they are resolved.
+            Defaults to True.
+        pool: See :py:func:`resolve`
+        max_depth: See :py:func:`resolve`
+        timeout: See :py:func:`resolve`
+        deadline: See :py:func:`resolve`, applies to every certificate from the moment a worker picks it up
+        retry: See :py:func:`resolve`, shared by all workers
+        intermediate_store: See :py:func:`resolve`
+        return_exceptions: Yield the exception of a failing certificate in place of its chain and carry on with
+            the others, like :py:func:`asyncio.gather`. Defaults to False, the first failing certificate raises its
+            exception when its result is reached.
+
+    Raises:
+        :class:`Python2IncompatibleFeature <cert_chain_resolver.exceptions.Python2IncompatibleFeature>`: when
+            :py:mod:`concurrent.futures` is not available
+
+    Returns:
+        Generator of :class:`CertificateChain <cert_chain_resolver.models.CertificateChain>`, or of exceptions
+        for the failing certificates with return_exceptions. Closing it early cancels the certificates that did
+        not start resolving yet and waits for the ones that did.
+    """
+    if ThreadPoolExecutor is None:  # pragma: no cover
+        raise Python2IncompatibleFeature("resolve_many requires concurrent.futures")
 
-    if not _chain:
-        _chain = CertificateChain()
+    if cache is None:
+        cache = MemoryCache()
 
-    if cert in _chain:
-        # Prevent recursion in case the cert is self-referential
-        return _chain
+    def _resolve(bytes_cert):
+        # type: (bytes) -> CertificateChain
+        return resolve(
+            bytes_cert,
+            root_ca_store=root_ca_store,
+            cache=cache,
+            pool=pool,
+            max_depth=max_depth,
+            timeout=timeout,
+            deadline=deadline,
+            retry=retry,
+            intermediate_store=intermediate_store,
+        )
 
-    _chain += cert
+    def _outcome(future):
+        # type: (Future[CertificateChain]) -> Any
+        if not return_exceptions:
+            return future.result()
+        try:
+            return future.result()
+        except Exception as e:
+            return e
 
-    parent_cert = None
-    if cert.ca_issuer_access_location:
-        parent_cert = _download(cert.ca_issuer_access_location)
+    # Limit the amount of queued work, so huge inputs are never read into memory at once
+    window = max_workers * 2
+    queue = deque()  # type: deque[Future[CertificateChain]]
+    pending = set()  # type: set[Future[CertificateChain]]
 
-    if parent_cert:
-        return resolve(parent_cert, _chain=_chain, root_ca_store=root_ca_store)
-    elif not _chain.root and root_ca_store:
-        _chain += root_ca_store.find_issuer(cert)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for bytes_cert in certs:
+                future = executor.submit(_resolve, bytes_cert)
+                if ordered:
+                    queue.append(future)
+                    if len(queue) >= window:
+                        yield _outcome(queue.popleft())
+                else:
+                    pending.add(future)
+                    if len(pending) >= window:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield _outcome(future)
 
-    return _chain
+            while queue:
+                yield _outcome(queue.popleft())
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _outcome(future)
+        finally:
+            for future in list(queue) + list(pending):
+                future.cancel()
@@ -0,0 +1,171 @@
+import random
+import socket
+import threading
+import time
+
+from cert_chain_resolver import metrics
+from cert_chain_resolver.cache import _LRU
+from cert_chain_resolver.exceptions import DownloadUnavailable
+
+try:
+    from http.client import HTTPException
+    from urllib.error import HTTPError
+    from urllib.parse import urlsplit
+except ImportError:  # pragma: no cover
+    from httplib import HTTPException  # type: ignore
+    from urllib2 import HTTPError  # type: ignore
+    from urlparse import urlsplit  # type: ignore
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+except ImportError:  # pragma: no cover
+    pass
+
+
+class RetryPolicy(object):
+    """Retries failing CA issuer downloads with exponential backoff and keeps one bad CA endpoint from slowing down
+    every resolve. Safe to share between threads, share one between resolves to share what it learned.
+
+    * Connection errors, timeouts and the ``retry_statuses`` are retried, other HTTP errors fail at once.
+    * A URL that still fails after all attempts fails fast for ``negative_ttl`` seconds, raising
+      :class:`DownloadUnavailable <cert_chain_resolver.exceptions.DownloadUnavailable>`.
+    * After ``failure_threshold`` consecutive connection errors, timeouts or ``retry_statuses`` the circuit of the host opens, its downloads fail fast
+      until ``reset_timeout`` seconds have passed. Then a single download is let through, the circuit
+      closes again when it succeeds.
+
+    Args:
+        attempts: Number of attempts per download, 1 disables retrying. Defaults to 3.
+        backoff: Seconds to wait before the first retry, doubled for every next retry. Defaults to 0.5.
+        max_backoff: Upper bound of a single wait. Defaults to 10.
+        jitter: Fraction of every wait that is randomized, so clients don't retry in lockstep. Defaults to 0.5.
+        negative_ttl: Seconds a failed URL fails fast, 0 disables it. Defaults to 60.
+        failure_threshold: Consecutive failures of a host that open its circuit, 0 disables it. Defaults to 5.
+        reset_timeout: Seconds the circuit of a host stays open. Defaults to 30.
+        retry_statuses: HTTP statuses that are retried. Defaults to 408, 429, 500, 502, 503 and 504.
+        maxsize: Maximum number of failed URLs remembered. Defaults to 1024.
+    """
+
+    def __init__(
+        self,
+        attempts=3,
+        backoff=0.5,
+        max_backoff=10,
+        jitter=0.5,
+        negative_ttl=60,
+        failure_threshold=5,
+        reset_timeout=30,
+        retry_statuses=(408, 429, 500, 502, 503, 504),
+        maxsize=1024,
+    ):
+        # type: (int, float, float, float, float, int, float, Tuple[int, ...], int) -> None
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.negative_ttl = negative_ttl
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retry_statuses = retry_statuses
+        self._failed = _LRU(maxsize)
+        self._lock = threading.Lock()
+        self._hosts = {}  # type: Dict[str, List[Any]]
+
+    def call(self, url, fn, timeout=None, deadline=None):
+        # type: (str, Callable[[Optional[float]], Any], Optional[float], Optional[float]) -> Any
+        """Call ``fn(timeout)`` to download url until it succeeds or the attempts are used up
+
+        Args:
+            url: The downloaded URL, its host is used for circuit breaking
+            fn: Performs a single attempt, receives the timeout of that attempt
+            timeout: Seconds a single attempt may take. Defaults to None.
+            deadline: Unix timestamp after which no attempt is started and no backoff exceeds. Defaults to None.
+
+        Raises:
+            :class:`DownloadUnavailable <cert_chain_resolver.exceptions.DownloadUnavailable>`: when url failed
+                recently or the circuit of its host is open. Otherwise the error of the last attempt.
+        """
+        failed = self._failed.get(url)
+        if failed is not None:
+            failed_until, reason = failed
+            if time.time() < failed_until:
+                metrics.count("download.negative_hits")
+                raise DownloadUnavailable(url, reason)
+            self._failed.pop(url)
+
+        host = urlsplit(url).netloc
+        for attempt in range(self.attempts):
+            self._acquire(url, host)
+            attempt_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise socket.timeout("Deadline reached before downloading " + url)
+                if attempt_timeout is None or remaining < attempt_timeout:
+                    attempt_timeout = remaining
+
+            try:
+                result = fn(attempt_timeout)
+            except (HTTPError, HTTPException, socket.error) as e:
+                retryable = not isinstance(e, HTTPError) or (
+                    e.code in self.retry_statuses
+                )
+                if retryable:
+                    self._record_failure(host)
+                else:
+                    # The host answered, only the URL is broken
+                    self._record_success(host)
+                wait = self._wait(attempt)
+                if (
+                    not retryable
+                    or attempt + 1 == self.attempts
+                    or (deadline is not None and time.time() + wait >= deadline)
+                ):
+                    if self.negative_ttl > 0:
+                        self._failed.set(url, (time.time() + self.negative_ttl, str(e)))
+                    raise
+                metrics.count("download.retries")
+                time.sleep(wait)
+            else:
+                self._record_success(host)
+                return result
+
+    def clear(self):
+        # type: () -> None
+        """Forget the failed URLs and close every circuit"""
+        self._failed.clear()
+        with self._lock:
+            self._hosts.clear()
+
+    def _wait(self, attempt):
+        # type: (int) -> float
+        wait = min(self.max_backoff, self.backoff * (1 << attempt))
+        return wait * (1 - self.jitter * random.random())
+
+    def _acquire(self, url, host):
+        # type: (str, str) -> None
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state[0] < self.failure_threshold:
+                return
+            if time.time() - state[1] < self.reset_timeout:
+                metrics.count("download.circuit_open")
+                raise DownloadUnavailable(
+                    url, "Circuit of {0} is open after repeated failures".format(host)
+                )
+            # Half open: let this download through, the others keep failing fast until it is done
+            state[1] = time.time()
+
+    def _record_failure(self, host):
+        # type: (str) -> None
+        with self._lock:
+            state = self._hosts.setdefault(host, [0, 0.0])
+            state[0] += 1
+            if state[0] >= self.failure_threshold:
+                state[1] = time.time()
+
+    def _record_success(self, host):
+        # type: (str) -> None
+        with self._lock:
+            self._hosts.pop(host, None)
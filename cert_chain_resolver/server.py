@@ -0,0 +1,268 @@
+"""Long running resolver that keeps the CA store, the download cache and the connection pool warm"""
+
+import json
+import math
+import os
+import socket
+import stat
+
+from cert_chain_resolver.cache import MemoryCache
+from cert_chain_resolver.exceptions import (
+    CertificateChainResolverError,
+    DownloadUnavailable,
+    ResolveLimitExceeded,
+)
+from cert_chain_resolver.models import Cert
+from cert_chain_resolver.pool import ConnectionPool
+from cert_chain_resolver.resolver import DEFAULT_MAX_DEPTH, resolve
+from cert_chain_resolver.retry import RetryPolicy
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.error import HTTPError
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer  # type: ignore
+    from SocketServer import ThreadingMixIn, UnixStreamServer  # type: ignore
+    from urllib2 import HTTPError  # type: ignore
+    from urlparse import parse_qs, urlsplit  # type: ignore
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Union
+    from cert_chain_resolver.castore.base_store import CAStore
+    from cert_chain_resolver.cache import DownloadCache
+except ImportError:  # pragma: no cover
+    pass
+
+
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class ResolverRequestHandler(BaseHTTPRequestHandler):
+    """Serves the resolver API
+
+    * ``GET /health``: ``{"status": "ok"}``
+    * ``POST /resolve``: Body is a PEM/DER/PKCS7 certificate, responds with the PEM bundle. Query parameters:
+      ``include_root=1`` adds the root when found, ``format=json`` responds with the record of ``--format json``
+      and ``include_pem=1`` adds the PEM to that record. ``max_depth`` and ``deadline`` limit the resolve, they are
+      capped at the limits of the server. Exceeding them responds with 504.
+    * ``POST /inspect``: Body is one or more certificates, responds with a JSON list of their properties
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "cert-chain-resolver"
+
+    def address_string(self):
+        # type: () -> str
+        client_address = self.client_address  # type: Any
+        if not client_address:
+            # Unix sockets have no client address
+            return "unix"
+        return BaseHTTPRequestHandler.address_string(self)
+
+    def log_message(self, format, *args):
+        # type: (str, Any) -> None
+        if not getattr(self.server, "quiet", False):
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        # type: () -> None
+        if urlsplit(self.path).path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        # type: () -> None
+        parts = urlsplit(self.path)
+        params = parse_qs(parts.query)
+        handler = {"/resolve": self._resolve, "/inspect": self._inspect}.get(parts.path)
+        if handler is None:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body can't be skipped, the connection is unusable
+            self.close_connection = True
+            self._send_json(400, {"error": "Invalid Content-Length"})
+            return
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self._send_json(413, {"error": "Body is too large"})
+            return
+        body = self.rfile.read(length)
+
+        try:
+            handler(body, params)
+        except ResolveLimitExceeded as e:
+            self._send_json(504, {"error": str(e)})
+        except DownloadUnavailable as e:
+            self._send_json(502, {"error": str(e)})
+        except (CertificateChainResolverError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+        except (HTTPError, socket.error) as e:
+            self._send_json(
+                502, {"error": "Downloading a CA issuer failed: {0}".format(e)}
+            )
+        except Exception as e:
+            self.log_error("Failed handling %s: %r", self.path, e)
+            self._send_json(500, {"error": "Internal server error"})
+
+    def _resolve(self, body, params):
+        # type: (bytes, Dict[str, List[str]]) -> None
+        include_root = _flag(params, "include_root")
+        # A request can tighten the limits of the server, never lift them
+        max_depth = self.server.max_depth  # type: ignore
+        if "max_depth" in params:
+            max_depth = _min(max_depth, _limit(params, "max_depth", int))
+        deadline = self.server.deadline  # type: ignore
+        if "deadline" in params:
+            deadline = _min(deadline, _limit(params, "deadline", float))
+        chain = resolve(
+            body,
+            root_ca_store=self.server.root_ca_store,  # type: ignore
+            cache=self.server.cache,  # type: ignore
+            pool=self.server.pool,  # type: ignore
+            retry=self.server.retry,  # type: ignore
+            intermediate_store=self.server.intermediate_store,  # type: ignore
+            max_depth=max_depth,
+            deadline=deadline,
+        )
+        if params.get("format", ["pem"])[0] == "json":
+            record = chain.to_dict(include_root, _flag(params, "include_pem"))
+            self._send_json(200, record)
+        else:
+            pem = "".join(c.export() for c in chain.certificates(include_root))
+            self._send(200, "application/x-pem-file", pem.encode("ascii"))
+
+    def _inspect(self, body, params):
+        # type: (bytes, Dict[str, List[str]]) -> None
+        certs = list(Cert.load_stream([body])) or Cert.load_all(body)
+        include_pem = _flag(params, "include_pem")
+        self._send_json(200, [c.to_dict(include_pem=include_pem) for c in certs])
+
+    def _send_json(self, status, data):
+        # type: (int, Any) -> None
+        self._send(status, "application/json", json.dumps(data).encode("utf-8"))
+
+    def _send(self, status, content_type, body):
+        # type: (int, str, bytes) -> None
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _flag(params, name):
+    # type: (Dict[str, List[str]], str) -> bool
+    return params.get(name, ["0"])[0].lower() in ("1", "true", "yes")
+
+
+def _limit(params, name, parse):
+    # type: (Dict[str, List[str]], str, Callable[[str], Any]) -> Any
+    """Positive, finite number in the query parameter name
+
+    Raises:
+        ValueError: When the parameter is not such a number
+    """
+    try:
+        value = parse(params[name][0])
+    except (ValueError, OverflowError):
+        value = None
+    if value is None or math.isnan(value) or math.isinf(value) or value <= 0:
+        raise ValueError("{0} must be a positive number".format(name))
+    return value
+
+
+def _min(limit, requested):
+    # type: (Any, Any) -> Any
+    return requested if limit is None else min(limit, requested)
+
+
+class _ResolverServerMixin(ThreadingMixIn):
+    daemon_threads = True
+    root_ca_store = None  # type: Optional[CAStore]
+    cache = None  # type: Optional[DownloadCache]
+    pool = None  # type: Optional[ConnectionPool]
+    retry = None  # type: Optional[RetryPolicy]
+    intermediate_store = None  # type: Optional[CAStore]
+    max_depth = DEFAULT_MAX_DEPTH  # type: Optional[int]
+    deadline = None  # type: Optional[float]
+    quiet = False
+
+
+class ThreadingHTTPResolverServer(_ResolverServerMixin, HTTPServer):
+    """Resolver API over TCP, every request is handled on its own thread"""
+
+
+class ThreadingUnixResolverServer(_ResolverServerMixin, UnixStreamServer):
+    """Resolver API over a Unix socket, every request is handled on its own thread"""
+
+    def server_bind(self):
+        # type: () -> None
+        path = self.server_address
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):  # type: ignore
+            # Left behind by a previous server
+            os.remove(path)  # type: ignore
+        UnixStreamServer.server_bind(self)
+
+    def server_close(self):
+        # type: () -> None
+        UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):  # type: ignore
+            os.remove(self.server_address)  # type: ignore
+
+
+def create_server(
+    host="127.0.0.1",
+    port=8080,
+    unix_socket=None,
+    root_ca_store=None,
+    cache=None,
+    pool=None,
+    quiet=False,
+    retry=None,
+    intermediate_store=None,
+    max_depth=DEFAULT_MAX_DEPTH,
+    deadline=None,
+):
+    # type: (str, int, Optional[str], Optional[CAStore], Optional[DownloadCache], Optional[ConnectionPool], bool, Optional[RetryPolicy], Optional[CAStore], Optional[int], Optional[float]) -> Union[ThreadingHTTPResolverServer, ThreadingUnixResolverServer]
+    """Create a server for the resolver API, see :class:`ResolverRequestHandler <ResolverRequestHandler>`.
+    Call ``serve_forever()`` on the result to start serving.
+
+    Args:
+        host: Address to listen on. Defaults to 127.0.0.1.
+        port: TCP port to listen on, 0 picks a free port. Defaults to 8080.
+        unix_socket: Listen on this Unix socket path instead of TCP. Defaults to None.
+        root_ca_store: See :py:func:`cert_chain_resolver.resolver.resolve`
+        cache: See :py:func:`cert_chain_resolver.resolver.resolve`. Defaults to a new
+            :class:`MemoryCache <cert_chain_resolver.cache.MemoryCache>`.
+        pool: See :py:func:`cert_chain_resolver.resolver.resolve`. Defaults to a new
+            :class:`ConnectionPool <cert_chain_resolver.pool.ConnectionPool>`.
+        quiet: Do not log requests to stderr. Defaults to False.
+        retry: See :py:func:`cert_chain_resolver.resolver.resolve`. Defaults to a new
+            :class:`RetryPolicy <cert_chain_resolver.retry.RetryPolicy>`.
+        intermediate_store: See :py:func:`cert_chain_resolver.resolver.resolve`. Defaults to None.
+        max_depth: See :py:func:`cert_chain_resolver.resolver.resolve`, requests can only lower it. Defaults to 10.
+        deadline: See :py:func:`cert_chain_resolver.resolver.resolve`, requests can only lower it. Defaults to None.
+    """
+    server = (
+        ThreadingUnixResolverServer(unix_socket, ResolverRequestHandler)
+        if unix_socket
+        else ThreadingHTTPResolverServer((host, port), ResolverRequestHandler)
+    )  # type: Union[ThreadingHTTPResolverServer, ThreadingUnixResolverServer]
+    server.root_ca_store = root_ca_store
+    server.cache = cache if cache is not None else MemoryCache()
+    server.pool = pool if pool is not None else ConnectionPool()
+    server.retry = retry if retry is not None else RetryPolicy()
+    server.intermediate_store = intermediate_store
+    server.max_depth = max_depth
+    server.deadline = deadline
+    server.quiet = quiet
+    return server
@@ -1,9 +1,26 @@
+from contextlib import contextmanager
+import hashlib
+import mmap
+import os
+import re
+import struct
+
 from cryptography import x509
 from cryptography.hazmat.primitives.serialization import pkcs7
 from cert_chain_resolver.exceptions import ImproperlyFormattedCert
+from cert_chain_resolver import __is_py3__
 
 try:
-    from typing import TYPE_CHECKING
+    from typing import (
+        IO,
+        Iterable,
+        Iterator,
+        List,
+        Optional,
+        Tuple,
+        Union,
+        TYPE_CHECKING,
+    )
 
     if TYPE_CHECKING:  # pragma: no cover
         from cert_chain_resolver.models import Cert
@@ -12,17 +29,88 @@ except ImportError:  # pragma: no cover
     pass
 
 
+# PEM headers are short, anything longer is not a header
+PEM_MAX_HEADER_SIZE = 80
+
+
+def _pem_label(header):
+    # type: (bytes) -> Optional[str]
+    """Label of a ``-----BEGIN <label>-----`` header, None for anything else
+
+    Raises:
+        UnicodeDecodeError: The header is not ASCII, e.g. for DER input
+    """
+    line = header.rstrip(b"\r\n").decode("ascii")
+    if line.startswith("-----BEGIN ") and line.endswith("-----") and len(line) > 16:
+        return line[11:-5]
+    return None
+
+
 def load_ascii_to_x509(bytes_input):
     # type: (bytes) -> x509.Certificate
-    """Converts ASCII PKCS7 or Certificate to a :py:class:`cryptography.x509.Certificate` object"""
-    first_line = bytes_input.decode("ascii").splitlines()[0]
-    if first_line == "-----BEGIN PKCS7-----":
+    """Converts ASCII PKCS7 or Certificate to a :py:class:`cryptography.x509.Certificate` object
+
+    Only the first line is inspected for detecting the format.
+    """
+    label = _pem_label(bytes_input[:PEM_MAX_HEADER_SIZE].split(b"\n", 1)[0])
+    if label == "PKCS7":
         return pkcs7.load_pem_pkcs7_certificates(bytes_input)[0]
-    elif first_line == "-----BEGIN CERTIFICATE-----":
+    elif label == "CERTIFICATE":
         return x509.load_pem_x509_certificate(bytes_input)
     raise ImproperlyFormattedCert("Cert can not be read! It is not a valid PEM")
 
 
+# Formats detected by sniff_format
+FORMAT_PEM = "pem"
+FORMAT_PKCS7_PEM = "p7b-pem"
+FORMAT_DER = "der"
+FORMAT_PKCS7_DER = "p7b-der"
+
+# DER encoded OID 1.2.840.113549.1.7.2, PKCS7 signedData
+_PKCS7_SIGNED_DATA_OID = b"\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02"
+
+
+def sniff_format(bytes_input):
+    # type: (bytes) -> Optional[str]
+    """Detects the format of a certificate from its first bytes, without parsing it
+
+    PEM is recognized by the label of its first line, DER by the first element within the outer SEQUENCE: the
+    ``tbsCertificate`` SEQUENCE of a certificate or the signedData OID of a PKCS7. The outer SEQUENCE of a PKCS7
+    may use the BER indefinite length.
+
+    Returns:
+        :py:data:`FORMAT_PEM`, :py:data:`FORMAT_PKCS7_PEM`, :py:data:`FORMAT_DER`, :py:data:`FORMAT_PKCS7_DER`
+        or None when the format is not recognized
+    """
+    if bytes_input[:1] == b"-":
+        try:
+            label = _pem_label(bytes_input[:PEM_MAX_HEADER_SIZE].split(b"\n", 1)[0])
+        except UnicodeDecodeError:
+            return None
+        if label == "CERTIFICATE":
+            return FORMAT_PEM
+        return FORMAT_PKCS7_PEM if label == "PKCS7" else None
+
+    data = bytes_input if __is_py3__ else bytearray(bytes_input)
+    # CAs serve PKCS7 as BER too, with an indefinite length outer SEQUENCE. Certificates are always DER.
+    indefinite = bytes_input[:2] == b"\x30\x80"
+    try:
+        if indefinite:
+            start = 2
+        else:
+            tag, start, _ = _der_element(data, 0)
+            if tag != 0x30:
+                return None
+        tag, start, end = _der_element(data, start)
+    except ValueError:
+        return None
+    if tag == 0x30 and not indefinite:
+        return FORMAT_DER
+    if tag == 0x06 and bytes(data[start:end]) == _PKCS7_SIGNED_DATA_OID:
+        return FORMAT_PKCS7_DER
+    return None
+
+
 def load_der_to_x509(bytes_input):
     # type: (bytes) -> x509.Certificate
     """Converts bytes formatted DER (PKCS7 or Cert) to :py:class:`cryptography.x509.Certificate` object"""
@@ -34,8 +122,337 @@ def load_der_to_x509(bytes_input):
 
 def load_bytes_to_x509(bytes_input):
     # type: (bytes) -> x509.Certificate
-    """Converts Certificate / PKCS7 in ASCII or DER to :py:class:`cryptography.x509.Certificate` object"""
+    """Converts Certificate / PKCS7 in ASCII or DER to :py:class:`cryptography.x509.Certificate` object
+
+    The format is detected with :py:func:`sniff_format`, so the input is parsed once.
+    """
+    detected = sniff_format(bytes_input)
+    if detected == FORMAT_DER:
+        return x509.load_der_x509_certificate(bytes_input)
+    elif detected == FORMAT_PKCS7_DER:
+        return pkcs7.load_der_pkcs7_certificates(bytes_input)[0]
+    elif detected == FORMAT_PEM:
+        return x509.load_pem_x509_certificate(bytes_input)
+    elif detected == FORMAT_PKCS7_PEM:
+        return pkcs7.load_pem_pkcs7_certificates(bytes_input)[0]
+
+    # Not recognized, trying every format raises the most helpful error
     try:
         return load_ascii_to_x509(bytes_input)
     except UnicodeDecodeError:
         return load_der_to_x509(bytes_input)
+
+
+def load_bytes_to_x509_list(bytes_input):
+    # type: (bytes) -> List[x509.Certificate]
+    """Like :py:func:`load_bytes_to_x509`, but returns every certificate of a PKCS7 instead of only the first
+
+    Raises:
+        ImproperlyFormattedCert: The PKCS7 holds no certificates
+    """
+    detected = sniff_format(bytes_input)
+    if detected == FORMAT_PKCS7_DER:
+        certs = pkcs7.load_der_pkcs7_certificates(bytes_input)
+    elif detected == FORMAT_PKCS7_PEM:
+        certs = pkcs7.load_pem_pkcs7_certificates(bytes_input)
+    else:
+        return [load_bytes_to_x509(bytes_input)]
+    if not certs:
+        raise ImproperlyFormattedCert("PKCS7 does not hold any certificates")
+    return certs
+
+
+# DER encoded OID 2.5.29.14
+_SUBJECT_KEY_IDENTIFIER_OID = b"\x55\x1d\x0e"
+
+
+def _der_element(data, offset):
+    # type: (Union[bytes, bytearray, memoryview], int) -> Tuple[int, int, int]
+    """Returns the tag, the start and the end of the content of the DER element at offset"""
+    if offset + 2 > len(data):
+        raise ValueError("Truncated DER element")
+    tag, length = data[offset], data[offset + 1]
+    start = offset + 2
+    if length & 0x80:
+        num_bytes = length & 0x7F
+        if not num_bytes or num_bytes > 4:
+            raise ValueError("Unsupported DER length")
+        length = 0
+        for byte in data[start : start + num_bytes]:
+            length = (length << 8) | byte
+        start += num_bytes
+    end = start + length
+    if end > len(data):
+        raise ValueError("Truncated DER element")
+    return tag, start, end
+
+
+def scan_certificate_der(der):
+    # type: (Union[bytes, bytearray, memoryview]) -> Tuple[bytes, bytes, Optional[bytes]]
+    """Extracts the raw issuer, the raw subject and the Subject Key Identifier from a DER certificate,
+    without building a :py:class:`cryptography.x509.Certificate` object
+
+    The issuer and subject are the complete DER encoded names. The Subject Key Identifier is None when absent.
+
+    Raises:
+        ValueError: der is not a certificate
+    """
+    data = der if __is_py3__ else bytearray(der)
+    tag, start, _ = _der_element(data, 0)
+    if tag != 0x30:
+        raise ValueError("Not a DER certificate")
+    tag, pos, tbs_end = _der_element(data, start)
+    if tag != 0x30:
+        raise ValueError("Not a DER certificate")
+
+    tag, _, end = _der_element(data, pos)
+    if tag == 0xA0:
+        # Explicit version, absent for v1 certificates
+        pos = end
+        tag, _, end = _der_element(data, pos)
+    # Skip the serial and the signature algorithm
+    pos = _der_element(data, end)[2]
+    issuer_end = _der_element(data, pos)[2]
+    issuer = bytes(data[pos:issuer_end])
+    # Skip the validity
+    pos = _der_element(data, issuer_end)[2]
+    subject_end = _der_element(data, pos)[2]
+    subject = bytes(data[pos:subject_end])
+    # Skip the subject public key info
+    pos = _der_element(data, subject_end)[2]
+
+    ski = None
+    while pos < tbs_end:
+        tag, start, pos = _der_element(data, pos)
+        if tag != 0xA3:
+            continue
+        _, ext_pos, extensions_end = _der_element(data, start)
+        while ext_pos < extensions_end:
+            _, start, ext_pos = _der_element(data, ext_pos)
+            _, oid_start, oid_end = _der_element(data, start)
+            if bytes(data[oid_start:oid_end]) != _SUBJECT_KEY_IDENTIFIER_OID:
+                continue
+            tag, start, end = _der_element(data, oid_end)
+            if tag == 0x01:
+                # Skip the critical flag
+                tag, start, end = _der_element(data, end)
+            _, start, end = _der_element(data, start)
+            ski = bytes(data[start:end])
+    return issuer, subject, ski
+
+
+# String types OpenSSL canonicalizes when hashing a name, other values are hashed as is
+_CANONICAL_STRING_ENCODINGS = {
+    0x0C: "utf-8",  # UTF8String
+    0x13: "latin-1",  # PrintableString
+    0x14: "latin-1",  # T61String
+    0x16: "latin-1",  # IA5String
+    0x1A: "latin-1",  # VisibleString
+    0x1C: "utf-32-be",  # UniversalString
+    0x1E: "utf-16-be",  # BMPString
+}
+_ASCII_WHITESPACE = re.compile(b"[ \t\n\v\f\r]+")
+
+
+def _der_tlv(tag, content):
+    # type: (int, bytes) -> bytes
+    length = len(content)
+    if length < 0x80:
+        header = struct.pack("BB", tag, length)
+    else:
+        encoded = struct.pack(">I", length).lstrip(b"\x00")
+        header = struct.pack("BB", tag, 0x80 | len(encoded)) + encoded
+    return header + content
+
+
+def x509_name_hash(name_der):
+    # type: (bytes) -> str
+    """Computes the OpenSSL subject hash of a DER encoded name, as printed by ``openssl x509 -hash`` and used for
+    the ``<hash>.N`` file names of ``c_rehash`` directories
+
+    The hash covers the canonical encoding of the name: string values are converted to UTF-8, stripped, their
+    whitespace runs are collapsed to a single space and ASCII is lower cased.
+
+    Raises:
+        ValueError: name_der is not a DER encoded name
+    """
+    data = bytearray(name_der)
+    tag, pos, end = _der_element(data, 0)
+    if tag != 0x30:
+        raise ValueError("Not a DER encoded name")
+
+    canonical = b""
+    while pos < end:
+        tag, rdn_pos, pos = _der_element(data, pos)
+        if tag != 0x31:
+            raise ValueError("Not a DER encoded name")
+        entries = []
+        while rdn_pos < pos:
+            _, entry_pos, rdn_pos = _der_element(data, rdn_pos)
+            _, oid_start, oid_end = _der_element(data, entry_pos)
+            tag, value_start, value_end = _der_element(data, oid_end)
+            value = bytes(data[value_start:value_end])
+            encoding = _CANONICAL_STRING_ENCODINGS.get(tag)
+            if encoding is not None:
+                value = value.decode(encoding).encode("utf-8")
+                value = _ASCII_WHITESPACE.sub(b" ", value.strip(b" \t\n\v\f\r"))
+                # Only lower cases ASCII, like OpenSSL
+                value = value.lower()
+                tag = 0x0C
+            entries.append(
+                _der_tlv(0x30, bytes(data[entry_pos:oid_end]) + _der_tlv(tag, value))
+            )
+        # DER sorts the values of a SET OF
+        canonical += _der_tlv(0x31, b"".join(sorted(entries)))
+    # The outer SEQUENCE is not part of the hashed encoding
+    digest = hashlib.sha1(canonical).digest()
+    return "%08x" % struct.unpack("<I", digest[:4])[0]
+
+
+PEM_BEGIN_CERTIFICATE = b"-----BEGIN CERTIFICATE-----"
+PEM_END_CERTIFICATE = b"-----END CERTIFICATE-----"
+
+
+@contextmanager
+def map_file(path):
+    # type: (str) -> Iterator[Union[bytes, mmap.mmap]]
+    """Memory maps the file at path read-only, views on the map must be released before the context exits"""
+    with open(path, "rb") as f:
+        if not __is_py3__ or os.fstat(f.fileno()).st_size == 0:
+            # Empty files can't be mapped, Python 2 maps don't support memoryview
+            yield f.read()
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def iter_certificate_blocks(data):
+    # type: (Union[bytes, mmap.mmap]) -> Iterator[Tuple[int, memoryview]]
+    """Yields the offset and a :py:class:`memoryview` of every certificate in data, without copying
+
+    PEM blocks span from ``-----BEGIN CERTIFICATE-----`` up to and including ``-----END CERTIFICATE-----``, so
+    CRLF line endings and a missing trailing newline are handled. Anything outside the blocks is ignored.
+    Data starting with a DER sequence is read as one or more concatenated DER certificates.
+
+    Raises:
+        ValueError: DER data is truncated
+    """
+    view = memoryview(data)
+    try:
+        if data[:1] == b"\x30":
+            pos = 0
+            while pos < len(view):
+                end = _der_element(view, pos)[2]
+                yield pos, view[pos:end]
+                pos = end
+            return
+
+        pos = 0
+        while True:
+            start = data.find(PEM_BEGIN_CERTIFICATE, pos)
+            if start == -1:
+                return
+            end = data.find(PEM_END_CERTIFICATE, start)
+            if end == -1:
+                # Truncated block
+                return
+            pos = end + len(PEM_END_CERTIFICATE)
+            yield start, view[start:pos]
+    finally:
+        if __is_py3__:
+            view.release()
+
+
+def iter_pem_blocks(source, chunk_size=65536, max_block_size=1024 * 1024):
+    # type: (Union[IO[bytes], Iterable[bytes]], int, int) -> Iterator[Tuple[str, bytes]]
+    """Yields the label and the bytes of every PEM block in source, while holding at most one block in memory
+
+    Only the ``-----BEGIN <label>-----`` header of a block is inspected until its matching end marker is found,
+    anything outside the blocks is skipped.
+
+    Args:
+        source: Binary file object or an iterable of byte chunks
+        chunk_size: Bytes read from a file object at once. Defaults to 64KiB.
+        max_block_size: Maximum size of a single block. Defaults to 1MiB.
+
+    Raises:
+        :class:`ImproperlyFormattedCert <cert_chain_resolver.exceptions.ImproperlyFormattedCert>`: A block
+            exceeds max_block_size or the input ends inside a block
+    """
+    if hasattr(source, "read"):
+        read = source.read
+        chunks = iter(lambda: read(chunk_size), b"")  # type: Iterable[bytes]
+    else:
+        chunks = source
+
+    begin = b"-----BEGIN "
+    buffer = bytearray()
+    end_marker = None  # type: Optional[bytes]
+    label = ""
+    scanned = 0
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while True:
+            if end_marker is None:
+                start = buffer.find(begin)
+                if start == -1:
+                    # Keep the tail, it might hold the start of a header
+                    del buffer[: max(0, len(buffer) - len(begin))]
+                    break
+                del buffer[:start]
+                header_end = buffer.find(b"\n", 0, PEM_MAX_HEADER_SIZE)
+                if header_end == -1 and len(buffer) < PEM_MAX_HEADER_SIZE:
+                    # Wait for the rest of the header
+                    break
+                parsed = None
+                if header_end != -1:
+                    try:
+                        parsed = _pem_label(bytes(buffer[:header_end]))
+                    except UnicodeDecodeError:
+                        pass
+                if parsed is None:
+                    # Not a header after all, look for the next one
+                    del buffer[: len(begin)]
+                    continue
+                label = parsed
+                end_marker = "-----END {0}-----".format(label).encode("ascii")
+                scanned = header_end
+
+            end = buffer.find(end_marker, max(0, scanned - len(end_marker)))
+            if end != -1:
+                end += len(end_marker)
+            if (end == -1 and len(buffer) > max_block_size) or end > max_block_size:
+                raise ImproperlyFormattedCert(
+                    "PEM block is larger than {0} bytes".format(max_block_size)
+                )
+            if end == -1:
+                scanned = len(buffer)
+                break
+            block = bytes(buffer[:end])
+            del buffer[:end]
+            end_marker = None
+            yield label, block
+
+    if end_marker is not None:
+        raise ImproperlyFormattedCert("Truncated PEM block: {0}".format(label))
+
+
+def iter_pem_x509(source, chunk_size=65536, max_block_size=1024 * 1024):
+    # type: (Union[IO[bytes], Iterable[bytes]], int, int) -> Iterator[x509.Certificate]
+    """Yields a :py:class:`cryptography.x509.Certificate` for every certificate in the PEM blocks of source,
+    all certificates of a PKCS7 block are yielded. Blocks with other labels are skipped.
+
+    Args:
+        source: See :py:func:`iter_pem_blocks`
+        chunk_size: See :py:func:`iter_pem_blocks`
+        max_block_size: See :py:func:`iter_pem_blocks`
+    """
+    for label, block in iter_pem_blocks(source, chunk_size, max_block_size):
+        if label == "CERTIFICATE":
+            yield x509.load_pem_x509_certificate(block)
+        elif label == "PKCS7":
+            for cert in pkcs7.load_pem_pkcs7_certificates(block):
+                yield cert
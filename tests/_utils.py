@@ -1,9 +1,184 @@
+import contextlib
 import cryptography
 import datetime
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer  # type: ignore
+    from SocketServer import ThreadingMixIn  # type: ignore
 
 CRYPTOGRAPHY_MAJOR = int(cryptography.__version__.split(".")[0])
 
 def make_utc_aware_if_cryptography_above_42(dt):
     if CRYPTOGRAPHY_MAJOR >= 42:
         return dt.replace(tzinfo=datetime.timezone.utc)
-    return dt
\ No newline at end of file
+    return dt
+
+def make_cert(
+    common_name,
+    issuer=None,
+    is_ca=True,
+    key=None,
+    aia=None,
+    with_key_identifiers=True,
+):
+    """Create a certificate signed by issuer (a ``(cert, key)`` tuple), self-signed when issuer is None.
+
+    Returns a ``(x509.Certificate, private_key)`` tuple.
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID, AuthorityInformationAccessOID
+
+    key = key or ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    issuer_cert, issuer_key = issuer if issuer else (None, key)
+    issuer_name = issuer_cert.subject if issuer_cert is not None else name
+    now = datetime.datetime(2024, 1, 1)
+
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(issuer_name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=3650))
+        .add_extension(x509.BasicConstraints(ca=is_ca, path_length=None), True)
+    )
+    if with_key_identifiers:
+        builder = builder.add_extension(
+            x509.SubjectKeyIdentifier.from_public_key(key.public_key()), False
+        ).add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(
+                issuer_key.public_key()
+            ),
+            False,
+        )
+    if aia:
+        builder = builder.add_extension(
+            x509.AuthorityInformationAccess(
+                [
+                    x509.AccessDescription(
+                        AuthorityInformationAccessOID.CA_ISSUERS,
+                        x509.UniformResourceIdentifier(aia),
+                    )
+                ]
+            ),
+            False,
+        )
+    return builder.sign(issuer_key, hashes.SHA256()), key
+
+def write_bundle(tmpdir, *certs, **kwargs):
+    """Write certs (``(cert, key)`` tuples) to tmpdir as the PEM bundle ``name``, bundle.pem by default"""
+    from cert_chain_resolver.models import Cert
+
+    bundle = tmpdir.join(kwargs.get("name", "bundle.pem"))
+    bundle.write(b"".join(Cert(x[0]).export().encode("ascii") for x in certs), "wb")
+    return str(bundle)
+
+class HTTPTestServer(ThreadingMixIn, HTTPServer):
+    """Local CA issuer server, records the connections, paths and headers it received"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), HTTPTestHandler)
+        self.connections = []
+        self.paths = []
+        self.headers = []
+        self.url = "http://127.0.0.1:{0}".format(self.server_address[1])
+
+    def handle_error(self, request, client_address):
+        # Clients that time out close the connection before the answer is written
+        pass
+
+class HTTPTestHandler(BaseHTTPRequestHandler):
+    """Serves ``der`` with an ETag from ``/issuer.crt``, the other paths exercise the clients:
+
+    * ``/redirect``: redirects to ``/issuer.crt``, ``/loop`` redirects to itself
+    * ``/chunked``: ``der-bin`` in two chunks
+    * ``/close``: ``der`` and closes the connection
+    * ``/drop``: ``der`` as if the connection is kept alive, then closes it
+    * ``/slow``: ``der`` after half a second
+    * anything else: 404
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections.append(self.client_address)
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        self.server.headers.append(self.headers)
+        if self.path.endswith("/slow"):
+            time.sleep(0.5)
+        if self.path.endswith("/drop"):
+            self.close_connection = True
+        if self.path.endswith("/redirect"):
+            self.send_response(301)
+            self.send_header("Location", "/issuer.crt")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path.endswith("/loop"):
+            self.send_response(302)
+            self.send_header("Location", "/loop")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path.endswith("/chunked"):
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"3\r\nder\r\n4\r\n-bin\r\n0\r\n\r\n")
+        elif self.path.endswith("/close"):
+            self.send_response(200)
+            self.send_header("Connection", "close")
+            self.send_header("Content-Length", "3")
+            self.end_headers()
+            self.wfile.write(b"der")
+        elif self.path.endswith(("/issuer.crt", "/drop", "/slow")):
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", "3")
+            self.end_headers()
+            self.wfile.write(b"der")
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@contextlib.contextmanager
+def http_test_server():
+    """Run an :class:`HTTPTestServer` on a background thread for the duration of the block"""
+    server = HTTPTestServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def ber_pkcs7(certs):
+    """PKCS7 of certs (``x509.Certificate`` objects) with an indefinite length outer SEQUENCE, like some CAs serve"""
+    from cryptography.hazmat.primitives.serialization import Encoding, pkcs7
+    from cert_chain_resolver.utils import _der_element
+
+    der = pkcs7.serialize_certificates(certs, Encoding.DER)
+    _, start, end = _der_element(der, 0)
+    return b"\x30\x80" + der[start:end] + b"\x00\x00"
@@ -1,5 +1,16 @@
 import pytest
 import datetime
+import sys
+
+try:
+    from typing import List
+except ImportError:  # pragma: no cover
+    pass
+
+collect_ignore = []  # type: List[str]
+if sys.version_info < (3, 5):
+    # asyncio support uses async / await syntax
+    collect_ignore.append("test_aio.py")
 
 
 @pytest.fixture(scope="session")
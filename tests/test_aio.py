@@ -0,0 +1,308 @@
+import asyncio
+import threading
+
+import pytest
+
+from cert_chain_resolver import aio, metrics
+from cert_chain_resolver.aio import (
+    AsyncTransport,
+    AsyncioTransport,
+    aresolve,
+    _adownload,
+)
+from cert_chain_resolver.cache import CacheEntry, MemoryCache
+from cert_chain_resolver.castore.base_store import CAStore
+from cert_chain_resolver.exceptions import ResolveLimitExceeded, RootCertificateNotFound
+from cert_chain_resolver.models import Cert
+from cert_chain_resolver.pool import Response
+from cryptography.hazmat.primitives.serialization import Encoding, pkcs7
+from tests._utils import http_test_server, make_cert
+
+try:
+    from urllib.error import HTTPError
+except ImportError:  # pragma: no cover
+    pass
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class FakeTransport(AsyncTransport):
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    async def get(self, url, headers=None):
+        self.requests.append((url, headers))
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def http_server():
+    with http_test_server() as server:
+        yield server.url
+
+
+def test_transport_needs_impl():
+    with pytest.raises(NotImplementedError):
+        run(AsyncTransport().get("http://example.com"))
+
+
+@pytest.mark.parametrize(
+    "path,body",
+    [("/issuer.crt", b"der"), ("/redirect", b"der"), ("/chunked", b"der-bin")],
+)
+def test_asyncio_transport_fetches(http_server, path, body):
+    response = run(AsyncioTransport().get(http_server + path))
+    assert response.status == 200
+    assert response.body == body
+
+
+def test_asyncio_transport_conditional_request(http_server):
+    response = run(
+        AsyncioTransport().get(
+            http_server + "/issuer.crt", headers={"If-None-Match": '"v1"'}
+        )
+    )
+    assert response.status == 304
+    assert response.body == b""
+
+
+def test_asyncio_transport_rejects_unsupported_urls():
+    with pytest.raises(ValueError):
+        run(AsyncioTransport().get("ldap://example.com/ca"))
+
+
+def test_asyncio_transport_bounds_concurrency():
+    transport = AsyncioTransport(max_concurrency=2)
+    active = []
+    peak = []
+
+    async def fake_follow(url, headers):
+        active.append(url)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(url)
+        return Response(200, {}, b"")
+
+    transport._follow = fake_follow
+
+    async def main():
+        await asyncio.gather(*[transport.get(str(i)) for i in range(6)])
+
+    run(main())
+    assert max(peak) == 2
+
+
+def test_adownload_with_cache(http_server):
+    cache = MemoryCache(ttl=0)
+    url = http_server + "/issuer.crt"
+    transport = AsyncioTransport()
+
+    assert run(_adownload(url, transport, cache=cache)) == b"der"
+    assert cache.get(url).etag == '"v1"'
+    # Stale entry, revalidated through a 304
+    assert run(_adownload(url, transport, cache=cache)) == b"der"
+
+
+def test_adownload_uses_fresh_cache_entry():
+    cache = MemoryCache()
+    cache.set("http://ca/issuer.crt", CacheEntry(b"cached"))
+    transport = FakeTransport([])
+
+    assert run(_adownload("http://ca/issuer.crt", transport, cache=cache)) == b"cached"
+    assert transport.requests == []
+
+
+def test_adownload_raises_on_error_status(http_server):
+    with pytest.raises(HTTPError):
+        run(_adownload(http_server + "/missing", AsyncioTransport()))
+
+
+def test_aresolve_follows_chain(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    intermediate = mocker.Mock()
+    ca = mocker.Mock()
+    ca.ca_issuer_access_location = None
+    monkeypatch.setattr(Cert, "load", mocker.Mock(side_effect=[leaf, intermediate, ca]))
+    transport = FakeTransport(
+        [Response(200, {}, b"intermediate"), Response(200, {}, b"ca")]
+    )
+
+    chain = run(aresolve(b"leaf", transport=transport))
+    assert list(chain) == [leaf, intermediate, ca]
+    assert [r[0] for r in transport.requests] == [
+        leaf.ca_issuer_access_location,
+        intermediate.ca_issuer_access_location,
+    ]
+
+
+def test_aresolve_uses_every_certificate_of_a_pkcs7():
+    root = make_cert("Root")
+    intermediate = make_cert("Intermediate", issuer=root, aia="http://ca/root.crt")
+    leaf = make_cert("Leaf", issuer=intermediate, is_ca=False, aia="http://ca/path.p7c")
+    bundle = pkcs7.serialize_certificates([root[0], intermediate[0]], Encoding.DER)
+    transport = FakeTransport([Response(200, {}, bundle)])
+
+    chain = run(aresolve(Cert(leaf[0]).export().encode("ascii"), transport=transport))
+
+    assert list(chain) == [Cert(leaf[0]), Cert(intermediate[0]), Cert(root[0])]
+    assert [r[0] for r in transport.requests] == ["http://ca/path.p7c"]
+
+
+def test_aresolve_avoids_infinite_loop(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    monkeypatch.setattr(Cert, "load", mocker.Mock(side_effect=[leaf, leaf]))
+    transport = FakeTransport([Response(200, {}, b"leaf")])
+
+    assert list(run(aresolve(b"leaf", transport=transport))) == [leaf]
+
+
+def test_aresolve_with_castore(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    leaf.ca_issuer_access_location = None
+    leaf.is_root = False
+    ca = mocker.Mock()
+    monkeypatch.setattr(Cert, "load", mocker.Mock(side_effect=[leaf]))
+    store = CAStore()
+    monkeypatch.setattr(store, "find_issuer", lambda x: ca)
+
+    chain = run(aresolve(b"leaf", root_ca_store=store, transport=FakeTransport([])))
+    assert list(chain) == [leaf, ca]
+
+
+def test_aresolve_stops_at_max_depth(monkeypatch, mocker):
+    certs = [mocker.Mock() for _ in range(3)]
+    monkeypatch.setattr(Cert, "load", mocker.Mock(side_effect=certs))
+    transport = FakeTransport([Response(200, {}, b"parent")] * 3)
+
+    with pytest.raises(ResolveLimitExceeded) as e:
+        run(aresolve(b"leaf", transport=transport, max_depth=2))
+    assert list(e.value.chain) == certs[:2]
+
+
+def test_aresolve_download_timeout_keeps_partial_chain(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    monkeypatch.setattr(Cert, "load", mocker.Mock(return_value=leaf))
+
+    class HangingTransport(AsyncTransport):
+        async def get(self, url, headers=None):
+            await asyncio.sleep(10)
+
+    with pytest.raises(ResolveLimitExceeded) as e:
+        run(aresolve(b"leaf", transport=HangingTransport(), timeout=0.01))
+    assert list(e.value.chain) == [leaf]
+
+
+def test_aresolve_runs_stores_and_cache_off_the_loop(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    leaf.ca_issuer_access_location = None
+    leaf.is_root = False
+    monkeypatch.setattr(Cert, "load", mocker.Mock(return_value=leaf))
+    threads = []
+
+    def find_issuer(cert):
+        threads.append(threading.current_thread())
+        raise RootCertificateNotFound()
+
+    intermediates, roots = CAStore(), CAStore()
+    monkeypatch.setattr(intermediates, "find_issuer", find_issuer)
+    monkeypatch.setattr(roots, "find_issuer", lambda cert: find_issuer(cert) or leaf)
+
+    with pytest.raises(RootCertificateNotFound):
+        run(
+            aresolve(
+                b"leaf",
+                root_ca_store=roots,
+                intermediate_store=intermediates,
+                transport=FakeTransport([]),
+            )
+        )
+    assert len(threads) == 2
+    assert threading.current_thread() not in threads
+
+
+def test_aresolve_parses_certificates_off_the_loop(monkeypatch):
+    root = make_cert("Root")
+    leaf = make_cert("Leaf", issuer=root, is_ca=False, aia="http://ca/root.crt")
+    threads = []
+
+    def recording(load):
+        def wrapper(data):
+            threads.append(threading.current_thread())
+            return load(data)
+
+        return wrapper
+
+    monkeypatch.setattr(Cert, "load", recording(Cert.load))
+    monkeypatch.setattr(Cert, "load_all", recording(Cert.load_all))
+    transport = FakeTransport([Response(200, {}, root[0].public_bytes(Encoding.DER))])
+
+    chain = run(aresolve(leaf[0].public_bytes(Encoding.PEM), transport=transport))
+
+    assert [c.common_name for c in chain] == ["Leaf", "Root"]
+    assert threads
+    assert threading.current_thread() not in threads
+
+
+def test_aresolve_shares_the_default_transport(monkeypatch):
+    transport = FakeTransport([Response(200, {}, b"")])
+    monkeypatch.setattr(aio, "default_transport", transport)
+    leaf = make_cert(
+        "Leaf", issuer=make_cert("Root"), is_ca=False, aia="http://ca/root.crt"
+    )
+
+    run(aresolve(leaf[0].public_bytes(Encoding.PEM)))
+
+    assert transport.requests == [("http://ca/root.crt", {})]
+
+
+def test_asyncio_transport_has_a_semaphore_per_loop():
+    transport = AsyncioTransport()
+
+    async def semaphore():
+        return transport.semaphore
+
+    first, second = run(semaphore()), run(semaphore())
+    assert first is not second
+
+
+def test_concurrent_aresolve_spans(monkeypatch, mocker):
+    class SlowTransport(AsyncTransport):
+        async def get(self, url, headers=None):
+            await asyncio.sleep(0.05 if url == "http://ca/slow.crt" else 0.01)
+            return Response(200, {}, b"ca")
+
+    def load(data):
+        cert = mocker.Mock()
+        cert.ca_issuer_access_location = (
+            "http://ca/{0}.crt".format(data.decode("ascii")) if data != b"ca" else None
+        )
+        return cert
+
+    monkeypatch.setattr(Cert, "load", load)
+    monkeypatch.setattr(Cert, "load_all", lambda data: [load(data)])
+    stats = metrics.StatsCollector()
+
+    async def main():
+        transport = SlowTransport()
+        await asyncio.gather(
+            aresolve(b"slow", transport=transport),
+            aresolve(b"fast", transport=transport),
+        )
+
+    metrics.set_observer(stats)
+    try:
+        run(main())
+    finally:
+        metrics.set_observer(None)
+
+    calls, total, longest = stats.spans["download"]
+    # Interleaved on one thread, every download is measured on its own
+    assert calls == 2
+    assert 0.05 <= longest < total < 0.05 + longest
@@ -1,18 +1,45 @@
-from cert_chain_resolver import api
+from cert_chain_resolver import api, __is_py3__
 import pytest
-from cert_chain_resolver.resolver import resolve
+from cert_chain_resolver.resolver import resolve, resolve_many
 from cert_chain_resolver.models import CertificateChain, Cert
+from cert_chain_resolver.castore.certifi_store import CertifiStore
+from cert_chain_resolver.castore.composite import CompositeStore
+from cert_chain_resolver.castore.directory import DirectoryStore
 from cert_chain_resolver.castore.file_system import FileSystemStore
+from cert_chain_resolver.castore.intermediates import IntermediateStore
+from cert_chain_resolver.castore.shared import SharedBundleStore
+from cert_chain_resolver.cache import MemoryCache, FileSystemCache
+from cert_chain_resolver.pool import ConnectionPool
+from cert_chain_resolver.retry import RetryPolicy
 
 
 @pytest.mark.parametrize(
     "exported,obj",
     [
         ("resolve", resolve),
+        ("resolve_many", resolve_many),
         ("CertificateChain", CertificateChain),
         ("Cert", Cert),
         ("FileSystemStore", FileSystemStore),
+        ("DirectoryStore", DirectoryStore),
+        ("CertifiStore", CertifiStore),
+        ("CompositeStore", CompositeStore),
+        ("IntermediateStore", IntermediateStore),
+        ("SharedBundleStore", SharedBundleStore),
+        ("MemoryCache", MemoryCache),
+        ("FileSystemCache", FileSystemCache),
+        ("ConnectionPool", ConnectionPool),
+        ("RetryPolicy", RetryPolicy),
     ],
 )
 def test_api_exports_right_objects(exported, obj):
     assert getattr(api, exported) == obj
+
+
+@pytest.mark.skipif(not __is_py3__, reason="asyncio support requires python 3")
+def test_api_exports_asyncio_objects():
+    from cert_chain_resolver import aio
+
+    assert api.aresolve == aio.aresolve
+    assert api.AsyncTransport == aio.AsyncTransport
+    assert api.AsyncioTransport == aio.AsyncioTransport
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from cert_chain_resolver.cache import (
+    CacheEntry,
+    DownloadCache,
+    FileSystemCache,
+    MemoryCache,
+    VerificationCache,
+    create_cache,
+    _LRU,
+)
+
+
+def test_lru_evicts_least_recently_used():
+    lru = _LRU(2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1  # "b" is now the oldest
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert len(lru) == 2
+
+
+def test_cache_entry_validators():
+    assert CacheEntry(b"x").validators == {}
+    assert CacheEntry(b"x", etag='"abc"', last_modified="yesterday").validators == {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "yesterday",
+    }
+
+
+def test_cache_entry_roundtrip():
+    entry = CacheEntry(b"\x30\x82", etag='"1"', last_modified="now", fetched_at=10.0)
+    restored = CacheEntry.from_dict(json.loads(json.dumps(entry.to_dict())))
+
+    assert restored.content == entry.content
+    assert restored.etag == entry.etag
+    assert restored.last_modified == entry.last_modified
+    assert restored.fetched_at == entry.fetched_at
+
+
+def test_download_cache_needs_impl():
+    with pytest.raises(NotImplementedError):
+        DownloadCache().get("http://example.com")
+    with pytest.raises(NotImplementedError):
+        DownloadCache().set("http://example.com", CacheEntry(b""))
+
+
+@pytest.mark.parametrize("age,expected", [(0, True), (100, False)])
+def test_is_fresh(age, expected):
+    cache = MemoryCache(ttl=50)
+    assert cache.is_fresh(CacheEntry(b"", fetched_at=time.time() - age)) is expected
+
+
+def test_memory_cache_respects_maxsize():
+    cache = MemoryCache(maxsize=1)
+    cache.set("http://a", CacheEntry(b"a"))
+    cache.set("http://b", CacheEntry(b"b"))
+
+    assert cache.get("http://a") is None
+    assert cache.get("http://b").content == b"b"
+    assert len(cache) == 1
+
+
+def test_filesystem_cache_persists(tmpdir):
+    path = str(tmpdir.join("cache"))
+    FileSystemCache(path).set("http://a", CacheEntry(b"a", etag='"1"'))
+
+    entry = FileSystemCache(path).get("http://a")
+    assert entry.content == b"a"
+    assert entry.etag == '"1"'
+    assert [x for x in os.listdir(path) if x.endswith(".tmp")] == []
+
+
+def test_filesystem_cache_miss_on_corrupt_entry(tmpdir):
+    cache = FileSystemCache(str(tmpdir))
+    cache.set("http://a", CacheEntry(b"a"))
+    with open(cache._entry_path("http://a"), "w") as f:
+        f.write("{not json")
+
+    assert cache.get("http://a") is None
+    assert cache.get("http://never-stored") is None
+
+
+def test_memory_cache_reads_and_writes_through_backend(tmpdir):
+    backend = FileSystemCache(str(tmpdir))
+    backend.set("http://a", CacheEntry(b"a"))
+
+    cache = MemoryCache(backend=backend)
+    assert cache.get("http://a").content == b"a"
+    assert len(cache) == 1
+
+    cache.set("http://b", CacheEntry(b"b"))
+    assert backend.get("http://b").content == b"b"
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_create_cache(tmpdir):
+    assert create_cache().backend is None
+    assert create_cache(str(tmpdir)).backend.path == str(tmpdir)
+
+
+def test_verification_cache_counts_hits_and_misses():
+    cache = VerificationCache(maxsize=1)
+    assert cache.get(("a", "b")) is None
+    cache.set(("a", "b"), False)
+    assert cache.get(("a", "b")) is False
+    cache.set(("c", "d"), True)
+    assert cache.get(("a", "b")) is None
+
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.clear()
+    assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+
+def test_verification_cache_counters_are_thread_safe():
+    cache = VerificationCache()
+    cache.set(("a", "b"), True)
+
+    def lookup():
+        for _ in range(2000):
+            cache.get(("a", "b"))
+            cache.get(("c", "d"))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert (cache.hits, cache.misses) == (16000, 16000)
+
+
+def test_verification_cache_can_be_disabled():
+    cache = VerificationCache(enabled=False)
+    cache.set(("a", "b"), True)
+
+    assert cache.get(("a", "b")) is None
+    assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
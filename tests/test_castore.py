@@ -1,9 +1,41 @@
 import pytest
-from cert_chain_resolver.castore.base_store import CAStore
+from cert_chain_resolver.castore.base_store import CAStore, sort_candidates
+from cert_chain_resolver.exceptions import RootCertificateNotFound
 from cert_chain_resolver.models import Cert
+from ._utils import make_cert
 
 
 def test_find_issuer_candidates_needs_impl(mocker):
     m = mocker.Mock(spec=Cert)
     with pytest.raises(NotImplementedError):
         CAStore().find_issuer_candidates(m)
+
+
+def test_sort_candidates_prefers_key_identifier_matches():
+    root = make_cert("Root")
+    rekeyed_root = make_cert("Root")
+    renamed_root = make_cert("Renamed root", key=root[1])
+    root_without_ski = make_cert("Root", with_key_identifiers=False)
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+
+    candidates = [
+        Cert(x[0]) for x in [renamed_root, rekeyed_root, root_without_ski, root]
+    ]
+    assert sort_candidates(leaf, candidates + candidates[:1]) == [
+        Cert(root[0]),
+        Cert(root_without_ski[0]),
+        Cert(rekeyed_root[0]),
+    ]
+
+
+def test_find_issuer_requires_the_issuer_name(mocker):
+    root = make_cert("Root")
+    renamed_root = Cert(make_cert("Renamed root", key=root[1])[0])
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    store = CAStore()
+    mocker.patch.object(store, "find_issuer_candidates", return_value=[renamed_root])
+
+    # The renamed root holds the key that signed leaf, but it does not chain by name
+    assert leaf.is_issued_by(renamed_root)
+    with pytest.raises(RootCertificateNotFound):
+        store.find_issuer(leaf)
@@ -0,0 +1,83 @@
+import sys
+import types
+
+import pytest
+
+from cert_chain_resolver.castore.base_store import CAStore
+from cert_chain_resolver.castore.certifi_store import CertifiStore
+from cert_chain_resolver.castore.composite import CompositeStore
+from cert_chain_resolver.castore.file_system import FileSystemStore
+from cert_chain_resolver.exceptions import (
+    CertificateChainResolverError,
+    RootCertificateNotFound,
+)
+from cert_chain_resolver.models import Cert
+from tests._utils import make_cert, write_bundle
+
+
+@pytest.fixture
+def certifi_bundle(tmpdir, mocker):
+    root = make_cert("Certifi Root")
+    path = write_bundle(tmpdir, root, name="cacert.pem")
+    certifi = types.ModuleType("certifi")
+    certifi.where = lambda: path
+    mocker.patch.dict(sys.modules, {"certifi": certifi})
+    return root, path
+
+
+def test_certifi_store(certifi_bundle):
+    root, path = certifi_bundle
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+
+    store = CertifiStore()
+
+    assert store.path == path
+    assert store.find_issuer(leaf) == Cert(root[0])
+
+
+def test_certifi_store_without_certifi(mocker):
+    mocker.patch.dict(sys.modules, {"certifi": None})
+
+    with pytest.raises(CertificateChainResolverError):
+        CertifiStore()
+
+
+def test_composite_store_stops_at_first_store_with_the_issuer(tmpdir, mocker):
+    custom, system = make_cert("Custom Root"), make_cert("System Root")
+    first = FileSystemStore(write_bundle(tmpdir, custom, name="custom.pem"))
+    last = FileSystemStore(write_bundle(tmpdir, system, name="system.pem"))
+    store = CompositeStore([first, last])
+    load_index = mocker.spy(last, "_load_index")
+
+    leaf = Cert(make_cert("Leaf", issuer=custom, is_ca=False)[0])
+    assert store.find_issuer(leaf) == Cert(custom[0])
+    # The system bundle is not needed, so it is not parsed
+    assert not load_index.called
+
+    leaf = Cert(make_cert("Leaf", issuer=system, is_ca=False)[0])
+    assert store.find_issuer(leaf) == Cert(system[0])
+    assert load_index.called
+
+
+def test_composite_store_priority(tmpdir, certifi_bundle):
+    root, _ = certifi_bundle
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    system = FileSystemStore(write_bundle(tmpdir, root, name="system.pem"))
+    store = CompositeStore([CertifiStore(), system])
+
+    assert store.find_issuer(leaf) == Cert(root[0])
+    # Both hold the root, duplicates are only listed once
+    assert store.find_issuer_candidates(leaf) == [Cert(root[0])]
+    assert system._index is not None
+
+
+def test_composite_store_raises_when_no_store_has_the_issuer(tmpdir):
+    class EmptyStore(CAStore):
+        def find_issuer_candidates(self, cert):
+            return []
+
+    leaf = Cert(make_cert("Leaf", issuer=make_cert("Root"), is_ca=False)[0])
+
+    with pytest.raises(RootCertificateNotFound) as e:
+        CompositeStore([EmptyStore(), EmptyStore()]).find_issuer(leaf)
+    assert "EmptyStore, EmptyStore" in str(e.value)
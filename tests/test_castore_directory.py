@@ -0,0 +1,99 @@
+from cryptography.hazmat.primitives.serialization import Encoding
+import pytest
+
+from cert_chain_resolver import metrics
+from cert_chain_resolver.castore.directory import DirectoryStore
+from cert_chain_resolver.exceptions import (
+    CertificateChainResolverError,
+    RootCertificateNotFound,
+)
+from cert_chain_resolver.models import Cert
+from cert_chain_resolver.utils import x509_name_hash
+from tests._utils import make_cert
+
+
+def rehash(directory, *certs):
+    """Store certs like c_rehash does, as <subject hash>.N"""
+    for cert in certs:
+        name_hash = x509_name_hash(cert.subject_der)
+        sequence = 0
+        while directory.join("{0}.{1}".format(name_hash, sequence)).check():
+            sequence += 1
+        directory.join("{0}.{1}".format(name_hash, sequence)).write(cert.export())
+
+
+def test_find_issuer(tmpdir):
+    root = make_cert("Root")
+    other = make_cert("Other")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    rehash(tmpdir, Cert(other[0]), Cert(root[0]))
+    store = DirectoryStore(str(tmpdir))
+
+    assert store.find_issuer(leaf) == Cert(root[0])
+    with pytest.raises(RootCertificateNotFound):
+        store.find_issuer(Cert(make_cert("Orphan", issuer=make_cert("Missing"))[0]))
+
+
+def test_find_issuer_only_reads_matching_files(tmpdir):
+    stats = metrics.StatsCollector()
+    root = make_cert("Root")
+    # Re-keyed root with the same subject, stored as <hash>.0
+    rekeyed = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    rehash(tmpdir, Cert(rekeyed[0]), Cert(root[0]))
+    tmpdir.join("ffffffff.0").write("Not read")
+    store = DirectoryStore(str(tmpdir))
+
+    metrics.set_observer(stats)
+    try:
+        candidates = store.find_issuer_candidates(leaf)
+    finally:
+        metrics.set_observer(None)
+
+    # The Authority Key Identifier puts the real issuer first
+    assert candidates == [Cert(root[0]), Cert(rekeyed[0])]
+    assert stats.counters["store.files_read"] == 2
+
+
+def test_find_issuer_stops_at_first_missing_file(tmpdir):
+    root = Cert(make_cert("Root")[0])
+    name_hash = x509_name_hash(root.subject_der)
+    tmpdir.join(name_hash + ".1").write(root.export())
+
+    assert DirectoryStore(str(tmpdir)).find_issuer_candidates(root) == []
+
+
+def test_find_issuer_reads_der_and_skips_broken_files(tmpdir):
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    name_hash = x509_name_hash(leaf.issuer_der)
+    tmpdir.join(name_hash + ".0").write("Not a certificate")
+    tmpdir.join(name_hash + ".1").write(root[0].public_bytes(Encoding.DER), "wb")
+
+    assert DirectoryStore(str(tmpdir)).find_issuer(leaf) == Cert(root[0])
+
+
+def test_path_is_not_a_directory(tmpdir):
+    bundle = tmpdir.join("bundle.pem")
+    bundle.write("")
+
+    with pytest.raises(CertificateChainResolverError):
+        DirectoryStore(str(bundle))
+    with pytest.raises(CertificateChainResolverError):
+        DirectoryStore(str(tmpdir.join("missing")))
+
+
+def test_detects_system_directory(mocker, tmpdir):
+    mocker.patch(
+        "cert_chain_resolver.castore.directory.eligible_dirs",
+        [None, str(tmpdir.join("missing")), str(tmpdir)],
+    )
+
+    assert DirectoryStore().path == str(tmpdir)
+
+
+def test_no_system_directory(mocker):
+    mocker.patch("cert_chain_resolver.castore.directory.eligible_dirs", [None])
+
+    with pytest.raises(CertificateChainResolverError):
+        DirectoryStore()
@@ -4,8 +4,12 @@ from cert_chain_resolver.exceptions import (
     RootCertificateNotFound,
 )
 from cert_chain_resolver.models import Cert
+from cert_chain_resolver.castore.bundle_index import BundleIndex
 from cert_chain_resolver.castore.file_system import FileSystemStore, eligible_paths
 from tests.fixtures import BUNDLE_FIXTURES, certfixture_to_id
+from tests._utils import make_cert, write_bundle
+import os
+import time
 import tempfile
 import pytest
 
@@ -44,3 +48,204 @@ def test_bundle_path_cannot_be_found(monkeypatch):
     )
     with pytest.raises(CertificateChainResolverError, match="Can't detect CA bundle"):
         FileSystemStore()
+
+
+def test_rekeyed_roots_are_ordered_by_key_identifier(tmpdir, mocker):
+    old_root, new_root = make_cert("Root"), make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=new_root, is_ca=False)[0])
+    bundle = tmpdir.join("bundle.pem")
+    bundle.write(
+        b"".join(Cert(x[0]).export().encode("ascii") for x in [old_root, new_root]),
+        "wb",
+    )
+    store = FileSystemStore(str(bundle))
+
+    assert store.find_issuer_candidates(leaf) == [Cert(new_root[0]), Cert(old_root[0])]
+
+    spy = mocker.spy(Cert, "is_issued_by")
+    assert store.find_issuer(leaf) == Cert(new_root[0])
+    assert spy.call_count == 1
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_key_identifier_does_not_match_other_subjects(tmpdir, lazy):
+    root = make_cert("Root")
+    renamed_root = make_cert("Renamed root", key=root[1])
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    store = FileSystemStore(write_bundle(tmpdir, renamed_root), lazy=lazy)
+
+    assert store.find_issuer_candidates(leaf) == []
+    with pytest.raises(RootCertificateNotFound):
+        store.find_issuer(leaf)
+
+
+def test_index_is_persisted_and_loads_roots_lazily(tmpdir, mocker):
+    root, other = make_cert("Root"), make_cert("Other Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    path = write_bundle(tmpdir, other, root)
+    index_dir = str(tmpdir.join("index"))
+
+    assert FileSystemStore(path, index_dir=index_dir).find_issuer(leaf) == Cert(root[0])
+    assert os.listdir(index_dir) == [
+        os.path.basename(FileSystemStore(path, index_dir=index_dir).index_path)
+    ]
+
+    load = mocker.spy(Cert, "load")
+    store = FileSystemStore(path, index_dir=index_dir)
+    assert store.find_issuer(leaf) == Cert(root[0])
+    # Only the matching root is parsed
+    assert load.call_count == 1
+    assert len(store._index) == 2
+
+
+def test_index_is_rebuilt_when_bundle_changes(tmpdir):
+    root, new_root = make_cert("Root"), make_cert("New Root")
+    leaf = Cert(make_cert("Leaf", issuer=new_root, is_ca=False)[0])
+    path = write_bundle(tmpdir, root)
+    index_dir = str(tmpdir.join("index"))
+    FileSystemStore(path, index_dir=index_dir).find_issuer_candidates(leaf)
+
+    write_bundle(tmpdir, root, new_root)
+
+    assert FileSystemStore(path, index_dir=index_dir).find_issuer(leaf) == Cert(
+        new_root[0]
+    )
+
+
+def test_corrupt_index_is_ignored(tmpdir):
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    store = FileSystemStore(write_bundle(tmpdir, root), index_dir=str(tmpdir))
+    with open(store.index_path, "w") as f:
+        f.write("{not json")
+
+    assert store.find_issuer(leaf) == Cert(root[0])
+
+
+def test_empty_bundle_is_parsed_once(tmpdir, mocker):
+    leaf = Cert(make_cert("Leaf", issuer=make_cert("Root"), is_ca=False)[0])
+    store = FileSystemStore(write_bundle(tmpdir))
+    build = mocker.spy(BundleIndex, "build")
+
+    for _ in range(2):
+        with pytest.raises(RootCertificateNotFound):
+            store.find_issuer(leaf)
+    assert build.call_count == 1
+
+
+def test_lazy_store_only_parses_candidates(tmpdir, mocker):
+    roots = [make_cert("Root {0}".format(i)) for i in range(3)]
+    leaf = Cert(make_cert("Leaf", issuer=roots[1], is_ca=False)[0])
+    store = FileSystemStore(write_bundle(tmpdir, *roots), lazy=True)
+
+    load = mocker.spy(Cert, "load")
+    assert store.find_issuer(leaf) == Cert(roots[1][0])
+    assert load.call_count == 1
+    assert len(store._index) == 3
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_bundle_with_crlf_line_endings(tmpdir, lazy):
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    bundle = tmpdir.join("bundle.pem")
+    bundle.write(Cert(root[0]).export().strip().replace("\n", "\r\n"))
+
+    assert FileSystemStore(str(bundle), lazy=lazy).find_issuer(leaf) == Cert(root[0])
+
+
+@pytest.mark.parametrize("lazy,persisted", [(True, False), (False, True)])
+def test_rewritten_bundle_does_not_affect_index_in_use(tmpdir, lazy, persisted):
+    root, other = make_cert("Root"), make_cert("Other Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    other_leaf = Cert(make_cert("Leaf", issuer=other, is_ca=False)[0])
+    path = write_bundle(tmpdir, root, other)
+    index_dir = str(tmpdir.join("index")) if persisted else None
+    if persisted:
+        FileSystemStore(path, index_dir=index_dir).find_issuer(leaf)
+    store = FileSystemStore(path, index_dir=index_dir, lazy=lazy)
+    store.find_issuer(leaf)
+
+    # Rewritten in place, every offset in the index moves
+    write_bundle(tmpdir, make_cert("New Root"), root, other)
+
+    assert store.find_issuer(other_leaf) == Cert(other[0])
+
+
+def wait_for_index_swap(store, index, timeout=5):
+    deadline = time.time() + timeout
+    while store._index is index and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_bundle_is_reloaded_in_the_background(tmpdir):
+    root, new_root = make_cert("Root"), make_cert("New Root")
+    leaf = Cert(make_cert("Leaf", issuer=new_root, is_ca=False)[0])
+    path = write_bundle(tmpdir, root)
+    store = FileSystemStore(path, reload_interval=0)
+    with pytest.raises(RootCertificateNotFound):
+        store.find_issuer(leaf)
+    index = store._index
+
+    # Replaced like update-ca-certificates does
+    replacement = tmpdir.join("replacement.pem")
+    replacement.write(Cert(root[0]).export() + Cert(new_root[0]).export())
+    os.rename(str(replacement), path)
+
+    # The lookup noticing the change does not wait for the new index
+    with pytest.raises(RootCertificateNotFound):
+        store.find_issuer(leaf)
+    wait_for_index_swap(store, index)
+    assert store.find_issuer(leaf) == Cert(new_root[0])
+
+
+def test_bundle_rewritten_in_place_while_reloading(tmpdir):
+    root, other, new_root = make_cert("Root"), make_cert("Other"), make_cert("New")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    other_leaf = Cert(make_cert("Leaf", issuer=other, is_ca=False)[0])
+    new_leaf = Cert(make_cert("Leaf", issuer=new_root, is_ca=False)[0])
+    path = write_bundle(tmpdir, root, other)
+    store = FileSystemStore(path, lazy=True, reload_interval=0)
+    store.find_issuer(leaf)
+    index = store._index
+
+    write_bundle(tmpdir, new_root, root, other)
+
+    # The previous index serves the lookups until the new one is swapped in
+    assert store.find_issuer(other_leaf) == Cert(other[0])
+    wait_for_index_swap(store, index)
+    assert store.find_issuer(new_leaf) == Cert(new_root[0])
+    assert store.find_issuer(other_leaf) == Cert(other[0])
+
+
+def test_bundle_is_only_checked_every_reload_interval(tmpdir, mocker):
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    store = FileSystemStore(write_bundle(tmpdir, root), reload_interval=3600)
+    store.find_issuer(leaf)
+    stat = mocker.patch("cert_chain_resolver.castore.file_system._bundle_stat")
+
+    store.find_issuer(leaf)
+
+    assert not stat.called
+
+
+def test_failed_reload_keeps_the_old_index(tmpdir, mocker):
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    path = write_bundle(tmpdir, root)
+    store = FileSystemStore(path, reload_interval=0)
+    store.find_issuer(leaf)
+    index = store._index
+    mocker.patch.object(store, "_load_index", side_effect=ValueError("Half written"))
+    with open(path, "a") as f:
+        f.write("-----BEGIN CERTIFICATE-----\n")
+
+    store.find_issuer(leaf)
+    deadline = time.time() + 5
+    while store._reloading and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert store._index is index
+    assert not store._reloading
+    assert store.find_issuer(leaf) == Cert(root[0])
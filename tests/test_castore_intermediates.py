@@ -0,0 +1,110 @@
+from cryptography.hazmat.primitives.serialization import Encoding
+import pytest
+
+from cert_chain_resolver.castore import bundle_index
+from cert_chain_resolver.castore.bundle_index import BundleIndex
+from cert_chain_resolver.castore.intermediates import IntermediateStore
+from cert_chain_resolver.exceptions import (
+    CertificateChainResolverError,
+    RootCertificateNotFound,
+)
+from cert_chain_resolver.models import Cert
+from cert_chain_resolver.resolver import resolve
+from tests._utils import make_cert
+
+
+@pytest.fixture
+def hierarchy():
+    root = make_cert("Root")
+    intermediate = make_cert("Intermediate", issuer=root)
+    leaf = make_cert(
+        "Leaf", issuer=intermediate, is_ca=False, aia="http://127.0.0.1:1/int.der"
+    )
+    return root, intermediate, leaf
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_find_issuer_in_bundle(tmpdir, hierarchy, lazy):
+    root, intermediate, leaf = hierarchy
+    other = make_cert("Other", issuer=root)
+    bundle = tmpdir.join("intermediates.pem")
+    bundle.write(Cert(other[0]).export() + Cert(intermediate[0]).export())
+
+    store = IntermediateStore(str(bundle), lazy=lazy)
+
+    assert store.find_issuer(Cert(leaf[0])) == Cert(intermediate[0])
+    with pytest.raises(RootCertificateNotFound):
+        store.find_issuer(Cert(intermediate[0]))
+
+
+def test_find_issuer_in_directory(tmpdir, hierarchy):
+    root, intermediate, leaf = hierarchy
+    tmpdir.join("intermediate.der").write(
+        intermediate[0].public_bytes(Encoding.DER), "wb"
+    )
+    tmpdir.join("copy.pem").write(Cert(intermediate[0]).export())
+    tmpdir.join("README").write("Not a certificate")
+    tmpdir.join("garbage.der").write(b"\x30\x82\xff\xff", "wb")
+    tmpdir.mkdir("nested")
+
+    store = IntermediateStore(str(tmpdir))
+
+    assert store.find_issuer_candidates(Cert(leaf[0])) == [Cert(intermediate[0])]
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_directory_is_indexed_once(tmpdir, hierarchy, mocker, lazy):
+    root, intermediate, leaf = hierarchy
+    other = make_cert("Other", issuer=root)
+    other_leaf = Cert(make_cert("Other leaf", issuer=other, is_ca=False)[0])
+    tmpdir.join("a.der").write(intermediate[0].public_bytes(Encoding.DER), "wb")
+    tmpdir.join("b.txt").write("Not a certificate")
+    tmpdir.join("c.pem").write(Cert(root[0]).export() + Cert(other[0]).export())
+    bundle_key = mocker.spy(bundle_index, "bundle_key")
+    merge = mocker.spy(BundleIndex, "merge")
+
+    store = IntermediateStore(str(tmpdir), lazy=lazy)
+
+    assert store.find_issuer(Cert(leaf[0])) == Cert(intermediate[0])
+    assert store.find_issuer(other_leaf) == Cert(other[0])
+    assert store.find_issuer(Cert(intermediate[0])) == Cert(root[0])
+    assert merge.call_count == 1
+    assert not bundle_key.called
+
+
+def test_path_does_not_exist(tmpdir):
+    with pytest.raises(CertificateChainResolverError):
+        IntermediateStore(str(tmpdir.join("missing")))
+
+
+def test_resolve_uses_intermediates_before_downloading(tmpdir, hierarchy, mocker):
+    root, intermediate, leaf = hierarchy
+    bundle = tmpdir.join("intermediates.pem")
+    bundle.write(Cert(intermediate[0]).export() + Cert(root[0]).export())
+    download = mocker.patch("cert_chain_resolver.resolver._download")
+
+    chain = resolve(
+        Cert(leaf[0]).export().encode("ascii"),
+        intermediate_store=IntermediateStore(str(bundle)),
+    )
+
+    assert list(chain) == [Cert(x[0]) for x in (leaf, intermediate, root)]
+    assert not download.called
+
+
+def test_resolve_downloads_on_a_miss(tmpdir, hierarchy, mocker):
+    root, intermediate, leaf = hierarchy
+    bundle = tmpdir.join("intermediates.pem")
+    bundle.write(Cert(make_cert("Other")[0]).export())
+    download = mocker.patch(
+        "cert_chain_resolver.resolver._download",
+        return_value=intermediate[0].public_bytes(Encoding.DER),
+    )
+
+    chain = resolve(
+        Cert(leaf[0]).export().encode("ascii"),
+        intermediate_store=IntermediateStore(str(bundle)),
+    )
+
+    assert list(chain) == [Cert(leaf[0]), Cert(intermediate[0])]
+    assert download.call_args[0] == ("http://127.0.0.1:1/int.der",)
@@ -0,0 +1,128 @@
+import multiprocessing
+
+import pytest
+
+from cert_chain_resolver.castore.shared import SharedBundleStore, build_blob
+from cert_chain_resolver.exceptions import (
+    CertificateChainResolverError,
+    RootCertificateNotFound,
+)
+from cert_chain_resolver.models import Cert
+from tests._utils import make_cert
+
+
+@pytest.fixture
+def roots(tmpdir):
+    root = make_cert("Root")
+    # Re-keyed root with the same subject and a root without key identifiers
+    rekeyed = make_cert("Root")
+    legacy = make_cert("Legacy", with_key_identifiers=False)
+    bundle = tmpdir.join("bundle.pem")
+    bundle.write("".join(Cert(c[0]).export() for c in (rekeyed, legacy, root)))
+    return root, rekeyed, legacy, str(bundle)
+
+
+def test_find_issuer(tmpdir, roots):
+    root, rekeyed, legacy, bundle = roots
+    store = SharedBundleStore(str(tmpdir.join("roots.blob")), bundle_path=bundle)
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    legacy_leaf = Cert(
+        make_cert("Leaf", issuer=legacy, is_ca=False, with_key_identifiers=False)[0]
+    )
+
+    assert store.find_issuer_candidates(leaf) == [Cert(root[0]), Cert(rekeyed[0])]
+    assert store.find_issuer(leaf) == Cert(root[0])
+    assert store.find_issuer(legacy_leaf) == Cert(legacy[0])
+    with pytest.raises(RootCertificateNotFound):
+        store.find_issuer(Cert(make_cert("Orphan", issuer=make_cert("Other"))[0]))
+
+
+def test_key_identifier_does_not_match_other_subjects(tmpdir):
+    root = make_cert("Root")
+    bundle = tmpdir.join("bundle.pem")
+    bundle.write(Cert(make_cert("Renamed root", key=root[1])[0]).export())
+    store = SharedBundleStore(str(tmpdir.join("roots.blob")), bundle_path=str(bundle))
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+
+    assert store.find_issuer_candidates(leaf) == []
+
+
+def test_candidates_are_parsed_once(tmpdir, roots, mocker):
+    root, _, _, bundle = roots
+    store = SharedBundleStore(str(tmpdir.join("roots.blob")), bundle_path=bundle)
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    store.find_issuer(leaf)
+    load = mocker.spy(Cert, "load")
+
+    store.find_issuer(leaf)
+
+    assert not load.called
+
+
+def test_attach_to_existing_blob(tmpdir, roots):
+    root, _, _, bundle = roots
+    blob = str(tmpdir.join("roots.blob"))
+    build_blob(bundle, blob)
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+
+    store = SharedBundleStore(blob)
+
+    assert store.find_issuer(leaf) == Cert(root[0])
+    store.close()
+    assert store.find_issuer(leaf) == Cert(root[0])
+
+
+def test_rebuilds_when_bundle_changes(tmpdir, roots):
+    root, _, _, bundle = roots
+    blob = str(tmpdir.join("roots.blob"))
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    SharedBundleStore(blob, bundle_path=bundle).find_issuer(leaf)
+
+    other = make_cert("Other")
+    with open(bundle, "a") as f:
+        f.write(Cert(other[0]).export())
+    other_leaf = Cert(make_cert("Leaf", issuer=other, is_ca=False)[0])
+
+    store = SharedBundleStore(blob, bundle_path=bundle)
+    assert store.find_issuer(other_leaf) == Cert(other[0])
+
+
+def test_missing_or_corrupt_blob(tmpdir, roots):
+    blob = tmpdir.join("roots.blob")
+    with pytest.raises(CertificateChainResolverError):
+        SharedBundleStore(str(blob))
+    with pytest.raises(CertificateChainResolverError):
+        SharedBundleStore(str(blob), bundle_path=str(tmpdir.join("missing.pem")))
+
+    blob.write("garbage")
+    store = SharedBundleStore(str(blob))
+    with pytest.raises(CertificateChainResolverError):
+        store.find_issuer(Cert(roots[0][0]))
+
+    # A corrupt blob is rebuilt when the bundle is known
+    root = roots[0]
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    store = SharedBundleStore(str(blob), bundle_path=roots[3])
+    assert store.find_issuer(leaf) == Cert(root[0])
+
+
+def _lookup(args):
+    blob, leaf_pem = args
+    store = SharedBundleStore(blob)
+    return store.find_issuer(Cert.load(leaf_pem)).export()
+
+
+def test_shared_between_processes(tmpdir, roots):
+    root, _, _, bundle = roots
+    blob = str(tmpdir.join("roots.blob"))
+    build_blob(bundle, blob)
+    leaf_pem = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0]).export()
+
+    pool = multiprocessing.Pool(2)
+    try:
+        results = pool.map(_lookup, [(blob, leaf_pem.encode("ascii"))] * 4)
+    finally:
+        pool.close()
+        pool.join()
+
+    assert results == [Cert(root[0]).export()] * 4
@@ -1,12 +1,27 @@
 import importlib
+import json
+import os
 import sys
+import types
 from tempfile import NamedTemporaryFile
 import pytest
-from cert_chain_resolver import __is_py3__
-
-from cert_chain_resolver.cli import cli, main, parse_args
+from cert_chain_resolver import __is_py3__, metrics
+
+from cert_chain_resolver.cli import (
+    cli,
+    cli_batch,
+    main,
+    parse_args,
+    parse_serve_args,
+    _iter_batch_paths,
+)
+from cert_chain_resolver.castore.certifi_store import CertifiStore
+from cert_chain_resolver.castore.composite import CompositeStore
+from cert_chain_resolver.castore.directory import DirectoryStore
 from cert_chain_resolver.castore.file_system import FileSystemStore
-from tests._utils import CRYPTOGRAPHY_MAJOR
+from cert_chain_resolver.models import Cert
+from cert_chain_resolver.resolver import resolve_many
+from tests._utils import CRYPTOGRAPHY_MAJOR, make_cert
 from .fixtures import BUNDLE_FIXTURES, certfixture_to_id
 
 try:
@@ -78,6 +93,79 @@ except NameError:
                 "ca_bundle_path": "/path/to/ca/bundle",
             },
         ),
+        (
+            ["--cache-dir", "/path/to/cache"],
+            {
+                "file_name": "-",
+                "info": False,
+                "include_root": False,
+                "ca_bundle_path": None,
+                "cache_dir": "/path/to/cache",
+            },
+        ),
+        (
+            ["--timeout", "2.5"],
+            {
+                "file_name": "-",
+                "info": False,
+                "include_root": False,
+                "ca_bundle_path": None,
+                "timeout": 2.5,
+            },
+        ),
+        (
+            ["--batch", "certs/", "--output-dir", "out/", "-j", "4"],
+            {
+                "file_name": "-",
+                "info": False,
+                "include_root": False,
+                "ca_bundle_path": None,
+                "batch": "certs/",
+                "output_dir": "out/",
+                "workers": 4,
+            },
+        ),
+        (
+            ["--format", "ndjson", "--include-pem"],
+            {
+                "file_name": "-",
+                "info": False,
+                "include_root": False,
+                "ca_bundle_path": None,
+                "output_format": "ndjson",
+                "include_pem": True,
+            },
+        ),
+        (
+            ["--retries", "0"],
+            {
+                "file_name": "-",
+                "info": False,
+                "include_root": False,
+                "ca_bundle_path": None,
+                "retries": 0,
+            },
+        ),
+        (
+            ["--intermediates", "/path/to/intermediates"],
+            {
+                "file_name": "-",
+                "info": False,
+                "include_root": False,
+                "ca_bundle_path": None,
+                "intermediates": "/path/to/intermediates",
+            },
+        ),
+        (
+            ["--stats"],
+            {
+                "file_name": "-",
+                "info": False,
+                "include_root": False,
+                "ca_bundle_path": None,
+                "stats": True,
+            },
+        ),
     ],
 )
 def test_parse_args(cli_args, expected, monkeypatch):
@@ -89,6 +177,23 @@ def test_parse_args(cli_args, expected, monkeypatch):
     assert args.info == expected["info"]
     assert args.include_root == expected["include_root"]
     assert args.ca_bundle_path == expected["ca_bundle_path"]
+    assert args.cache_dir == expected.get("cache_dir")
+    assert args.timeout == expected.get("timeout", 30)
+    assert args.batch == expected.get("batch")
+    assert args.output_dir == expected.get("output_dir")
+    assert args.workers == expected.get("workers", 8)
+    assert args.output_format == expected.get("output_format", "text")
+    assert args.include_pem == expected.get("include_pem", False)
+    assert args.stats == expected.get("stats", False)
+    assert args.retries == expected.get("retries", 2)
+    assert args.intermediates == expected.get("intermediates")
+
+
+def test_parse_args_batch_requires_output_dir(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["script_name", "--batch", "certs/"])
+
+    with pytest.raises(SystemExit):
+        parse_args()
 
 
 @pytest.mark.parametrize("bundle", BUNDLE_FIXTURES, ids=certfixture_to_id)
@@ -192,7 +297,19 @@ def test_display_flag_includes_warning_when_root_was_requested_but_not_found(cap
 )
 def test_main_handles_different_file_input(mocker, file_name, expected_content):
     args = mocker.Mock(
-        info=True, include_root=False, ca_bundle_path="/test/path", file_name="test.pem"
+        info=True,
+        include_root=False,
+        ca_bundle_path="/test/path",
+        file_name="test.pem",
+        cache_dir=None,
+        timeout=5,
+        batch=None,
+        output_format="text",
+        include_pem=False,
+        stats=False,
+        retries=2,
+        intermediates=None,
+        use_certifi_store=False,
     )
     args.file_name = file_name
     mocker.patch("cert_chain_resolver.cli.parse_args", return_value=args)
@@ -217,14 +334,74 @@ def test_main_handles_different_file_input(mocker, file_name, expected_content):
     main()
 
     assert fs_store.call_args == mocker.call(
-        "/test/path",
+        "/test/path", index_dir=None, reload_interval=None
     )
     assert mock_cli.call_args == mocker.call(
         file_bytes=expected_content,
         show_details=True,
         include_root=False,
         root_ca_store=mocker.ANY,
+        cache=None,
+        pool=mocker.ANY,
+        output_format="text",
+        include_pem=False,
+        retry=mocker.ANY,
+        intermediate_store=None,
+    )
+    assert mock_cli.call_args[1]["pool"].timeout == 5
+    assert mock_cli.call_args[1]["retry"].attempts == 3
+
+
+def test_main_creates_persistent_cache(mocker, tmpdir):
+    args = mocker.Mock(
+        info=False,
+        include_root=False,
+        ca_bundle_path=None,
+        file_name="test.pem",
+        cache_dir=str(tmpdir),
+        timeout=30,
+        batch=None,
+        output_format="text",
+        include_pem=False,
+        stats=False,
+        retries=2,
+        intermediates=None,
+        use_certifi_store=False,
     )
+    mocker.patch("cert_chain_resolver.cli.parse_args", return_value=args)
+    fs_store = mocker.patch("cert_chain_resolver.cli.FileSystemStore")
+    if __is_py3__:
+        mocker.patch("builtins.open", mocker.mock_open(read_data=b"data"))
+    else:
+        mocker.patch("__builtin__.open", mocker.mock_open(read_data=b"data"))
+    mock_cli = mocker.patch("cert_chain_resolver.cli.cli")
+
+    main()
+
+    cache = mock_cli.call_args[1]["cache"]
+    assert cache.backend.path == str(tmpdir.join("downloads"))
+    assert fs_store.call_args == mocker.call(
+        None, index_dir=str(tmpdir.join("index")), reload_interval=None
+    )
+
+
+def test_main_prints_stats(mocker, capsys, tmpdir):
+    root = make_cert("Root")
+    bundle = tmpdir.join("bundle.pem")
+    bundle.write(Cert(root[0]).export())
+    leaf = tmpdir.join("leaf.pem")
+    leaf.write(Cert(make_cert("Leaf", issuer=root, is_ca=False)[0]).export())
+    mocker.patch(
+        "sys.argv",
+        ["script_name", "--stats", "--ca-bundle-path", str(bundle), str(leaf)],
+    )
+
+    main()
+
+    err = unicode(capsys.readouterr().err)
+    assert "store.find_issuer" in err
+    assert "store.candidates" in err
+    assert not metrics.get_observer().enabled
 
 
 def test_main_no_args_tty_shows_help_and_exits(mocker):
@@ -234,3 +411,237 @@ def test_main_no_args_tty_shows_help_and_exits(mocker):
     with pytest.raises(SystemExit):
         main()
     assert sys.argv == ["script_name", "-h"]
+
+
+def write_certs(directory, names):
+    root = make_cert("Root")
+    for name in names:
+        leaf = Cert(make_cert(name, issuer=root, is_ca=False)[0])
+        directory.join(name + ".crt").write(leaf.export())
+    return Cert(root[0])
+
+
+def test_iter_batch_paths(tmpdir, monkeypatch):
+    certs = tmpdir.mkdir("certs")
+    write_certs(certs, ["a", "b"])
+    certs.mkdir("nested")
+    manifest = tmpdir.join("manifest.txt")
+    manifest.write("# comment\n\n/x/a.crt\n  /y/b.crt  \n")
+
+    expected = [str(certs.join("a.crt")), str(certs.join("b.crt"))]
+    assert list(_iter_batch_paths(str(certs))) == expected
+    assert list(_iter_batch_paths(str(certs.join("*.crt")))) == expected
+    assert list(_iter_batch_paths(str(manifest))) == ["/x/a.crt", "/y/b.crt"]
+
+
+def test_cli_batch_writes_bundles_and_keeps_failures(tmpdir, capsys):
+    certs = tmpdir.mkdir("certs")
+    root = write_certs(certs, ["a", "b"])
+    bundle = tmpdir.join("roots.pem")
+    bundle.write(root.export())
+    certs.join("broken.crt").write("not a certificate")
+    out = tmpdir.join("out")
+
+    failed = cli_batch(
+        iter(
+            [str(certs.join(x)) for x in ["a.crt", "broken.crt", "b.crt"]]
+            + [str(certs.join("a.crt"))]
+        ),
+        str(out),
+        workers=2,
+        include_root=True,
+        root_ca_store=FileSystemStore(str(bundle)),
+    )
+
+    assert failed == 1
+    assert sorted(os.listdir(str(out))) == [
+        "a.crt-2.bundle.pem",
+        "a.crt.bundle.pem",
+        "b.crt.bundle.pem",
+    ]
+    assert out.join("a.crt.bundle.pem").read() == (
+        certs.join("a.crt").read() + root.export()
+    )
+    err = unicode(capsys.readouterr().err)
+    assert "FAILED {0}".format(certs.join("broken.crt")) in err
+    assert "Resolved 3 of 4 certificates" in err
+    assert "1 failed" in err
+
+
+def test_cli_batch_resolves_through_resolve_many(tmpdir, capsys, mocker):
+    certs = tmpdir.mkdir("certs")
+    write_certs(certs, ["a"])
+    spy = mocker.patch("cert_chain_resolver.cli.resolve_many", wraps=resolve_many)
+    paths = [str(certs.join("missing.crt")), str(certs.join("a.crt"))]
+
+    failed = cli_batch(iter(paths), str(tmpdir.join("out")), workers=3)
+
+    assert failed == 1
+    assert spy.call_args[1]["max_workers"] == 3
+    assert spy.call_args[1]["return_exceptions"] is True
+    assert tmpdir.join("out", "a.crt.bundle.pem").check()
+    assert "FAILED {0}".format(paths[0]) in capsys.readouterr().err
+
+
+def test_main_batch_exits_with_failure(mocker, tmpdir):
+    args = mocker.Mock(
+        ca_bundle_path=None,
+        cache_dir=None,
+        timeout=30,
+        batch=str(tmpdir.join("*.crt")),
+        output_dir=str(tmpdir),
+        workers=2,
+        include_root=False,
+        output_format="ndjson",
+        include_pem=False,
+        stats=False,
+        retries=2,
+        intermediates=None,
+        use_certifi_store=False,
+    )
+    mocker.patch("cert_chain_resolver.cli.parse_args", return_value=args)
+    mocker.patch("cert_chain_resolver.cli.FileSystemStore")
+    mock_batch = mocker.patch("cert_chain_resolver.cli.cli_batch", return_value=1)
+
+    with pytest.raises(SystemExit) as e:
+        main()
+
+    assert e.value.code == 1
+    assert mock_batch.call_args[1]["workers"] == 2
+    assert mock_batch.call_args[1]["output_format"] == "ndjson"
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson"])
+def test_cli_writes_a_json_record(capsys, tmpdir, output_format):
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    bundle = tmpdir.join("roots.pem")
+    bundle.write(Cert(root[0]).export())
+
+    cli(
+        file_bytes=leaf.export().encode("ascii"),
+        include_root=True,
+        root_ca_store=FileSystemStore(str(bundle)),
+        output_format=output_format,
+        include_pem=True,
+    )
+
+    out, err = capsys.readouterr()
+    assert err == ""
+    assert (len(out.splitlines()) == 1) is (output_format == "ndjson")
+    record = json.loads(out)
+    assert record["root_found"] is True
+    assert record["chain"] == [
+        leaf.to_dict(include_pem=True),
+        Cert(root[0]).to_dict(include_pem=True),
+    ]
+    assert isinstance(record["chain"][0]["serial"], unicode)
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson"])
+def test_cli_batch_streams_records(tmpdir, capsys, output_format):
+    certs = tmpdir.mkdir("certs")
+    write_certs(certs, ["a"])
+    certs.join("broken.crt").write("not a certificate")
+    paths = [str(certs.join("a.crt")), str(certs.join("broken.crt"))]
+
+    cli_batch(iter(paths), str(tmpdir.join("out")), output_format=output_format)
+
+    out = capsys.readouterr().out
+    if output_format == "json":
+        records = json.loads(out)
+    else:
+        records = [json.loads(line) for line in out.splitlines()]
+    assert [r["source"] for r in records] == paths
+    assert records[0]["output"] == str(tmpdir.join("out", "a.crt.bundle.pem"))
+    assert "pem" not in records[0]["chain"][0]
+    assert "error" in records[1]
+
+
+def test_cli_batch_writes_empty_json_array(tmpdir, capsys):
+    cli_batch(iter([]), str(tmpdir), output_format="json")
+
+    assert json.loads(capsys.readouterr().out) == []
+
+
+def test_parse_serve_args():
+    args = parse_serve_args(["--unix-socket", "/run/ccr.sock", "-q"])
+
+    assert (args.host, args.port, args.unix_socket, args.quiet) == (
+        "127.0.0.1",
+        8080,
+        "/run/ccr.sock",
+        True,
+    )
+    assert args.timeout == 30
+    assert args.reload_interval is None
+    assert parse_serve_args(["--reload-interval", "60"]).reload_interval == 60
+    assert (args.max_depth, args.deadline) == (10, None)
+    args = parse_serve_args(["--max-depth", "4", "--deadline", "2.5"])
+    assert (args.max_depth, args.deadline) == (4, 2.5)
+
+
+def test_main_serve(mocker, monkeypatch, tmpdir):
+    monkeypatch.setattr(
+        "sys.argv", ["script_name", "serve", "--port", "0", "--cache-dir", str(tmpdir)]
+    )
+    fs_store = mocker.patch("cert_chain_resolver.cli.FileSystemStore")
+    create_server = mocker.patch("cert_chain_resolver.server.create_server")
+    server = create_server.return_value
+    server.serve_forever.side_effect = KeyboardInterrupt
+
+    main()
+
+    assert fs_store.call_args == mocker.call(
+        None, index_dir=str(tmpdir.join("index")), reload_interval=None
+    )
+    kwargs = create_server.call_args[1]
+    assert (kwargs["host"], kwargs["port"], kwargs["unix_socket"]) == (
+        "127.0.0.1",
+        0,
+        None,
+    )
+    assert kwargs["cache"].backend.path == str(tmpdir.join("downloads"))
+    assert server.server_close.called
+
+
+def test_main_serve_uses_directory_store(mocker, monkeypatch, tmpdir):
+    monkeypatch.setattr(
+        "sys.argv", ["script_name", "serve", "--ca-bundle-path", str(tmpdir)]
+    )
+    create_server = mocker.patch("cert_chain_resolver.server.create_server")
+    create_server.return_value.serve_forever.side_effect = KeyboardInterrupt
+
+    main()
+
+    store = create_server.call_args[1]["root_ca_store"]
+    assert isinstance(store, DirectoryStore)
+    assert store.path == str(tmpdir)
+
+
+def test_main_serve_uses_certifi_store(mocker, monkeypatch, tmpdir):
+    bundle = tmpdir.join("cacert.pem")
+    bundle.write(Cert(make_cert("Root")[0]).export())
+    certifi = types.ModuleType("certifi")
+    certifi.where = lambda: str(bundle)
+    mocker.patch.dict(sys.modules, {"certifi": certifi})
+    monkeypatch.setattr(
+        "sys.argv",
+        [
+            "script_name",
+            "serve",
+            "--use-certifi-store",
+            "--ca-bundle-path",
+            str(tmpdir),
+        ],
+    )
+    create_server = mocker.patch("cert_chain_resolver.server.create_server")
+    create_server.return_value.serve_forever.side_effect = KeyboardInterrupt
+
+    main()
+
+    store = create_server.call_args[1]["root_ca_store"]
+    assert isinstance(store, CompositeStore)
+    assert isinstance(store.stores[0], DirectoryStore)
+    assert isinstance(store.stores[1], CertifiStore)
+    assert store.stores[1].path == str(bundle)
@@ -0,0 +1,108 @@
+import pytest
+
+from cert_chain_resolver import metrics
+from cert_chain_resolver.cache import CacheEntry, MemoryCache
+from cert_chain_resolver.castore.file_system import FileSystemStore
+from cert_chain_resolver.models import Cert, verification_cache
+from cert_chain_resolver.pool import Response
+from cert_chain_resolver.resolver import _download, resolve
+from tests._utils import make_cert
+
+
+@pytest.fixture
+def stats():
+    collector = metrics.StatsCollector()
+    metrics.set_observer(collector)
+    yield collector
+    metrics.set_observer(None)
+
+
+def test_default_observer_ignores_everything():
+    observer = metrics.get_observer()
+
+    with metrics.span("resolve"):
+        metrics.count("download.bytes", 10)
+
+    assert not observer.enabled
+    assert metrics.span("resolve") is metrics.span("download")
+
+
+def test_set_observer_returns_previous(stats):
+    previous = metrics.set_observer(None)
+
+    assert previous is stats
+    assert metrics.set_observer(stats) is not stats
+
+
+def test_stats_collector_aggregates(stats):
+    stats.record("fetch", 0.1)
+    stats.record("fetch", 0.3)
+    stats.count("download.bytes", 5)
+    stats.count("download.bytes")
+
+    assert stats.spans["fetch"][0] == 2
+    assert stats.spans["fetch"][1] == pytest.approx(0.4)
+    assert stats.spans["fetch"][2] == pytest.approx(0.3)
+    assert stats.counters == {"download.bytes": 6}
+    report = stats.report()
+    assert "fetch" in report
+    assert "download.bytes" in report
+
+
+def test_span_records_even_when_raising(stats):
+    with pytest.raises(ValueError):
+        with metrics.span("resolve"):
+            raise ValueError()
+
+    assert stats.spans["resolve"][0] == 1
+
+
+def test_download_counts_cache_and_bytes(mocker, stats):
+    pool = mocker.Mock()
+    pool.request.return_value = Response(200, {}, b"der")
+    cache = MemoryCache()
+
+    _download("http://ca/issuer.crt", cache=cache, pool=pool)
+    _download("http://ca/issuer.crt", cache=cache, pool=pool)
+
+    assert stats.counters == {
+        "download.cache_misses": 1,
+        "download.cache_hits": 1,
+        "download.bytes": 3,
+    }
+    assert stats.spans["download"][0] == 2
+    assert stats.spans["fetch"][0] == 1
+
+
+def test_download_counts_not_modified(mocker, stats):
+    pool = mocker.Mock()
+    pool.request.return_value = Response(304, {}, b"")
+    cache = MemoryCache(ttl=10)
+    cache.set("http://ca/issuer.crt", CacheEntry(b"der", etag='"v1"', fetched_at=0))
+
+    _download("http://ca/issuer.crt", cache=cache, pool=pool)
+
+    assert stats.counters["download.not_modified"] == 1
+    assert "download.bytes" not in stats.counters
+
+
+def test_resolve_records_pipeline(tmpdir, stats):
+    verification_cache.clear()
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    path = tmpdir.join("bundle.pem")
+    path.write(Cert(root[0]).export())
+    store = FileSystemStore(str(path))
+
+    resolve(leaf.export().encode("ascii"), root_ca_store=store)
+    resolve(leaf.export().encode("ascii"), root_ca_store=store)
+
+    # Recursion within a resolve is not counted as another resolve
+    assert stats.spans["resolve"][0] == 2
+    # Both leaves and the root while indexing the bundle
+    assert stats.spans["cert.load"][0] == 3
+    assert stats.spans["store.load_index"][0] == 1
+    assert stats.spans["store.find_issuer"][0] == 2
+    assert stats.spans["verify"][0] == 1
+    assert stats.counters["verify.cache_hits"] == 1
+    assert stats.counters["store.candidates"] == 2
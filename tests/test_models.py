@@ -1,15 +1,17 @@
 from cert_chain_resolver.exceptions import MissingCertProperty
 from .fixtures import BUNDLE_FIXTURES, CERT_FIXTURES, certfixture_to_id
 from cryptography import x509
-from cert_chain_resolver.models import Cert, CertificateChain
+from cert_chain_resolver.models import Cert, CertificateChain, verification_cache
 from cryptography.x509.oid import ExtensionOID, AuthorityInformationAccessOID, NameOID
+import io
+import json
 import pytest
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
 from cryptography.hazmat.primitives.asymmetric.ec import ECDSA, EllipticCurvePublicKey
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
 from cryptography.exceptions import InvalidSignature
-from ._utils import make_utc_aware_if_cryptography_above_42
+from ._utils import make_utc_aware_if_cryptography_above_42, make_cert, ber_pkcs7
 
 
 
@@ -34,6 +36,11 @@ def mock_x509(mocker):
     return mocker.Mock(spec=x509.Certificate)
 
 
+@pytest.fixture
+def no_verification_cache(monkeypatch):
+    monkeypatch.setattr(verification_cache, "enabled", False)
+
+
 @pytest.fixture
 def mock_cert(mocker, mock_x509):
     cert = mocker.Mock(spec=Cert)
@@ -118,6 +125,24 @@ def test_chaincontainer_props(mocker):
     assert 4 == len(c)
 
 
+@pytest.mark.parametrize("with_root", [True, False])
+def test_certificatechain_certificates_and_to_dict(with_root):
+    root = make_cert("Root")
+    intermediate = make_cert("Intermediate", issuer=root)
+    leaf = make_cert("Leaf", issuer=intermediate, is_ca=False)
+    certs = [Cert(x[0]) for x in (leaf, intermediate, root)]
+    chain = CertificateChain(certs if with_root else certs[:2])
+
+    assert chain.certificates() == certs[:2]
+    assert chain.certificates(include_root=True) == certs[: 3 if with_root else 2]
+    assert chain.to_dict(include_root=True, include_pem=True) == {
+        "chain": [
+            c.to_dict(include_pem=True) for c in chain.certificates(include_root=True)
+        ],
+        "root_found": with_root,
+    }
+
+
 @pytest.mark.parametrize("bundle", BUNDLE_FIXTURES, ids=certfixture_to_id)
 def test_certificatechain_can_construct_from_pem(bundle):
     pem_bundle = b"".join([x["cert_pem"] for x in bundle])
@@ -134,12 +159,24 @@ def test_certificatechain_constructs_from_pem_in_order(bundle):
     assert list(chain) == [Cert(x["cert_x509"]) for x in bundle]
 
 
+@pytest.mark.parametrize("bundle", BUNDLE_FIXTURES, ids=certfixture_to_id)
+def test_certificatechain_from_pem_with_crlf_and_surrounding_text(bundle):
+    pem_bundle = b"subject=...\r\n" + b"".join(
+        [x["cert_pem"].strip().replace(b"\n", b"\r\n") for x in bundle]
+    )
+
+    chain = CertificateChain.load_from_pem(pem_bundle)
+    assert list(chain) == [Cert(x["cert_x509"]) for x in bundle]
+
+
 @pytest.mark.parametrize(
     "prop,extension_oid,expected",
     [
         ("ca_issuer_access_location", ExtensionOID.AUTHORITY_INFORMATION_ACCESS, None),
         ("subject_alternative_names", ExtensionOID.SUBJECT_ALTERNATIVE_NAME, []),
         ("is_ca", ExtensionOID.BASIC_CONSTRAINTS, False),
+        ("subject_key_identifier", ExtensionOID.SUBJECT_KEY_IDENTIFIER, None),
+        ("authority_key_identifier", ExtensionOID.AUTHORITY_KEY_IDENTIFIER, None),
     ],
 )
 def test_missing_cert_extensions_return_defaults_when_missing(
@@ -222,6 +259,7 @@ def test_repr():
         (object, False),  # Unexpected key type FIXME: Maybe this should raise??
     ],
 )
+@pytest.mark.usefixtures("no_verification_cache")
 def test_is_issued_by_handles_different_keys(
     mocker, mock_x509, mock_cert, key_type, expected
 ):
@@ -237,8 +275,132 @@ def test_is_issued_by_handles_different_keys(
     assert subject.is_issued_by(mock_cert) is expected
 
 
+@pytest.mark.usefixtures("no_verification_cache")
 def test_is_issued_raises_when_no_signature_hash_algo(mock_x509, mock_cert):
     mock_x509.signature_hash_algorithm = None
     mock_x509.public_key = lambda: None
     with pytest.raises(MissingCertProperty):
         Cert(mock_x509).is_issued_by(mock_cert)
+
+
+def test_key_identifiers():
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+
+    assert Cert(root[0]).subject_key_identifier == leaf.authority_key_identifier
+    assert leaf.subject_key_identifier != leaf.authority_key_identifier
+    assert len(leaf.authority_key_identifier) == 40
+
+
+def test_cert_has_no_instance_dict():
+    c = Cert(CERT_FIXTURES[0]["cert_x509"])
+    assert not hasattr(c, "__dict__")
+    with pytest.raises(AttributeError):
+        c.unknown_attribute = True
+
+
+@pytest.mark.parametrize(
+    "prop",
+    [
+        "subject",
+        "issuer",
+        "subject_der",
+        "issuer_der",
+        "fingerprint",
+        "is_ca",
+        "ca_issuer_access_location",
+        "subject_key_identifier",
+        "authority_key_identifier",
+    ],
+)
+def test_derived_properties_are_computed_once(mocker, prop):
+    cert = CERT_FIXTURES[0]["cert_x509"]
+    x509_obj = mocker.Mock(spec=x509.Certificate, wraps=cert)
+    x509_obj.subject = mocker.Mock(wraps=cert.subject)
+    x509_obj.issuer = mocker.Mock(wraps=cert.issuer)
+    x509_obj.extensions = mocker.Mock(wraps=cert.extensions)
+    c = Cert(x509_obj)
+
+    def x509_calls():
+        mocks = [x509_obj, x509_obj.extensions, x509_obj.subject, x509_obj.issuer]
+        return sum(len(m.mock_calls) for m in mocks)
+
+    first = getattr(c, prop)
+    calls = x509_calls()
+    assert getattr(c, prop) == first
+    assert getattr(c, prop) == first
+    assert x509_calls() == calls
+
+
+def test_is_issued_by_caches_outcomes(mocker):
+    verification_cache.clear()
+    root = make_cert("Root")
+    other_root = make_cert("Other root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    verify = mocker.spy(Cert, "_verify_signature")
+
+    for _ in range(3):
+        assert leaf.is_issued_by(Cert(root[0])) is True
+        assert leaf.is_issued_by(Cert(other_root[0])) is False
+
+    assert verify.call_count == 2
+    assert (verification_cache.hits, verification_cache.misses) == (4, 2)
+
+
+def test_is_issued_by_without_cache(mocker, no_verification_cache):
+    verification_cache.clear()
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    verify = mocker.spy(Cert, "_verify_signature")
+
+    assert leaf.is_issued_by(Cert(root[0])) is True
+    assert leaf.is_issued_by(Cert(root[0])) is True
+
+    assert verify.call_count == 2
+    assert len(verification_cache) == 0
+
+
+def test_public_key_hash_is_shared_by_rekeyed_cert():
+    root = make_cert("Root")
+    same_key = make_cert("Renamed root", key=root[1])
+
+    assert Cert(root[0]).public_key_hash == Cert(same_key[0]).public_key_hash
+    assert Cert(root[0]).public_key_hash != Cert(make_cert("Root")[0]).public_key_hash
+
+
+def test_issuer_der_matches_subject_der_of_issuer():
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+
+    assert leaf.issuer_der == Cert(root[0]).subject_der
+    assert leaf.issuer_der != leaf.subject_der
+
+
+@pytest.mark.filterwarnings("ignore:PKCS#7 certificates could not be parsed as DER")
+def test_load_all_reads_ber_pkcs7():
+    root = make_cert("Root")
+    intermediate = make_cert("Intermediate", issuer=root)
+
+    certs = Cert.load_all(ber_pkcs7([intermediate[0], root[0]]))
+
+    assert sorted(c.common_name for c in certs) == ["Intermediate", "Root"]
+
+
+@pytest.mark.parametrize("bundle", BUNDLE_FIXTURES, ids=certfixture_to_id)
+def test_load_stream(bundle):
+    source = io.BytesIO(b"".join([x["cert_pem"] for x in bundle]))
+
+    certs = Cert.load_stream(source)
+    assert next(certs) == Cert(bundle[0]["cert_x509"])
+    assert list(certs) == [Cert(x["cert_x509"]) for x in bundle[1:]]
+
+
+def test_to_dict_is_json_serializable():
+    cert = Cert(make_cert("Root")[0])
+
+    data = json.loads(json.dumps(cert.to_dict(include_pem=True)))
+    assert data["subject"] == data["issuer"] == "CN=Root"
+    assert data["serial"] == str(cert.serial)
+    assert data["is_root"] is True
+    assert data["pem"] == cert.export()
+    assert "pem" not in cert.to_dict()
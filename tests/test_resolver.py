@@ -1,7 +1,27 @@
-from cert_chain_resolver.resolver import resolve
+from cert_chain_resolver.resolver import (
+    resolve,
+    resolve_many,
+    _download,
+    _InflightRequests,
+    _issuer_path,
+)
+from cert_chain_resolver.cache import CacheEntry, MemoryCache
+from cert_chain_resolver.pool import ConnectionPool, Response, default_pool
 from cert_chain_resolver.models import Cert
 from cert_chain_resolver.castore.base_store import CAStore
+from cert_chain_resolver.exceptions import ResolveLimitExceeded
+from cert_chain_resolver import metrics
+from cryptography.hazmat.primitives.serialization import Encoding, pkcs7
+from tests._utils import make_cert
 import pytest
+import socket
+import threading
+import time
+
+try:
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import HTTPError  # type: ignore
 
 
 def test_resolve_works_recursively(monkeypatch, mocker):
@@ -16,7 +36,7 @@ def test_resolve_works_recursively(monkeypatch, mocker):
 
     monkeypatch.setattr(
         "cert_chain_resolver.resolver._download",
-        mocker.Mock(side_effect=["intermediate", "ca"]),
+        mocker.Mock(side_effect=[b"intermediate", b"ca"]),
     )
 
     chain = resolve(b"hoi")
@@ -37,7 +57,7 @@ def test_resolve_with_castore(monkeypatch, mocker, root_ca_store):
 
     monkeypatch.setattr(
         "cert_chain_resolver.resolver._download",
-        mocker.Mock(side_effect=["intermediate"]),
+        mocker.Mock(side_effect=[b"intermediate"]),
     )
     if root_ca_store:
         ca = mocker.Mock()
@@ -59,8 +79,341 @@ def test_resolve_works_avoid_infinite_recursion(monkeypatch, mocker):
 
     monkeypatch.setattr(
         "cert_chain_resolver.resolver._download",
-        mocker.Mock(side_effect=["leaf", "leaf"]),
+        mocker.Mock(side_effect=[b"leaf", b"leaf"]),
     )
 
     chain = resolve(b"hoi")
     assert list(chain) == [leaf]
+
+
+def test_resolve_stops_at_max_depth(monkeypatch, mocker):
+    certs = [mocker.Mock() for _ in range(5)]
+    monkeypatch.setattr(Cert, "load", mocker.Mock(side_effect=certs))
+    download = mocker.Mock(return_value=b"parent")
+    monkeypatch.setattr("cert_chain_resolver.resolver._download", download)
+
+    with pytest.raises(ResolveLimitExceeded) as e:
+        resolve(b"hoi", max_depth=3)
+
+    assert list(e.value.chain) == certs[:3]
+    assert download.call_count == 2
+
+
+def test_resolve_without_max_depth(monkeypatch, mocker):
+    certs = [mocker.Mock() for _ in range(20)]
+    certs[-1].ca_issuer_access_location = None
+    monkeypatch.setattr(Cert, "load", mocker.Mock(side_effect=certs))
+    monkeypatch.setattr(
+        "cert_chain_resolver.resolver._download", mocker.Mock(return_value=b"parent")
+    )
+
+    assert list(resolve(b"hoi", max_depth=None)) == certs
+
+
+def test_resolve_download_timeout_keeps_partial_chain(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    monkeypatch.setattr(Cert, "load", mocker.Mock(return_value=leaf))
+    download = mocker.Mock(side_effect=socket.timeout())
+    monkeypatch.setattr("cert_chain_resolver.resolver._download", download)
+
+    with pytest.raises(ResolveLimitExceeded) as e:
+        resolve(b"hoi", timeout=2)
+
+    assert list(e.value.chain) == [leaf]
+    assert download.call_args[1]["timeout"] == 2
+
+
+def test_resolve_deadline_bounds_download_timeout(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    ca = mocker.Mock()
+    ca.ca_issuer_access_location = None
+    monkeypatch.setattr(Cert, "load", mocker.Mock(side_effect=[leaf, ca]))
+    download = mocker.Mock(return_value=b"ca")
+    monkeypatch.setattr("cert_chain_resolver.resolver._download", download)
+
+    assert list(resolve(b"hoi", timeout=30, deadline=5)) == [leaf, ca]
+    assert 0 < download.call_args[1]["timeout"] <= 5
+
+
+def test_resolve_deadline_exceeded(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    monkeypatch.setattr(Cert, "load", mocker.Mock(return_value=leaf))
+    download = mocker.Mock()
+    monkeypatch.setattr("cert_chain_resolver.resolver._download", download)
+
+    with pytest.raises(ResolveLimitExceeded) as e:
+        resolve(b"hoi", deadline=-1)
+
+    assert list(e.value.chain) == [leaf]
+    assert not download.called
+
+
+def make_pool(mocker, *responses):
+    pool = mocker.Mock(spec=ConnectionPool)
+    pool.request.side_effect = list(responses)
+    return pool
+
+
+def test_download_uses_fresh_cache_entry(mocker):
+    pool = make_pool(mocker)
+    cache = MemoryCache()
+    cache.set("http://ca/issuer.crt", CacheEntry(b"cached"))
+
+    assert _download("http://ca/issuer.crt", cache=cache, pool=pool) == b"cached"
+    assert not pool.request.called
+
+
+def test_download_uses_default_pool(mocker):
+    request = mocker.patch.object(
+        default_pool, "request", return_value=Response(200, {}, b"der")
+    )
+
+    assert _download("http://ca/issuer.crt") == b"der"
+    assert request.call_args == mocker.call(
+        "http://ca/issuer.crt", headers=None, timeout=None
+    )
+
+
+def test_download_stores_response_with_validators(mocker):
+    pool = make_pool(
+        mocker, Response(200, {"etag": '"v1"', "last-modified": "then"}, b"der")
+    )
+    cache = MemoryCache()
+
+    assert _download("http://ca/issuer.crt", cache=cache, pool=pool) == b"der"
+    entry = cache.get("http://ca/issuer.crt")
+    assert (entry.content, entry.etag, entry.last_modified) == (b"der", '"v1"', "then")
+
+
+def test_download_revalidates_stale_entry(mocker):
+    pool = make_pool(mocker, Response(304, {}, b""))
+    cache = MemoryCache(ttl=10)
+    cache.set("http://ca/issuer.crt", CacheEntry(b"der", etag='"v1"', fetched_at=0))
+
+    assert _download("http://ca/issuer.crt", cache=cache, pool=pool) == b"der"
+    assert pool.request.call_args == mocker.call(
+        "http://ca/issuer.crt", headers={"If-None-Match": '"v1"'}, timeout=None
+    )
+    assert cache.is_fresh(cache.get("http://ca/issuer.crt"))
+
+
+@pytest.mark.parametrize("status", [304, 404, 500])
+def test_download_raises_http_errors(mocker, status):
+    pool = make_pool(mocker, Response(status, {}, b""))
+    with pytest.raises(HTTPError):
+        _download("http://ca/issuer.crt", cache=MemoryCache(), pool=pool)
+
+
+def test_resolve_passes_cache_and_pool_to_download(monkeypatch, mocker):
+    leaf = mocker.Mock()
+    ca = mocker.Mock()
+    ca.ca_issuer_access_location = None
+    monkeypatch.setattr(Cert, "load", mocker.Mock(side_effect=[leaf, ca]))
+    download = mocker.Mock(side_effect=[b"ca"])
+    monkeypatch.setattr("cert_chain_resolver.resolver._download", download)
+    cache = MemoryCache()
+    pool = ConnectionPool()
+
+    resolve(b"hoi", cache=cache, pool=pool)
+    assert download.call_args == mocker.call(
+        leaf.ca_issuer_access_location,
+        cache=cache,
+        pool=pool,
+        timeout=None,
+        retry=None,
+        deadline=None,
+    )
+
+
+def test_inflight_requests_coalesces_concurrent_calls():
+    inflight = _InflightRequests()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return b"der"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(inflight.do("url", fetch)))
+    leader.start()
+    started.wait()
+    followers = [
+        threading.Thread(target=lambda: results.append(inflight.do("url", fetch)))
+        for _ in range(3)
+    ]
+    for t in followers:
+        t.start()
+    release.set()
+    for t in [leader] + followers:
+        t.join()
+
+    assert results == [b"der"] * 4
+    assert len(calls) == 1
+    assert inflight._calls == {}
+
+
+def test_inflight_requests_follower_times_out():
+    inflight = _InflightRequests()
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait()
+
+    leader = threading.Thread(target=lambda: inflight.do("url", fetch))
+    leader.start()
+    started.wait()
+    try:
+        with pytest.raises(socket.timeout):
+            inflight.do("url", fetch, timeout=0.01)
+    finally:
+        release.set()
+        leader.join()
+
+
+def test_inflight_requests_shares_exceptions():
+    inflight = _InflightRequests()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        inflight.do("url", fail)
+    assert inflight.do("url", lambda: "retried") == "retried"
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_resolve_many(monkeypatch, mocker, ordered):
+    def fake_resolve(bytes_cert, **kwargs):
+        time.sleep(0.01 * (5 - int(bytes_cert)))
+        return bytes_cert
+
+    monkeypatch.setattr("cert_chain_resolver.resolver.resolve", fake_resolve)
+    certs = [str(i).encode("ascii") for i in range(5)]
+
+    results = list(resolve_many(iter(certs), max_workers=5, ordered=ordered))
+    if ordered:
+        assert results == certs
+    else:
+        assert sorted(results) == certs
+
+
+def test_resolve_many_shares_cache_and_store(monkeypatch, mocker):
+    fake_resolve = mocker.Mock(return_value="chain")
+    monkeypatch.setattr("cert_chain_resolver.resolver.resolve", fake_resolve)
+    store = CAStore()
+
+    assert list(resolve_many([b"a", b"b"], max_workers=2, root_ca_store=store)) == [
+        "chain",
+        "chain",
+    ]
+    caches = {id(c[1]["cache"]) for c in fake_resolve.call_args_list}
+    assert len(caches) == 1
+    assert all(c[1]["root_ca_store"] is store for c in fake_resolve.call_args_list)
+
+
+def test_resolve_many_raises_failures(monkeypatch, mocker):
+    monkeypatch.setattr(
+        "cert_chain_resolver.resolver.resolve", mocker.Mock(side_effect=ValueError)
+    )
+    with pytest.raises(ValueError):
+        list(resolve_many([b"a"]))
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_resolve_many_returns_exceptions(monkeypatch, ordered):
+    def fake_resolve(bytes_cert, **kwargs):
+        if bytes_cert == b"bad":
+            raise ValueError("Not a certificate")
+        return bytes_cert
+
+    monkeypatch.setattr("cert_chain_resolver.resolver.resolve", fake_resolve)
+    certs = [b"0", b"1", b"bad", b"3", b"4"]
+
+    results = list(
+        resolve_many(certs, max_workers=2, ordered=ordered, return_exceptions=True)
+    )
+
+    errors = [r for r in results if isinstance(r, ValueError)]
+    assert len(errors) == 1
+    assert sorted(r for r in results if r not in errors) == [b"0", b"1", b"3", b"4"]
+    if ordered:
+        assert results.index(errors[0]) == 2
+
+
+def test_resolve_many_close_cancels_queued_certificates(monkeypatch):
+    calls = []
+
+    def fake_resolve(bytes_cert, **kwargs):
+        calls.append(bytes_cert)
+        time.sleep(0.01)
+        return bytes_cert
+
+    monkeypatch.setattr("cert_chain_resolver.resolver.resolve", fake_resolve)
+    results = resolve_many((str(i).encode("ascii") for i in range(100)), max_workers=1)
+
+    assert next(results) == b"0"
+    results.close()
+    # Only the window of queued certificates was submitted, and the queued ones are cancelled
+    assert len(calls) < 4
+
+
+@pytest.fixture
+def pkcs7_hierarchy():
+    root = make_cert("Root")
+    upper = make_cert("Upper", issuer=root, aia="http://ca/root.crt")
+    lower = make_cert("Lower", issuer=upper, aia="http://ca/upper.crt")
+    leaf = make_cert("Leaf", issuer=lower, is_ca=False, aia="http://ca/path.p7c")
+    return [Cert(c[0]) for c in (leaf, lower, upper, root)]
+
+
+def test_resolve_uses_every_certificate_of_a_pkcs7(
+    monkeypatch, mocker, pkcs7_hierarchy
+):
+    leaf, lower, upper, root = pkcs7_hierarchy
+    unrelated = Cert(make_cert("Unrelated")[0])
+    # Served in any order, next to certificates that are not part of the path
+    bundle = pkcs7.serialize_certificates(
+        [c._x509 for c in (root, unrelated, upper, lower)], Encoding.DER
+    )
+    download = mocker.Mock(return_value=bundle)
+    monkeypatch.setattr("cert_chain_resolver.resolver._download", download)
+    stats = metrics.StatsCollector()
+    metrics.set_observer(stats)
+    try:
+        chain = resolve(leaf.export().encode("ascii"))
+    finally:
+        metrics.set_observer(None)
+
+    assert list(chain) == [leaf, lower, upper, root]
+    assert download.call_count == 1
+    assert stats.counters["download.bundled_hops"] == 2
+
+
+def test_resolve_pkcs7_bundled_hops_count_towards_max_depth(
+    monkeypatch, mocker, pkcs7_hierarchy
+):
+    leaf, lower, upper, root = pkcs7_hierarchy
+    bundle = pkcs7.serialize_certificates(
+        [c._x509 for c in (lower, upper, root)], Encoding.DER
+    )
+    monkeypatch.setattr(
+        "cert_chain_resolver.resolver._download", mocker.Mock(return_value=bundle)
+    )
+
+    with pytest.raises(ResolveLimitExceeded) as e:
+        resolve(leaf.export().encode("ascii"), max_depth=2)
+
+    assert list(e.value.chain) == [leaf, lower]
+
+
+def test_issuer_path_falls_back_to_first_certificate(pkcs7_hierarchy):
+    leaf, lower, upper, root = pkcs7_hierarchy
+
+    assert _issuer_path(leaf, [lower, upper, root]) == [lower, upper, root]
+    assert _issuer_path(leaf, [root, upper, lower]) == [lower, upper, root]
+    assert _issuer_path(leaf, [upper, root]) == [upper]
+    assert _issuer_path(leaf, [root]) == [root]
@@ -0,0 +1,150 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from cert_chain_resolver.exceptions import DownloadUnavailable
+from cert_chain_resolver.pool import ConnectionPool, Response
+from cert_chain_resolver.resolver import _download
+from cert_chain_resolver.retry import RetryPolicy
+
+try:
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import HTTPError  # type: ignore
+
+
+URL = "http://ca.example/issuer.crt"
+
+
+@pytest.fixture
+def sleep(mocker):
+    return mocker.patch("cert_chain_resolver.retry.time.sleep")
+
+
+def http_error(status):
+    return HTTPError(URL, status, "Download failed", None, None)
+
+
+def test_retries_with_exponential_backoff(mocker, sleep):
+    fn = mocker.Mock(side_effect=[socket.error(), http_error(503), b"der"])
+    policy = RetryPolicy(attempts=3, backoff=1, jitter=0)
+
+    assert policy.call(URL, fn, timeout=5) == b"der"
+    assert fn.call_args_list == [mocker.call(5)] * 3
+    assert sleep.call_args_list == [mocker.call(1), mocker.call(2)]
+
+
+def test_backoff_is_capped_and_jittered(mocker):
+    mocker.patch("cert_chain_resolver.retry.random.random", return_value=1.0)
+    policy = RetryPolicy(backoff=1, max_backoff=4, jitter=0.5)
+
+    assert [policy._wait(attempt) for attempt in range(4)] == [0.5, 1, 2, 2]
+
+
+def test_does_not_retry_client_errors(mocker, sleep):
+    fn = mocker.Mock(side_effect=http_error(404))
+    policy = RetryPolicy()
+
+    with pytest.raises(HTTPError):
+        policy.call(URL, fn)
+    assert fn.call_count == 1
+    assert not sleep.called
+
+
+def test_failed_url_fails_fast_until_ttl(mocker, sleep):
+    now = mocker.patch("cert_chain_resolver.retry.time.time", return_value=1000.0)
+    fn = mocker.Mock(side_effect=http_error(404))
+    policy = RetryPolicy(negative_ttl=60)
+
+    with pytest.raises(HTTPError):
+        policy.call(URL, fn)
+    with pytest.raises(DownloadUnavailable) as e:
+        policy.call(URL, fn)
+    assert e.value.url == URL
+    assert fn.call_count == 1
+
+    now.return_value = 1061.0
+    fn.side_effect = None
+    fn.return_value = b"der"
+    assert policy.call(URL, fn) == b"der"
+
+
+def test_circuit_opens_per_host(mocker, sleep):
+    now = mocker.patch("cert_chain_resolver.retry.time.time", return_value=1000.0)
+    fn = mocker.Mock(side_effect=socket.timeout())
+    policy = RetryPolicy(
+        attempts=1, negative_ttl=0, failure_threshold=2, reset_timeout=30
+    )
+
+    for _ in range(2):
+        with pytest.raises(socket.timeout):
+            policy.call(URL, fn)
+    with pytest.raises(DownloadUnavailable):
+        policy.call("http://ca.example/other.crt", fn)
+    assert fn.call_count == 2
+    assert policy.call("http://other.example/issuer.crt", lambda t: b"der") == b"der"
+
+    # Half open after the reset timeout, a success closes it
+    now.return_value = 1031.0
+    assert policy.call(URL, lambda t: b"der") == b"der"
+    assert policy.call(URL, lambda t: b"der") == b"der"
+
+
+def test_deadline_stops_retrying(mocker, sleep):
+    mocker.patch("cert_chain_resolver.retry.time.time", return_value=1000.0)
+    fn = mocker.Mock(side_effect=socket.error())
+    policy = RetryPolicy(attempts=5, backoff=2, jitter=0)
+
+    with pytest.raises(socket.error):
+        policy.call(URL, fn, timeout=30, deadline=1001.0)
+    assert fn.call_args_list == [mocker.call(1.0)]
+    assert not sleep.called
+
+
+def test_download_retries_through_pool(mocker, sleep):
+    pool = mocker.Mock(spec=ConnectionPool)
+    pool.request.side_effect = [Response(500, {}, b""), Response(200, {}, b"der")]
+
+    assert _download(URL, pool=pool, retry=RetryPolicy()) == b"der"
+    assert pool.request.call_count == 2
+
+
+def test_coalesced_downloads_record_one_failure(mocker):
+    started, release = threading.Event(), threading.Event()
+    pool = mocker.Mock(spec=ConnectionPool)
+
+    def request(url, headers=None, timeout=None):
+        started.set()
+        release.wait()
+        raise socket.error("Connection refused")
+
+    pool.request.side_effect = request
+    policy = RetryPolicy(attempts=1, negative_ttl=0, failure_threshold=2)
+    errors = []
+
+    def download():
+        try:
+            _download(URL, pool=pool, retry=policy)
+        except socket.error as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=download)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=download) for _ in range(7)]
+    for t in followers:
+        t.start()
+    # Let the followers join the download in flight
+    time.sleep(0.05)
+    release.set()
+    for t in [leader] + followers:
+        t.join()
+
+    assert len(errors) == 8
+    assert pool.request.call_count == 1
+    assert policy._hosts["ca.example"][0] == 1
+    # One failed request does not open the circuit of the host
+    pool.request.side_effect = [Response(200, {}, b"der")]
+    assert _download("http://ca.example/other.crt", pool=pool, retry=policy) == b"der"
@@ -0,0 +1,244 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from cert_chain_resolver.castore.file_system import FileSystemStore
+from cert_chain_resolver.models import Cert, CertificateChain
+from cert_chain_resolver.server import MAX_BODY_SIZE, create_server
+from cryptography.hazmat.primitives.serialization import Encoding, pkcs7
+from cryptography.x509 import load_pem_x509_certificate
+from tests._utils import make_cert
+
+try:
+    from http.client import HTTPConnection
+except ImportError:  # pragma: no cover
+    from httplib import HTTPConnection  # type: ignore
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path):
+        HTTPConnection.__init__(self, "localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+@pytest.fixture
+def certs(tmpdir):
+    root = make_cert("Root")
+    leaf = Cert(make_cert("Leaf", issuer=root, is_ca=False)[0])
+    bundle = tmpdir.join("roots.pem")
+    bundle.write(Cert(root[0]).export())
+    return leaf, Cert(root[0]), FileSystemStore(str(bundle))
+
+
+def start(server):
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def server(certs):
+    server = create_server(port=0, root_ca_store=certs[2], quiet=True)
+    thread = start(server)
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def request(server, method, path, body=None):
+    conn = HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    try:
+        conn.request(method, path, body=body)
+        response = conn.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read()
+    finally:
+        conn.close()
+
+
+def test_health(server):
+    assert request(server, "GET", "/health") == (
+        200,
+        "application/json",
+        b'{"status": "ok"}',
+    )
+
+
+def test_resolve_returns_pem_bundle(server, certs):
+    leaf, root, _ = certs
+    body = leaf.export().encode("ascii")
+
+    status, content_type, content = request(server, "POST", "/resolve", body)
+    assert (status, content_type) == (200, "application/x-pem-file")
+    assert content.decode("ascii") == leaf.export()
+
+    status, _, content = request(server, "POST", "/resolve?include_root=1", body)
+    assert content.decode("ascii") == leaf.export() + root.export()
+
+
+def test_resolve_returns_json_record(server, certs):
+    leaf, root, _ = certs
+
+    status, content_type, content = request(
+        server, "POST", "/resolve?format=json&include_root=1", leaf.export()
+    )
+    assert (status, content_type) == (200, "application/json")
+    record = json.loads(content.decode("utf-8"))
+    assert record["root_found"] is True
+    assert [c["fingerprint"] for c in record["chain"]] == [
+        leaf.fingerprint,
+        root.fingerprint,
+    ]
+
+
+def test_inspect(server, certs):
+    leaf, root, _ = certs
+
+    status, _, content = request(
+        server, "POST", "/inspect?include_pem=1", leaf.export() + root.export()
+    )
+    assert status == 200
+    assert json.loads(content.decode("utf-8")) == [
+        leaf.to_dict(include_pem=True),
+        root.to_dict(include_pem=True),
+    ]
+
+
+def test_inspect_der_pkcs7(server, certs):
+    leaf, root, _ = certs
+    body = pkcs7.serialize_certificates(
+        [load_pem_x509_certificate(c.export().encode("ascii")) for c in (leaf, root)],
+        Encoding.DER,
+    )
+
+    status, _, content = request(server, "POST", "/inspect", body)
+    assert status == 200
+    # The certificates of a PKCS7 are a SET, serializing does not keep the order
+    fingerprints = sorted(c["fingerprint"] for c in json.loads(content.decode("utf-8")))
+    assert fingerprints == sorted([leaf.fingerprint, root.fingerprint])
+
+
+@pytest.mark.parametrize(
+    "method, path, body, expected_status",
+    [
+        ("GET", "/nope", None, 404),
+        ("POST", "/nope", b"", 404),
+        ("POST", "/resolve", b"not a certificate", 400),
+        ("POST", "/inspect", b"\x30\x03\x02\x01\x00", 400),
+    ],
+)
+def test_errors(server, method, path, body, expected_status):
+    status, content_type, content = request(server, method, path, body)
+
+    assert status == expected_status
+    assert content_type == "application/json"
+    assert "error" in json.loads(content.decode("utf-8"))
+
+
+def test_too_large_body_is_refused_before_reading_it(server):
+    conn = HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    conn.request(
+        "POST",
+        "/resolve",
+        body=b"x",
+        headers={"Content-Length": str(MAX_BODY_SIZE + 1)},
+    )
+    response = conn.getresponse()
+    assert response.status == 413
+    conn.close()
+
+
+@pytest.mark.parametrize("length", ["-1", "abc"])
+def test_invalid_content_length(server, length):
+    conn = HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    conn.putrequest("POST", "/resolve")
+    conn.putheader("Content-Length", length)
+    conn.endheaders()
+    response = conn.getresponse()
+
+    assert response.status == 400
+    assert "Content-Length" in json.loads(response.read().decode("utf-8"))["error"]
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "max_depth=abc",
+        "max_depth=0",
+        "max_depth=1.5",
+        "deadline=nan",
+        "deadline=inf",
+        "deadline=-1",
+    ],
+)
+def test_invalid_resolve_limits(server, certs, query):
+    status, _, content = request(
+        server, "POST", "/resolve?" + query, certs[0].export().encode("ascii")
+    )
+
+    assert status == 400
+    assert "must be a positive number" in json.loads(content.decode("utf-8"))["error"]
+
+
+def test_unix_socket(tmpdir, certs):
+    path = str(tmpdir.join("resolver.sock"))
+    server = create_server(unix_socket=path, root_ca_store=certs[2], quiet=True)
+    thread = start(server)
+    try:
+        conn = UnixHTTPConnection(path)
+        conn.request("POST", "/resolve", body=certs[0].export())
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.read().decode("ascii") == certs[0].export()
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    assert not tmpdir.join("resolver.sock").exists()
+
+
+def test_resolve_limits_respond_with_gateway_timeout(server):
+    root = make_cert("Root")
+    leaf = Cert(
+        make_cert("Leaf", issuer=root, is_ca=False, aia="http://127.0.0.1:1/ca.der")[0]
+    )
+
+    status, _, content = request(
+        server, "POST", "/resolve?max_depth=1", leaf.export().encode("ascii")
+    )
+
+    assert status == 504
+    assert "longer than 1" in json.loads(content.decode("utf-8"))["error"]
+
+
+def test_resolve_limits_are_capped_by_the_server(certs, mocker):
+    chain = CertificateChain()
+    chain += certs[0]
+    resolve = mocker.patch("cert_chain_resolver.server.resolve", return_value=chain)
+    server = create_server(
+        port=0, root_ca_store=certs[2], quiet=True, max_depth=3, deadline=5
+    )
+    thread = start(server)
+    try:
+        for query in ("", "?max_depth=100000&deadline=1e9", "?max_depth=2&deadline=1"):
+            assert request(server, "POST", "/resolve" + query, b"cert")[0] == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    assert [(c[1]["max_depth"], c[1]["deadline"]) for c in resolve.call_args_list] == [
+        (3, 5),
+        (3, 5),
+        (2, 1),
+    ]